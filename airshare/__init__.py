@@ -1,4 +1,4 @@
-from . import exception, receiver, sender, utils
+from . import daemon, exception, receiver, sender, utils
 
 
-__all__ = ["exception", "receiver", "sender", "utils"]
+__all__ = ["daemon", "exception", "receiver", "sender", "utils"]
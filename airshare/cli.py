@@ -9,10 +9,11 @@ import pyperclip
 from .utils import is_file_copyable, get_clipboard_paths
 from .sender import send, send_server
 from .receiver import receive, receive_server
+from .daemon import daemon_server
 
 
 @click.command(name="airshare")
-@click.argument("code", nargs=1)
+@click.argument("code", nargs=1, required=False)
 @click.option("-p", "--port", type=int, default=8000, help="""
 Specify the port number to host a sending or receiving server (default 8000).
 """)
@@ -31,16 +32,32 @@ Receive served content and also copy into clipboard (if possible).
 @click.option("-fp", "--file-path", is_flag=True, help="""
 Send files whose paths have been copied to the clipoard.
 """)
+@click.option("-d", "--daemon", is_flag=True, help="""
+Run a daemon hosting many shares on one port, added and removed through its
+control API (no CODE needed).
+""")
+@click.option("-cp", "--control-port", type=int, default=8001, help="""
+Specify the port number of the control API of the daemon (default 8001).
+""")
 @click.argument("files", nargs=-1)
 @click.help_option()
 @click.version_option(version=None, prog_name="Airshare")
-def main(code, port, text, upload, clip_send, clip_receive, file_path, files):
+def main(code, port, text, upload, clip_send, clip_receive, file_path, daemon,
+         control_port, files):
     r"""Airshare - an easy way to share content in a local network.
 
     CODE - An identifying code for Airshare.
 
     FILES - File(s) or directories to send.
     """
+    if daemon:
+        try:
+            daemon_server(port=port, control_port=control_port)
+        except KeyboardInterrupt:
+            exit(0)
+        return
+    if code is None:
+        raise click.UsageError("Missing argument 'CODE'.")
     files = get_clipboard_paths() if file_path else files
     if text:
         try:
@@ -0,0 +1,423 @@
+"""Module for hosting many Airshare services in one daemon."""
+
+
+from aiohttp import web
+import asyncio
+from functools import partial
+import hmac
+from multiprocessing import Process
+import os
+import platform
+import requests
+import secrets
+import socket
+import sys
+import tempfile
+from urllib.parse import quote
+from yarl import URL
+from zeroconf import NonUniqueNameException
+
+
+from .exception import CodeExistsError, CodeNotFoundError
+from .receiver import _get_receive_app
+from .sender import _get_send_app
+from .utils import _get_cache_directory, get_local_ip_addresses, \
+    register_service, unregister_service
+
+
+__all__ = ["daemon_server", "daemon_server_proc", "add_share",
+           "remove_share", "get_shares"]
+
+
+# Share Management
+
+
+async def _add_share(app, code, share_type, options):
+    r"""Builds a share and registers it as a Multicast-DNS service.
+
+    Parameters
+    ----------
+    app : aiohttp.web.Application
+        Application of the daemon.
+    code : str
+        Identifying code for the share.
+    share_type : str
+        'send' to serve a file or text, as `sender.send_server` does, or
+        'receive' to receive uploaded files, as `receiver.receive_server`
+        does.
+    options : dict
+        Keyword arguments of `sender.send_server` or
+        `receiver.receive_server`, other than `code` and `port`.
+
+    Returns
+    -------
+    share : dict
+        Description of the share.
+
+    Raises
+    ------
+    CodeExistsError
+        If the code is taken, by this daemon or in the local network.
+    """
+    loop = asyncio.get_event_loop()
+    if code in app["shares"] or code in app["pending"]:
+        raise CodeExistsError(code)
+    app["pending"].add(code)
+    try:
+        if share_type == "send":
+            share_app, content, file_size = await loop.run_in_executor(
+                None, partial(_get_send_app, **options))
+        elif share_type == "receive":
+            share_app = _get_receive_app(**options)
+            content, file_size = "uploaded files", ""
+        else:
+            raise ValueError("Unknown type of share: " + str(share_type))
+        # Every share has a runner of its own, without sites, which starts
+        # and cleans up its application, and whose server handles the
+        # requests routed to it.
+        runner = web.AppRunner(share_app)
+        await runner.setup()
+        path = "/" + quote(code, safe="")
+        try:
+            info = await loop.run_in_executor(
+                None, register_service, code, app["addresses"], app["port"],
+                path)
+        except NonUniqueNameException:
+            await _close_share(runner)
+            raise CodeExistsError(code)
+    finally:
+        app["pending"].discard(code)
+    share = {"code": code, "type": share_type, "content": content,
+             "path": path}
+    app["shares"][code] = dict(share, runner=runner, info=info)
+    print("`" + content + "`" + file_size + " available at "
+          + app["url"] + path + "/ and `http://" + code + ".local"
+          + app["url_port"] + path + "/`")
+    return share
+
+
+async def _close_share(runner):
+    r"""Cleans up the runner of a share, shuts down the executors of its
+    application, if any, and releases the cached archive it serves."""
+    await runner.cleanup()
+    share_app = runner.app
+    for writer in share_app.get("writers", ()):
+        writer.shutdown(wait=False)
+    if share_app.get("archive") is not None:
+        share_app["manifest_cache"].release(share_app["archive"])
+
+
+async def _remove_share(app, code):
+    r"""Unregisters a share and stops routing requests to it.
+
+    Requests to the share already being handled are completed.
+
+    Parameters
+    ----------
+    app : aiohttp.web.Application
+        Application of the daemon.
+    code : str
+        Identifying code for the share.
+
+    Raises
+    ------
+    CodeNotFoundError
+        If the daemon has no share with the code.
+    """
+    share = app["shares"].pop(code, None)
+    if share is None:
+        raise CodeNotFoundError(code)
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, unregister_service, share["info"])
+    await _close_share(share["runner"])
+    print("`" + share["content"] + "` (" + code + ") is no longer shared!")
+
+
+def _get_token_path(control_port):
+    r"""Returns the path of the file holding the token of the control API
+    of a daemon."""
+    return os.path.join(_get_cache_directory("daemon"),
+                        "control-" + str(control_port) + ".token")
+
+
+def _write_token(control_port, token):
+    r"""Writes the token of the control API of a daemon to a file that only
+    the user can read."""
+    token_path = _get_token_path(control_port)
+    os.makedirs(os.path.dirname(token_path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".",
+                                     dir=os.path.dirname(token_path))
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    os.replace(temp_path, token_path)
+
+
+def _get_control_headers(control_port):
+    r"""Returns the headers of requests to the control API of a daemon, with
+    the token it wrote."""
+    with open(_get_token_path(control_port), "r") as f:
+        return {"airshare-token": f.read().strip()}
+
+
+# Request handlers
+
+
+@web.middleware
+async def _token_checker(request, handler):
+    """Turns away requests to the control API without the daemon's token."""
+    token = request.headers.get("airshare-token", "")
+    if not hmac.compare_digest(token.encode(),
+                               request.app["token"].encode()):
+        raise web.HTTPUnauthorized(text="Invalid control token!")
+    return await handler(request)
+
+
+async def _no_expect_handler(request):
+    """Leaves `Expect` headers to the share that the request is routed to."""
+    return None
+
+
+async def _share_router(request):
+    r"""Routes a request to the share of its code, handler for route
+    '/{code}/{path}'.
+
+    The request is handled by the share's application, with the code removed
+    from its path.
+    """
+    share = request.app["shares"].get(request.match_info["code"])
+    if share is None:
+        raise web.HTTPNotFound(text="Unknown code!")
+    _, _, path = request.raw_path[1:].partition("/")
+    share_request = request.clone(rel_url=URL("/" + path, encoded=True))
+    # Applications cannot be added to a running one, so the request is
+    # handed to the server of the share's runner, as a site of it would.
+    return await share["runner"].server.request_handler(share_request)
+
+
+async def _share_redirect(request):
+    """Redirects to the page of a share, GET handler for route '/{code}'."""
+    raise web.HTTPFound(request.path + "/")
+
+
+async def _share_lister(request):
+    """Lists the shares as JSON, GET handler for control route '/shares'."""
+    shares = request.app["daemon"]["shares"].values()
+    shares = [{key: share[key] for key in ("code", "type", "content", "path")}
+              for share in shares]
+    return web.json_response({"shares": shares})
+
+
+async def _share_adder(request):
+    r"""Adds a share, PUT handler for control route '/shares/{code}'.
+
+    The request body is a JSON object with the `type` of the share, 'send'
+    (default) or 'receive', and the keyword arguments of
+    `sender.send_server` or `receiver.receive_server`.
+    """
+    code = request.match_info["code"]
+    try:
+        options = await request.json() if request.can_read_body else {}
+        share_type = options.pop("type", "send")
+        share = await _add_share(request.app["daemon"], code, share_type,
+                                 options)
+    except CodeExistsError as e:
+        raise web.HTTPConflict(text=str(e))
+    except (AttributeError, TypeError, ValueError, OSError) as e:
+        raise web.HTTPBadRequest(text=str(e))
+    return web.json_response(share, status=201)
+
+
+async def _share_remover(request):
+    """Removes a share, DELETE handler for control route '/shares/{code}'."""
+    try:
+        await _remove_share(request.app["daemon"], request.match_info["code"])
+    except CodeNotFoundError as e:
+        raise web.HTTPNotFound(text=str(e))
+    return web.Response(status=204)
+
+
+# Daemon
+
+
+def daemon_server(*, port=8000, control_port=8001):
+    r"""Serves many shares, each with its own code, in one process and port.
+
+    Shares of files, text and upload receivers are added and removed at
+    runtime through the control API, served at `127.0.0.1:control_port`
+    (see `add_share`, `remove_share` and `get_shares`). Requests to the
+    control API carry a token in their 'airshare-token' header, which the
+    daemon writes to a file that only the user can read, in the
+    'airshare/daemon' cache directory ('$XDG_CACHE_HOME' or '~/.cache',
+    '%LOCALAPPDATA%' on Windows). Every share is
+    registered as a Multicast-DNS service with the path of the share on the
+    server, '/{code}', which receivers and senders follow, and is otherwise
+    served as `sender.send_server` and `receiver.receive_server` serve it.
+
+    Parameters
+    ----------
+    port : int, default=8000
+        Port number at which the shares are hosted on the device.
+    control_port : int, default=8001
+        Port number at which the control API is hosted, on the loopback
+        interface only.
+    """
+    addresses = get_local_ip_addresses()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["shares"] = {}
+    app["pending"] = set()
+    app["addresses"] = addresses
+    app["port"] = port
+    app["url_port"] = ""
+    if port != 80:
+        app["url_port"] = ":" + str(port)
+    app["url"] = socket.inet_ntoa(addresses[0]) + app["url_port"]
+    app.router.add_get(path="/{code}", handler=_share_redirect)
+    app.router.add_route("*", path="/{code}/{path:.*}", handler=_share_router,
+                         expect_handler=_no_expect_handler)
+    control = web.Application(middlewares=[_token_checker])
+    control["daemon"] = app
+    control["token"] = secrets.token_urlsafe(32)
+    control.router.add_get(path="/shares", handler=_share_lister)
+    control.router.add_put(path="/shares/{code}", handler=_share_adder)
+    control.router.add_delete(path="/shares/{code}", handler=_share_remover)
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, port=port)
+    loop.run_until_complete(site.start())
+    control_runner = web.AppRunner(control)
+    loop.run_until_complete(control_runner.setup())
+    control_site = web.TCPSite(control_runner, "127.0.0.1", control_port)
+    loop.run_until_complete(control_site.start())
+    _write_token(control_port, control["token"])
+    quit_msg = ", press Ctrl+C to stop..."
+    if platform.system() == "Windows" and sys.version_info < (3, 8):
+        quit_msg = ", press Ctrl+Break to stop..."
+    print("Airshare daemon running at " + app["url"] + ", control API at "
+          + "http://127.0.0.1:" + str(control_port) + quit_msg)
+    try:
+        loop.run_forever()
+    finally:
+        for code in list(app["shares"]):
+            loop.run_until_complete(_remove_share(app, code))
+        try:
+            os.remove(_get_token_path(control_port))
+        except FileNotFoundError:
+            pass
+
+
+def daemon_server_proc(*, port=8000, control_port=8001):
+    r"""Creates a process with 'daemon_server' as the target.
+
+    Parameters
+    ----------
+    port : int, default=8000
+        Port number at which the shares are hosted on the device.
+    control_port : int, default=8001
+        Port number at which the control API is hosted, on the loopback
+        interface only.
+
+    Returns
+    -------
+    process: multiprocessing.Process
+        A multiprocessing.Process object with 'daemon_server' as target.
+    """
+    kwargs = {"port": port, "control_port": control_port}
+    process = Process(target=daemon_server, kwargs=kwargs)
+    return process
+
+
+# Control API
+
+
+def add_share(*, code, receive=False, control_port=8001, **options):
+    r"""Adds a share to a running daemon.
+
+    Parameters
+    ----------
+    code : str
+        Identifying code for the share.
+    receive : boolean, default=False
+        Flag to receive uploaded files, instead of serving a file or text.
+    control_port : int, default=8001
+        Port number of the daemon's control API.
+    **options
+        Keyword arguments of `sender.send_server` (e.g. `file`, `text` or
+        `compress`), or of `receiver.receive_server` with `receive`, other
+        than `code` and `port`. Relative paths of files, and the `directory`
+        a receiving share writes uploaded files in, are resolved from the
+        current directory; receiving shares otherwise write in the
+        daemon's.
+
+    Returns
+    -------
+    share : dict
+        The `code`, `type`, `content` and `path` of the share.
+
+    Raises
+    ------
+    CodeExistsError
+        If the code is taken, by the daemon or in the local network.
+    ValueError
+        If the options are invalid.
+    """
+    file = options.get("file")
+    if isinstance(file, str) and file:
+        options["file"] = os.path.abspath(file)
+    elif file:
+        options["file"] = [os.path.abspath(x) for x in file]
+    if options.get("directory"):
+        options["directory"] = os.path.abspath(options["directory"])
+    options["type"] = "receive" if receive else "send"
+    r = requests.put("http://127.0.0.1:" + str(control_port) + "/shares/"
+                     + quote(code, safe=""), json=options,
+                     headers=_get_control_headers(control_port))
+    if r.status_code == 409:
+        raise CodeExistsError(code)
+    if r.status_code == 400:
+        raise ValueError(r.text)
+    r.raise_for_status()
+    return r.json()
+
+
+def remove_share(*, code, control_port=8001):
+    r"""Removes a share from a running daemon.
+
+    Parameters
+    ----------
+    code : str
+        Identifying code for the share.
+    control_port : int, default=8001
+        Port number of the daemon's control API.
+
+    Raises
+    ------
+    CodeNotFoundError
+        If the daemon has no share with the code.
+    """
+    r = requests.delete("http://127.0.0.1:" + str(control_port) + "/shares/"
+                        + quote(code, safe=""),
+                        headers=_get_control_headers(control_port))
+    if r.status_code == 404:
+        raise CodeNotFoundError(code)
+    r.raise_for_status()
+
+
+def get_shares(*, control_port=8001):
+    r"""Lists the shares of a running daemon.
+
+    Parameters
+    ----------
+    control_port : int, default=8001
+        Port number of the daemon's control API.
+
+    Returns
+    -------
+    shares : list
+        The `code`, `type`, `content` and `path` of every share.
+    """
+    r = requests.get("http://127.0.0.1:" + str(control_port) + "/shares",
+                     headers=_get_control_headers(control_port))
+    r.raise_for_status()
+    return r.json()["shares"]
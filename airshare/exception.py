@@ -1,8 +1,8 @@
 """Exceptions defined for Airshare."""
 
 
-__all__ = ["CodeExistsError", "CodeNotFoundError", "IsNotReceiverError",
-           "IsNotSenderError"]
+__all__ = ["CodeExistsError", "CodeNotFoundError", "IntegrityError",
+           "IsNotReceiverError", "IsNotSenderError"]
 
 
 class AirshareError(Exception):
@@ -37,6 +37,20 @@ class CodeNotFoundError(AirshareError):
                + "` was not found!"
 
 
+class IntegrityError(AirshareError):
+    r"""Exception to be raised when received content fails verification.
+
+    To be raised when the hash of the content received from an Airshare does
+    not match the hash of the content it sent.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def __str__(self):
+        return "IntegrityError: The content received at `" + self.path \
+               + "` does not match the content sent!"
+
+
 class IsNotReceiverError(AirshareError):
     r"""Exception to be raised when trying to upload to a non-receiver.
 
@@ -3,7 +3,12 @@
 
 from aiohttp import web
 import asyncio
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
 import humanize
+from itertools import cycle
+import json
 from multiprocessing import Process
 import os
 import pkgutil
@@ -11,19 +16,70 @@ import platform
 import requests
 import socket
 import sys
-from time import sleep, strftime
+import tarfile
+import threading
+from time import monotonic, strftime
 from tqdm import tqdm
-from zipfile import is_zipfile
+from urllib.parse import quote
+from zipfile import BadZipFile, is_zipfile
 
 
-from .exception import CodeExistsError, CodeNotFoundError, IsNotSenderError
-from .utils import get_local_ip_address, get_service_info, qr_code, \
-    register_service, unzip_file
+from .exception import CodeExistsError, CodeNotFoundError, IntegrityError, \
+    IsNotSenderError
+from .utils import get_chunk_cache, get_chunk_index, get_codecs, \
+    get_decoder, get_hash_algorithms, get_hasher, get_local_ip_addresses, \
+    get_service_info, get_service_url, get_sync_writer, \
+    get_untar_writer, get_unzip_writer, parse_compress_header, qr_code, \
+    register_service, unregister_service, unzip_file
 
 
 __all__ = ["receive", "receive_server", "receive_server_proc"]
 
 
+_ARCHIVE_WRITERS = {"zip": get_unzip_writer, "tar": get_untar_writer,
+                    "sync": get_sync_writer}
+
+
+def _get_archive_writer(archive, file_path, cache=None, replace=False):
+    r"""Creates a file-like object extracting an archive as it is written.
+
+    Parameters
+    ----------
+    archive : str
+        Format of the archive, 'zip', 'tar' or 'sync'.
+    file_path : str
+        Path the archive would have been written to.
+    cache : object or None
+        Chunk cache of sync streams, see `utils.get_chunk_cache`.
+    replace : boolean, default=False
+        Flag to replace the directory a sync stream is synced with, instead
+        of syncing into a new directory.
+
+    Returns
+    -------
+    writer : file-like
+        Unseekable file-like object to write the archive into.
+    path : str
+        Canonical path of the directory the archive is extracted into.
+    """
+    if archive == "sync":
+        return get_sync_writer(file_path, cache, replace)
+    return _ARCHIVE_WRITERS[archive](file_path)
+
+
+def _get_archive_formats(app):
+    r"""Lists the archive formats of the uploads an application accepts."""
+    return [x for x in _ARCHIVE_WRITERS if x != "sync" or app["sync"]]
+
+
+def _get_cache_stats(cache):
+    r"""Describes the hits, misses and size of a chunk cache."""
+    stats = cache.stats()
+    return "Chunk cache: {} hits, {} misses ({:.0%} hit ratio), {} cached" \
+           .format(stats["hits"], stats["misses"], stats["hit_ratio"],
+                   humanize.naturalsize(stats["size"]))
+
+
 # Request handlers
 
 
@@ -33,119 +89,1347 @@ async def _upload_page(request):
     return web.Response(text=upload, content_type="text/html")
 
 
-async def _uploaded_file_receiver(request):
-    """Receives an uploaded file. POST handler for '/upload'."""
-    progress_queue = request.app["progress_queue"]
-    tqdm_position = await progress_queue.get()
-    decompress = request.app["decompress"]
-    compress_header = request.headers.get("airshare-compress") or "false"
-    if compress_header == "true":
-        decompress = True
-    total = 0
-    reader = await request.multipart()
-    field = await reader.next()
-    file_name = field.filename.replace("'", "")
-    file_path = os.getcwd() + os.path.sep + file_name
-    if os.path.isfile(file_path):
-        file_name, file_ext = os.path.splitext(file_name)
-        file_name = file_name + "-" + strftime("%Y%m%d%H%M%S") + file_ext
-        file_path = os.getcwd() + os.path.sep + file_name
-    desc = "Downloading `" + file_name + "`"
-    bar = tqdm(desc=desc, total=None, unit="B", unit_scale=1,
-               position=tqdm_position, leave=False)
-    with open(file_path, "wb") as f:
-        while True:
-            chunk = await field.read_chunk()
-            if not chunk:
-                break
-            total += len(chunk)
-            f.write(chunk)
-            bar.update(len(chunk))
-    await progress_queue.put(tqdm_position)
-    if is_zipfile(file_path) and decompress:
-        zip_dir = unzip_file(file_path)
+class _FileWriter:
+    r"""Writes an uploaded file behind the event loop, in a writer thread.
+
+    Chunks are decoded and written by a single-threaded executor, so that
+    they are written in order, and coalesced into writes of `chunk_size`
+    bytes. Up to `depth` writes are queued behind the upload, after which
+    writing waits for the oldest one, so that a slow disk holds the upload
+    back instead of filling up memory.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.ThreadPoolExecutor
+        Single-threaded executor to write the file in.
+    file_path : str
+        Path of the file to write.
+    decode : function
+        Decoder of the codec the file is encoded with.
+    archive : str or boolean, default=False
+        Format of the archive ('zip', 'tar' or 'sync') the file is, to
+        extract into a directory as it is written instead of writing the
+        archive itself.
+    cache : object or None
+        Chunk cache of sync streams, see `utils.get_chunk_cache`.
+    replace : boolean, default=False
+        Flag to replace the directory a sync stream is synced with.
+    hasher : object or None
+        Hasher fed with the decoded file as it is written.
+    chunk_size : int, default=1048576
+        Size in bytes of the writes to coalesce chunks into.
+    depth : int, default=4
+        Maximum number of queued writes.
+    """
+
+    def __init__(self, executor, file_path, decode, archive=False, cache=None,
+                 replace=False, hasher=None, chunk_size=1024 * 1024,
+                 depth=4):
+        self._loop = asyncio.get_event_loop()
+        self._executor = executor
+        self._file_path = file_path
+        self._decode = decode
+        self._archive = archive
+        self._cache = cache
+        self._replace = replace
+        self._hasher = hasher
+        self._chunk_size = chunk_size
+        self._depth = depth
+        self._file = None
+        self._chunks = []
+        self._size = 0
+        self._pending = deque()
+
+    def _write(self, chunks, final=False):
+        for data in self._decode(b"".join(chunks), final=final):
+            if self._hasher is not None:
+                self._hasher.update(data)
+            self._file.write(data)
+
+    def _close(self, complete):
+        try:
+            if complete:
+                self._write([], final=True)
+        finally:
+            self._file.close()
+
+    async def _submit(self, func, *args):
+        if len(self._pending) >= self._depth:
+            await self._pending.popleft()
+        self._pending.append(self._loop.run_in_executor(self._executor,
+                                                        func, *args))
+
+    def _open(self):
+        if self._archive:
+            self._file, path = _get_archive_writer(
+                self._archive, self._file_path, self._cache, self._replace)
+            return path
+        self._file = open(self._file_path, "wb")
+        return self._file_path
+
+    async def open(self):
+        r"""Creates the file, or the directory it is extracted into.
+
+        Returns
+        -------
+        path : str
+            Path of the file or directory.
+        """
+        return await self._loop.run_in_executor(self._executor, self._open)
+
+    async def write(self, chunk):
+        r"""Queues a chunk of bytes to be written."""
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        if self._size >= self._chunk_size:
+            chunks, self._chunks, self._size = self._chunks, [], 0
+            await self._submit(self._write, chunks)
+
+    async def close(self, complete=True):
+        r"""Waits for the queued writes and closes the file.
+
+        Parameters
+        ----------
+        complete : boolean, default=True
+            Flag to write the remaining chunks and fail on errors of queued
+            writes. Without it (for an interrupted upload), the file is only
+            closed.
+        """
+        if complete and self._chunks:
+            await self._submit(self._write, self._chunks)
+            self._chunks = []
+        self._pending.append(self._loop.run_in_executor(
+            self._executor, self._close, complete))
+        pending, self._pending = self._pending, deque()
+        await asyncio.gather(*pending, return_exceptions=not complete)
+
+
+async def _receive_file(field, codec, archive, decompress, bar, executor,
+                        cache=None, algorithm=None, replace=False,
+                        batch_dirs=None, directory=None):
+    r"""Writes an uploaded file to disk as its field arrives.
+
+    Parameters
+    ----------
+    field : aiohttp.BodyPartReader
+        Multipart field of the uploaded file.
+    codec : str
+        Codec the file is encoded with.
+    archive : str or boolean
+        Format of the archive ('zip', 'tar' or 'sync') the file is, to
+        extract as it arrives, or False.
+    decompress : boolean
+        Flag to unzip the file once it has arrived, if it is a Zip Archive.
+    bar : tqdm.tqdm
+        Progress bar of the receiving server.
+    executor : concurrent.futures.ThreadPoolExecutor
+        Single-threaded executor to write the file in.
+    cache : object or None
+        Chunk cache of sync streams, see `utils.get_chunk_cache`.
+    algorithm : str or None
+        Hash algorithm to hash the decoded file with as it is written.
+    replace : boolean, default=False
+        Flag to replace the directory a sync stream is synced with.
+    batch_dirs : dict or None
+        Directories of the upload the file is part of, see
+        `_get_batch_name`.
+    directory : str or None
+        Directory to write the file in, instead of the current directory.
+
+    Returns
+    -------
+    status : dict
+        The `name` and received `size` of the file, whether it was
+        `received` and, if not, the `error`, and the hex `digest` of the
+        decoded file if it was hashed.
+    file_path : str or None
+        Path of the file, if it was written as it is rather than extracted.
+    """
+    loop = asyncio.get_event_loop()
+    status = {"name": field.filename, "size": 0, "received": False}
+    try:
+        file_name = field.filename.replace("'", "")
+        if batch_dirs is not None:
+            file_name = await _get_batch_name(batch_dirs, file_name,
+                                              directory)
+        file_name, file_path = await loop.run_in_executor(
+            executor, _get_upload_path, file_name, directory)
+    except (ValueError, OSError) as e:
+        await field.release()
+        status["error"] = str(e)
+        return status, None
+    hasher = None if algorithm is None else get_hasher(algorithm)
+    writer = _FileWriter(executor, file_path, get_decoder(codec), archive,
+                         cache, replace, hasher)
+    path = await writer.open()
+    complete = False
+    try:
+        try:
+            while True:
+                chunk = await field.read_chunk(1024 * 1024)
+                if not chunk:
+                    break
+                status["size"] += len(chunk)
+                await writer.write(chunk)
+                bar.update(len(chunk))
+            complete = True
+        finally:
+            await writer.close(complete)
+    except (BadZipFile, tarfile.TarError, ValueError) as e:
+        status["error"] = str(e)
+        return status, None
+    except IntegrityError:
+        if not archive:
+            await loop.run_in_executor(None, os.remove, path)
+        status["error"] = str(IntegrityError(path))
+        return status, None
+    if hasher is not None:
+        status["digest"] = hasher.hexdigest()
+    if archive == "sync":
+        tqdm.write("Downloaded and synced `" + path + "`!")
+        if cache is not None:
+            tqdm.write(_get_cache_stats(cache))
+    elif archive:
+        tqdm.write("Downloaded and decompressed to `" + path + "`!")
+    elif decompress and await loop.run_in_executor(None, is_zipfile,
+                                                   file_path):
+        zip_dir = await loop.run_in_executor(None, unzip_file, file_path)
+        await loop.run_in_executor(None, os.remove, file_path)
         tqdm.write("Downloaded and decompressed to `" + zip_dir + "`!")
-        os.remove(file_path)
     else:
         tqdm.write("Downloaded `" + file_name + "`!")
-    file_name = field.filename
-    file_size = humanize.naturalsize(total)
-    text = "{} ({}) successfully received!".format(file_name, file_size)
-    return web.Response(text=text)
+        status["received"] = True
+        return status, file_path
+    status["received"] = True
+    return status, None
+
+
+async def _verify_file(status, file_path, field):
+    r"""Verifies an uploaded file against the digest sent after it.
+
+    A file that does not match the digest is reported with an error, and
+    removed if it was written as it is.
+
+    Parameters
+    ----------
+    status : dict
+        Status of the uploaded file, as returned by `_receive_file`.
+    file_path : str or None
+        Path of the file, if it was written as it is.
+    field : aiohttp.BodyPartReader
+        Multipart 'airshare-hash' field holding the hex digest of the file.
+    """
+    digest = (await field.text()).strip().lower()
+    if not status["received"] or status.get("digest") in (None, digest):
+        return
+    status["received"] = False
+    status["error"] = "The file does not match its digest"
+    if file_path is not None:
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, os.remove, file_path)
+    tqdm.write("`" + status["name"] + "` does not match its digest and "
+               + "was discarded!")
+
+
+def _is_busy(request):
+    r"""Checks if an upload is to be turned away, as the server is busy.
+
+    Parameters
+    ----------
+    request : aiohttp.web.Request
+        Upload request.
+
+    Returns
+    -------
+    busy : boolean
+        True if the server, or the client's share of it, is at capacity.
+    """
+    app, uploads = request.app, request.app["uploads"]
+    if app["max_uploads"] and uploads["count"] >= app["max_uploads"]:
+        return True
+    client_uploads = uploads["clients"].get(request.remote, 0)
+    return bool(app["max_client_uploads"]) \
+        and client_uploads >= app["max_client_uploads"]
+
+
+def _get_busy_response():
+    r"""Returns a '503 Service Unavailable' response with 'Retry-After'."""
+    return web.Response(status=503, text="Too many uploads, retry later!",
+                        headers={"retry-after": "1"})
+
+
+async def _upload_expect_handler(request):
+    """Turns uploads away before their body is sent, Expect handler for
+    '/upload'."""
+    if _is_busy(request):
+        return _get_busy_response()
+    expect = request.headers.get("expect", "")
+    if expect.lower() != "100-continue":
+        raise web.HTTPExpectationFailed(text="Unknown Expect: " + expect)
+    await request.writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+
+async def _uploaded_file_receiver(request):
+    """Receives uploaded files, POST handler for '/upload'.
+
+    Every file field of the multipart/form-data body is written to disk as
+    it arrives, and the status of each file is returned as JSON.
+    """
+    app = request.app
+    archive, codec = parse_compress_header(
+        request.headers.get("airshare-compress"))
+    if codec not in get_codecs():
+        raise web.HTTPUnsupportedMediaType(text="Unsupported codec: " + codec)
+    if archive and archive not in _get_archive_formats(app):
+        raise web.HTTPUnsupportedMediaType(
+            text="Unsupported archive format: " + archive)
+    algorithm = request.headers.get("airshare-hash")
+    if algorithm is not None and algorithm not in get_hash_algorithms():
+        raise web.HTTPUnsupportedMediaType(
+            text="Unsupported hash algorithm: " + algorithm)
+    if _is_busy(request):
+        return _get_busy_response()
+    uploads = app["uploads"]
+    client_uploads = uploads["clients"]
+    client_uploads[request.remote] = client_uploads.get(request.remote, 0) + 1
+    uploads["count"] += 1
+    if uploads["progress"] is None:
+        uploads["progress"] = tqdm(total=None, unit="B", unit_scale=1,
+                                   leave=False)
+    batch_dirs = None
+    upload_id = request.headers.get("airshare-upload-id")
+    if upload_id is not None and not archive:
+        batch_dirs = app["batch_dirs"].pop(upload_id, {})
+        app["batch_dirs"][upload_id] = batch_dirs
+        if len(app["batch_dirs"]) > 1024:
+            app["batch_dirs"].popitem(last=False)
+    files = []
+    file_path = None
+    try:
+        reader = await request.multipart()
+        field = await reader.next()
+        while field is not None:
+            if field.filename is None and field.name == "airshare-hash" \
+                    and files:
+                await _verify_file(files[-1], file_path, field)
+            elif field.filename is None:
+                await field.release()
+            else:
+                desc = "Downloading `" + field.filename + "`"
+                if uploads["count"] > 1:
+                    desc += " and {} more".format(uploads["count"] - 1)
+                uploads["progress"].set_description_str(desc, refresh=False)
+                status, file_path = await _receive_file(
+                    field, codec, archive, app["decompress"],
+                    uploads["progress"],
+                    next(app["next_writer"]), app["chunk_cache"], algorithm,
+                    app["replace"], batch_dirs, app["directory"])
+                files.append(status)
+            field = await reader.next()
+    finally:
+        uploads["count"] -= 1
+        client_uploads[request.remote] -= 1
+        if client_uploads[request.remote] == 0:
+            del client_uploads[request.remote]
+        if uploads["count"] == 0:
+            uploads["progress"].close()
+            uploads["progress"] = None
+    status = 200
+    if not all(x["received"] for x in files):
+        status = 400
+    return web.json_response({"files": files}, status=status)
+
+
+async def _chunk_index_sender(request):
+    """Returns the chunks held for a sync upload, POST handler for '/sync'.
+
+    The JSON body of the request gives the `name` of the directory to sync,
+    in the current directory, and the `chunks` of the upload. Those held by
+    the directory or the chunk cache are returned as a JSON list of
+    digests, so that nothing is disclosed about other chunks.
+    """
+    try:
+        body = await request.json()
+        name, chunks = body["name"], set(body["chunks"])
+        parts = _split_upload_path(name)
+    except (ValueError, KeyError, TypeError) as e:
+        raise web.HTTPBadRequest(text="Invalid sync request: " + str(e))
+    if len(parts) != 1:
+        raise web.HTTPBadRequest(text="Invalid directory name: " + name)
+    loop = asyncio.get_event_loop()
+    held = set(await loop.run_in_executor(
+        None, get_chunk_index,
+        os.path.join(request.app["directory"] or os.getcwd(), parts[0])))
+    if request.app["chunk_cache"] is not None:
+        held.update(await loop.run_in_executor(
+            None, request.app["chunk_cache"].digests))
+    return web.json_response({"chunks": list(chunks & held)})
 
 
 async def _is_airshare_upload_receiver(request):
     """Returns 'Upload Receiver'. GET handler for '/airshare'."""
-    return web.Response(text="Upload Receiver")
+    headers = {"airshare-compress": ", ".join(get_codecs()),
+               "airshare-archive": ", ".join(_get_archive_formats(
+                   request.app)),
+               "airshare-hash": ", ".join(get_hash_algorithms()),
+               "airshare-upload": "batch"}
+    return web.Response(text="Upload Receiver", headers=headers)
 
 
 # Receiver functions
 
 
-def receive(*, code, decompress=False):
+def _get_file_details(headers):
+    r"""Extracts the file name and size from the headers of a File Sender.
+
+    Parameters
+    ----------
+    headers : dict
+        Response headers of a File Sender's '/download' route.
+
+    Returns
+    -------
+    file_name : str
+        Name of the file being sent.
+    file_size : int or None
+        Size of the file being sent in bytes, or None if it is streamed.
+    """
+    header = headers["content-disposition"]
+    file_name = header.split("; ")[1].split("=")[1].replace("'", "") \
+                      .replace("\"", "")
+    file_size = None
+    if "; size=" in header:
+        file_size = int(header.split("=")[-1])
+    return file_name, file_size
+
+
+def _get_download_hasher(url, headers):
+    r"""Sets up the verification of a download from a File Sender.
+
+    Parameters
+    ----------
+    url : str
+        Base URL of the File Sender.
+    headers : dict
+        Response headers of the download.
+
+    Returns
+    -------
+    hasher : object or None
+        Hasher to feed with the downloaded content, or None if the File
+        Sender does not hash it.
+    hash_url : str or None
+        URL of the digest of the download, served once it has been sent.
+    """
+    header = headers.get("airshare-hash")
+    if header is None:
+        return None, None
+    algorithm, _, digest_id = header.partition("; id=")
+    return get_hasher(algorithm), url + "/hash/" + digest_id.strip()
+
+
+def _check_digest(session, hash_url, hasher):
+    r"""Checks a download against the digest the File Sender has for it.
+
+    Parameters
+    ----------
+    session : requests.Session
+        Session (or the `requests` module) to request the digest with.
+    hash_url : str
+        URL of the digest of the download.
+    hasher : object
+        Hasher fed with the downloaded content.
+
+    Returns
+    -------
+    match : boolean
+        True if the download matches the digest.
+    """
+    r = session.get(hash_url)
+    r.raise_for_status()
+    return r.json()["digest"] == hasher.hexdigest()
+
+
+def _request_sync(url, headers, cache=None, session=requests):
+    r"""Requests a sync stream from a File Sender.
+
+    The chunks of the directory in the current directory named after the
+    shared content are sent along, so that they are left out of the stream.
+
+    Parameters
+    ----------
+    url : str
+        Base URL of the File Sender.
+    headers : dict
+        Additional headers of the request.
+    cache : object or None
+        Chunk cache whose chunks are also left out of the stream.
+    session : requests.Session, default=requests
+        Session (or the `requests` module) to request the stream with.
+
+    Returns
+    -------
+    response : requests.Response or None
+        Streamed response of the sync stream, or None if the sender does not
+        support syncing.
+    """
+    head = session.head(url + "/download", headers=headers)
+    head.raise_for_status()
+    file_name, _ = _get_file_details(head.headers)
+    sync_dir = os.path.join(os.getcwd(), os.path.splitext(file_name)[0])
+    chunks = set(get_chunk_index(sync_dir))
+    if cache is not None:
+        chunks.update(cache.digests())
+    r = session.post(url + "/sync", json={"chunks": list(chunks)},
+                     headers=headers, stream=True)
+    if r.status_code in (404, 405):
+        r.close()
+        return None
+    return r
+
+
+def _get_unique_path(file_name, directory=None):
+    r"""Returns a path in the current directory that does not exist yet.
+
+    Parameters
+    ----------
+    file_name : str
+        Preferred name of the file, suffixed with a timestamp if taken.
+    directory : str or None
+        Directory to use instead of the current directory.
+
+    Returns
+    -------
+    file_name : str
+        Name of the file in the current directory.
+    file_path : str
+        Path of the file in the current directory.
+    """
+    if directory is None:
+        directory = os.getcwd()
+    file_path = directory + os.path.sep + file_name
+    if os.path.isfile(file_path):
+        file_name, file_ext = os.path.splitext(file_name)
+        file_name += "-" + strftime("%Y%m%d%H%M%S") + file_ext
+        file_path = directory + os.path.sep + file_name
+    return file_name, file_path
+
+
+def _make_unique_dir(dir_name, directory=None):
+    r"""Creates a directory in the current directory, suffixed with a
+    timestamp (and a count) if its name is taken.
+
+    Parameters
+    ----------
+    dir_name : str
+        Preferred name of the directory.
+    directory : str or None
+        Directory to use instead of the current directory.
+
+    Returns
+    -------
+    dir_name : str
+        Name of the new directory in the current directory.
+    """
+    if directory is None:
+        directory = os.getcwd()
+    base_name, count = dir_name, 1
+    while True:
+        try:
+            os.mkdir(directory + os.path.sep + dir_name)
+            return dir_name
+        except FileExistsError:
+            dir_name = base_name + "-" + strftime("%Y%m%d%H%M%S")
+            if count > 1:
+                dir_name += "-" + str(count)
+            count += 1
+
+
+async def _get_batch_name(batch_dirs, file_name, directory=None):
+    r"""Moves the relative path of a file of a multi-file upload into the
+    directory its first directory is received as.
+
+    The first file under a directory creates it, or one suffixed with a
+    timestamp if its name is taken, like an archive is extracted, instead
+    of every file of the upload being renamed in an existing directory.
+
+    Parameters
+    ----------
+    batch_dirs : dict
+        Futures of the names of the directories received, by their name in
+        the upload, shared by the requests of the upload.
+    file_name : str
+        File name, or relative path with '/' separators, of the file.
+    directory : str or None
+        Directory to use instead of the current directory.
+
+    Returns
+    -------
+    file_name : str
+        Relative path of the file in the current directory.
+    """
+    parts = _split_upload_path(file_name)
+    if len(parts) == 1:
+        return file_name
+    if parts[0] not in batch_dirs:
+        loop = asyncio.get_event_loop()
+        batch_dirs[parts[0]] = loop.run_in_executor(None, _make_unique_dir,
+                                                    parts[0], directory)
+    return "/".join([await batch_dirs[parts[0]]] + parts[1:])
+
+
+def _split_upload_path(file_name):
+    r"""Splits the relative path of an upload into its parts.
+
+    Parameters
+    ----------
+    file_name : str
+        File name, or relative path with '/' separators, of the upload.
+
+    Returns
+    -------
+    parts : list
+        Names of the directories and file along the path.
+
+    Raises
+    ------
+    ValueError
+        If the path would leave the current directory.
+    """
+    parts = file_name.replace("\\", "/").split("/")
+    parts = [x for x in parts if x not in ("", ".")]
+    if not parts or ".." in parts or ":" in parts[0]:
+        raise ValueError("Invalid file name: " + file_name)
+    return parts
+
+
+def _get_upload_path(file_name, directory=None):
+    r"""Returns a path in the current directory for an uploaded file.
+
+    The file name may be a relative path with '/' separators, in which case
+    its directories are created.
+
+    Parameters
+    ----------
+    file_name : str
+        File name, or relative path, of the uploaded file.
+    directory : str or None
+        Directory to use instead of the current directory.
+
+    Returns
+    -------
+    file_name : str
+        Relative path of the file in the current directory.
+    file_path : str
+        Path of the file in the current directory.
+
+    Raises
+    ------
+    ValueError
+        If the path would leave the current directory.
+    """
+    if directory is None:
+        directory = os.getcwd()
+    parts = _split_upload_path(file_name)
+    if len(parts) > 1:
+        os.makedirs(os.path.join(directory, *parts[:-1]), exist_ok=True)
+    return _get_unique_path(os.path.join(*parts), directory)
+
+
+def _read_part_state(part_path):
+    r"""Reads the sidecar state of a partially downloaded file.
+
+    Parameters
+    ----------
+    part_path : str
+        Path of the partially downloaded ('.part') file.
+
+    Returns
+    -------
+    state : dict or None
+        The `etag`, `size` and durably written byte `ranges` of the partial
+        download, or None if there is no usable state.
+    """
+    try:
+        with open(part_path + ".json", "r") as f:
+            state = json.load(f)
+        part_size = os.path.getsize(part_path)
+        for first, end in state["ranges"]:
+            if not 0 <= first <= end <= part_size:
+                return None
+        return state
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _write_part_state(part_path, fd, state):
+    r"""Flushes a partial download to disk and records its sidecar state.
+
+    Parameters
+    ----------
+    part_path : str
+        Path of the partially downloaded ('.part') file.
+    fd : int
+        File descriptor of the partial download.
+    state : dict
+        The `etag`, `size` and written byte `ranges` of the partial download.
+    """
+    os.fsync(fd)
+    with open(part_path + ".json.tmp", "w") as state_file:
+        json.dump(state, state_file)
+    os.replace(part_path + ".json.tmp", part_path + ".json")
+
+
+def _merge_ranges(ranges):
+    r"""Merges overlapping and adjacent `[first, end)` byte ranges.
+
+    Parameters
+    ----------
+    ranges : list
+        List of `[first, end)` byte ranges.
+
+    Returns
+    -------
+    ranges : list
+        Sorted list of disjoint `[first, end)` byte ranges.
+    """
+    merged = []
+    for first, end in sorted(ranges):
+        if merged and first <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        elif end > first:
+            merged.append([first, end])
+    return merged
+
+
+def _get_missing_ranges(ranges, size):
+    r"""Returns the `[first, end)` byte ranges of a file not yet downloaded.
+
+    Parameters
+    ----------
+    ranges : list
+        List of downloaded `[first, end)` byte ranges.
+    size : int
+        Size of the file in bytes.
+
+    Returns
+    -------
+    missing : list
+        Sorted list of `[first, end)` byte ranges still to be downloaded.
+    """
+    missing = []
+    position = 0
+    for first, end in _merge_ranges(ranges):
+        if first > position:
+            missing.append([position, first])
+        position = max(position, end)
+    if position < size:
+        missing.append([position, size])
+    return missing
+
+
+def _pwrite(fd, data, offset, lock):
+    r"""Writes data at an offset of a file shared between threads.
+
+    Parameters
+    ----------
+    fd : int
+        File descriptor of the file.
+    data : bytes
+        Data to be written.
+    offset : int
+        Offset in the file at which to write the data.
+    lock : threading.Lock
+        Lock serialising seek-and-write, where `os.pwrite` is unavailable.
+    """
+    if hasattr(os, "pwrite"):
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data = data[written:]
+            offset += written
+    else:
+        with lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            while data:
+                data = data[os.write(fd, data):]
+
+
+def _download_segments(url, etag, fd, missing, connections, bar, done,
+                       headers=None, path="/download"):
+    r"""Downloads byte ranges of a file over several connections at a time.
+
+    Each connection repeatedly claims the next segment of the missing byte
+    ranges and writes it at its offset in the file. Segments are sized from
+    the throughput last measured on the claiming connection (about two
+    seconds of transfer, between 1 MiB and 64 MiB), and shrink towards the
+    end so that all connections finish at around the same time. Segments
+    that the File Sender hashes are only reported as written once they match
+    their digest.
+
+    Parameters
+    ----------
+    url : str
+        Base URL of the File Sender.
+    etag : str
+        Validator (ETag) of the file, sent with every Range request.
+    fd : int
+        File descriptor of the preallocated file.
+    missing : list
+        List of `[first, end)` byte ranges to be downloaded.
+    connections : int
+        Maximum number of simultaneous connections.
+    bar : tqdm.tqdm
+        Progress bar to be updated.
+    done : callable
+        Called with the `first` and `end` of every byte range written.
+    headers : dict or None
+        Additional headers of the Range requests.
+    path : str, default="/download"
+        Route of the file on the File Sender.
+    """
+    lock = threading.Lock()
+    stop = threading.Event()
+    remaining = [sum(end - first for first, end in missing)]
+    min_size, max_size = 1024 * 1024, 64 * 1024 * 1024
+
+    def claim(rate):
+        with lock:
+            if not missing or stop.is_set():
+                return None
+            size = max_size if rate is None else int(rate * 2)
+            size = min(size, remaining[0] // connections)
+            size = max(min_size, min(size, max_size))
+            first, end = missing[0]
+            end = min(end, first + size)
+            if end == missing[0][1]:
+                missing.pop(0)
+            else:
+                missing[0][0] = end
+            remaining[0] -= end - first
+            return first, end
+
+    def worker():
+        rate = None
+        with requests.Session() as session:
+            segment = claim(rate)
+            while segment is not None and not stop.is_set():
+                first, end = segment
+                range_headers = {"range": "bytes={}-{}".format(first, end - 1),
+                                 "if-range": etag}
+                range_headers.update(headers or {})
+                position = first
+                hasher = None
+                start = monotonic()
+                try:
+                    with session.get(url + path, headers=range_headers,
+                                     stream=True) as r:
+                        r.raise_for_status()
+                        if r.status_code != 206:
+                            raise requests.exceptions.HTTPError(
+                                "The File Sender's content has changed!")
+                        hasher, hash_url = _get_download_hasher(url,
+                                                                r.headers)
+                        for chunk in r.iter_content(chunk_size=min_size):
+                            if stop.is_set():
+                                return
+                            _pwrite(fd, chunk, position, lock)
+                            if hasher is not None:
+                                hasher.update(chunk)
+                            position += len(chunk)
+                            bar.update(len(chunk))
+                    if hasher is not None and position == end \
+                            and not _check_digest(session, hash_url, hasher):
+                        raise IntegrityError("bytes {}-{} of {}".format(
+                            first, end - 1, url + path))
+                except BaseException:
+                    stop.set()
+                    raise
+                finally:
+                    if hasher is None:
+                        done(first, position)
+                if position != end:
+                    raise requests.exceptions.ConnectionError(
+                        "Segment {}-{} ended early".format(first, end - 1))
+                if hasher is not None:
+                    done(first, end)
+                rate = (end - first) / max(monotonic() - start, 1e-3)
+                segment = claim(rate)
+
+    workers = max(1, min(connections, remaining[0] // min_size))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(worker) for _ in range(workers)]
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            stop.set()
+
+
+def _download_ranges(url, resume=False, connections=1, headers=None,
+                     path="/download", file_name=None):
+    r"""Downloads from a File Sender into a '.part' file using Range requests.
+
+    With `resume`, the byte ranges durably written are recorded in a
+    '.part.json' sidecar along with the sender's validator (ETag), and an
+    interrupted download continues from those ranges as long as the sender
+    still validates the same content. With more than one connection, or
+    when the download is verified, the file is preallocated and fetched in
+    segments (over parallel connections), each verified against its own
+    digest before it is recorded.
+
+    Parameters
+    ----------
+    url : str
+        Base URL of the File Sender.
+    resume : boolean, default=False
+        Flag to resume an earlier partial download and record progress.
+    connections : int, default=1
+        Maximum number of simultaneous connections.
+    headers : dict or None
+        Additional headers of the Range requests, with an 'airshare-hash'
+        header to verify the download.
+    path : str, default="/download"
+        Route of the file on the File Sender.
+    file_name : str or None
+        Relative path, with '/' separators, to download the file to. By
+        default, the file is named as the File Sender names it.
+
+    Returns
+    -------
+    file_path : str or None
+        Path of the downloaded file, or None if the File Sender does not
+        support Range requests.
+    compress_header : str or None
+        Value of the 'airshare-compress' header sent by the File Sender.
+    """
+    head = requests.head(url + path)
+    head.raise_for_status()
+    sent_name, file_size = _get_file_details(head.headers)
+    if file_name is None:
+        file_name = sent_name
+    else:
+        file_name = os.path.join(*_split_upload_path(file_name))
+        if os.path.dirname(file_name):
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    etag = head.headers.get("etag")
+    ranged = etag is not None and head.headers.get("accept-ranges") == "bytes"
+    if not ranged or file_size is None:
+        return None, None
+    compress_header = head.headers.get("airshare-compress") or "false"
+    part_path = os.getcwd() + os.path.sep + file_name + ".part"
+    state = {"etag": etag, "size": file_size, "ranges": []}
+    previous = _read_part_state(part_path) if resume else None
+    if previous is not None and previous["etag"] == etag \
+            and previous["size"] == file_size:
+        state["ranges"] = _merge_ranges(previous["ranges"])
+    verify = "airshare-hash" in (headers or {})
+    segmented = (connections > 1 or verify) and file_size > 0
+    if not segmented:
+        state["ranges"] = [x for x in state["ranges"][:1] if x[0] == 0]
+    received = sum(end - first for first, end in state["ranges"])
+    if received > 0:
+        tqdm.write("Resuming `" + file_name + "` from "
+                   + humanize.naturalsize(received) + "...")
+    flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    fd = os.open(part_path, flags, 0o666)
+    lock = threading.Lock()
+    synced = [received]
+
+    def done(first, end):
+        with lock:
+            state["ranges"] = _merge_ranges(state["ranges"] + [[first, end]])
+            written = sum(end - first for first, end in state["ranges"])
+            if resume and written - synced[0] >= 64 * 1024 * 1024:
+                synced[0] = written
+                _write_part_state(part_path, fd, state)
+
+    desc = "Downloading `" + file_name + "`"
+    bar = tqdm(desc=desc, total=file_size, initial=received, unit="B",
+               unit_scale=1, leave=False)
+    complete = False
+    try:
+        if segmented:
+            os.ftruncate(fd, file_size)
+            missing = _get_missing_ranges(state["ranges"], file_size)
+            _download_segments(url, etag, fd, missing, connections, bar,
+                               done, headers, path)
+        elif received < file_size or file_size == 0:
+            range_headers = {}
+            if received > 0:
+                range_headers = {"range": "bytes={}-".format(received),
+                                 "if-range": etag}
+            with requests.get(url + path, headers=range_headers,
+                              stream=True) as r:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    # The whole content is sent, which may have changed
+                    # since the HEAD request.
+                    file_size = _get_file_details(r.headers)[1] \
+                        or file_size
+                    received = 0
+                    state.update(etag=r.headers.get("etag", etag),
+                                 size=file_size, ranges=[])
+                    bar.reset(total=file_size)
+                compress_header = r.headers.get("airshare-compress") \
+                    or "false"
+                os.ftruncate(fd, received)
+                position = received
+                try:
+                    for chunk in r.iter_content(chunk_size=8192):
+                        if chunk:
+                            _pwrite(fd, chunk, position, lock)
+                            bar.update(len(chunk))
+                            position += len(chunk)
+                            if position - received >= 1024 * 1024:
+                                done(received, position)
+                                received = position
+                finally:
+                    done(received, position)
+        complete = state["ranges"] == [[0, file_size]] or file_size == 0
+    finally:
+        bar.close()
+        if resume:
+            _write_part_state(part_path, fd, state)
+        os.close(fd)
+        # Without its ranges, a partial file cannot be resumed.
+        if not resume and not complete:
+            os.remove(part_path)
+    if not complete:
+        received = sum(end - first for first, end in state["ranges"])
+        message = "Download interrupted after {} of {} bytes".format(
+            received, file_size)
+        if resume:
+            message += ", `" + part_path + "` can be resumed!"
+        raise requests.exceptions.ConnectionError(message)
+    _, file_path = _get_unique_path(file_name)
+    os.replace(part_path, file_path)
+    if resume:
+        os.remove(part_path + ".json")
+    return file_path, compress_header
+
+
+def _write_response(r, f, decode, bar, hasher=None):
+    r"""Writes the decoded content of a streamed download into a file.
+
+    Parameters
+    ----------
+    r : requests.Response
+        Streamed response of the download.
+    f : file object
+        File, or archive writer, to write the content into.
+    decode : callable
+        Decoder of the content, see `utils.get_decoder`.
+    bar : tqdm.tqdm
+        Progress bar to be updated.
+    hasher : object or None
+        Hasher to feed with the decoded content.
+    """
+    for data in r.iter_content(chunk_size=1024 * 1024):
+        if data:
+            for chunk in decode(data):
+                if hasher is not None:
+                    hasher.update(chunk)
+                f.write(chunk)
+                bar.update(len(chunk))
+    for chunk in decode(b"", final=True):
+        if hasher is not None:
+            hasher.update(chunk)
+        f.write(chunk)
+
+
+def _receive_files(url, patterns, resume=False, connections=1, headers=None):
+    r"""Downloads the files of a browsable File Sender that match patterns.
+
+    The shared directory is received into a new directory, suffixed with a
+    timestamp if its name is taken, unless downloads are resumed into it.
+
+    Parameters
+    ----------
+    url : str
+        Base URL of the File Sender.
+    patterns : list
+        Glob patterns (see `fnmatch`) matched against the relative path of
+        every file, with and without the name of the shared content as its
+        first directory.
+    resume : boolean, default=False
+        Flag to resume earlier partial downloads and record progress.
+    connections : int, default=1
+        Maximum number of simultaneous connections per file.
+    headers : dict or None
+        Additional headers of the downloads, with an 'airshare-hash' header
+        to verify them.
+
+    Returns
+    -------
+    file_paths : list
+        Paths of the files downloaded.
+
+    Raises
+    ------
+    ValueError
+        If the File Sender does not list its files.
+    """
+    r = requests.get(url + "/files")
+    if r.status_code == 404:
+        raise ValueError("The File Sender does not serve its files one by"
+                         + " one, receive without `files`!")
+    r.raise_for_status()
+    files = [x for x in r.json()["files"]
+             if any(fnmatchcase(x["path"], pattern)
+                    or fnmatchcase(x["path"].partition("/")[2], pattern)
+                    for pattern in patterns)]
+    total = sum(x["size"] for x in files)
+    tqdm.write("Receiving {} file(s) ({})...".format(
+        len(files), humanize.naturalsize(total)))
+    file_paths = []
+    dirs = {}
+    with requests.Session() as session:
+        for file in files:
+            path = "/download/" + quote(file["path"])
+            parts = _split_upload_path(file["path"])
+            if not resume and len(parts) > 1:
+                if parts[0] not in dirs:
+                    dirs[parts[0]] = _make_unique_dir(parts[0])
+                parts[0] = dirs[parts[0]]
+            file_name = "/".join(parts)
+            file_path = None
+            if resume or connections > 1:
+                file_path, _ = _download_ranges(url, resume, connections,
+                                                headers, path, file_name)
+            if file_path is None:
+                download_headers = {
+                    "airshare-compress": ", ".join(get_codecs())}
+                download_headers.update(headers or {})
+                with session.get(url + path, headers=download_headers,
+                                 stream=True) as r:
+                    r.raise_for_status()
+                    _, codec = parse_compress_header(
+                        r.headers.get("airshare-compress"))
+                    decode = get_decoder(codec, file["size"])
+                    file_name, file_path = _get_upload_path(file_name)
+                    hasher, hash_url = _get_download_hasher(url, r.headers)
+                    try:
+                        with open(file_path, "wb") as f:
+                            desc = "Downloading `" + file_name + "`"
+                            bar = tqdm(desc=desc, total=file["size"],
+                                       unit="B", unit_scale=1, leave=False)
+                            _write_response(r, f, decode, bar, hasher)
+                            bar.close()
+                    except IntegrityError:
+                        os.remove(file_path)
+                        raise IntegrityError(file_path) from None
+                if hasher is not None \
+                        and not _check_digest(session, hash_url, hasher):
+                    os.remove(file_path)
+                    raise IntegrityError(file_path)
+            file_path = os.path.realpath(file_path)
+            tqdm.write("Downloaded `" + file_path + "`!")
+            file_paths.append(file_path)
+    return file_paths
+
+
+def receive(*, code, decompress=False, resume=False, connections=1,
+            sync=False, chunk_cache=False, verify=None, hash_algorithm=None,
+            files=None, lookup_timeout=3):
     r"""Receive file(s) from a sending server.
 
     Parameters
     ----------
     code : str
-        Identifying code for the Airshare sending server.
+        Identifying code for the Airshare sending server, or its `host:port`
+        to reach it directly, without a Multicast-DNS lookup.
     decompress : boolean, default=False
         Flag to enable or disable decompression (Zip).
+    resume : boolean, default=False
+        Flag to keep interrupted downloads as '.part' files and resume them
+        from where they stopped, if the sender's content is unchanged.
+    connections : int, default=1
+        Maximum number of parallel connections, each fetching a segment of
+        the file at a time. Segments are written at their offsets in a
+        preallocated file.
+    sync : boolean, default=False
+        Flag to sync the directory named after the shared content in the
+        current directory (e.g. `dir` for `dir.zip`) with it, receiving only
+        the content-defined chunks that its files do not already hold, if
+        the sender supports it. The directory is replaced by the shared
+        content.
+    chunk_cache : boolean, default=False
+        Flag to keep the chunks received when syncing in the on-disk chunk
+        cache (see `utils.get_chunk_cache`), and to rebuild files from the
+        chunks cached by earlier syncs, from any sender.
+    verify : boolean or None, default=None
+        Flag to hash the content as it is written and verify it against the
+        digest of the content the sender read, if the sender supports it.
+        Resumed and segmented downloads are verified segment by segment.
+        Content that does not match raises `exception.IntegrityError`. By
+        default, the content is only verified with a fast algorithm
+        ('xxh3_128' or 'blake3', from the optional `xxhash` and `blake3`
+        packages) available to both, or with `hash_algorithm` if it is
+        given, as the other algorithms hash slower than fast networks
+        transfer, and keep the sender from sending files with `sendfile`.
+    hash_algorithm : str or None
+        Hash algorithm to verify the content with ('xxh3_128', 'blake3',
+        'blake2b' or 'sha256'). By default, the fastest algorithm available
+        to both is used.
+    files : str or list or None
+        Glob pattern(s) of the files to receive one by one, from a sender
+        that serves its files one by one (see `sender.send_server`), instead
+        of the whole content. Patterns are matched against the relative
+        paths of the files (e.g. `dir/docs/*.pdf` or `docs/*.pdf`), and
+        `*` also matches across '/'. The files are downloaded to the same
+        relative paths in the current directory.
+    lookup_timeout : float, default=3
+        Time in seconds to wait for the sending server to answer the lookup
+        of its code.
 
     Returns
     -------
     text (or) file_path : str
         Returns the text or path of the file received, if successful.
+    file_paths : list
+        Returns the paths of the files received, with `files`.
     """
-    info = get_service_info(code)
-    if info is None:
+    hash_headers = {}
+    if verify is not False and hash_algorithm is not None:
+        get_hasher(hash_algorithm)
+        hash_headers["airshare-hash"] = hash_algorithm
+    elif verify is not False:
+        algorithms = get_hash_algorithms(fast=verify is None)
+        if algorithms:
+            hash_headers["airshare-hash"] = ", ".join(algorithms)
+    url = get_service_url(code, lookup_timeout)
+    if url is None:
         raise CodeNotFoundError(code)
-    ip = socket.inet_ntoa(info.addresses[0])
-    url = "http://" + ip + ":" + str(info.port)
     airshare_type = requests.get(url + "/airshare").text
     if "Sender" not in airshare_type:
         raise IsNotSenderError(code)
     print("Receiving from Airshare `" + code + "`...")
-    sleep(2)
     if airshare_type == "Text Sender":
         text = requests.get(url + "/text").text
         print("Received: " + text)
         return text
+    elif airshare_type == "File Sender" and files is not None:
+        if isinstance(files, str):
+            files = [files]
+        return _receive_files(url, files, resume, connections, hash_headers)
     elif airshare_type == "File Sender":
-        with requests.get(url + "/download", stream=True) as r:
-            r.raise_for_status()
-            header = r.headers["content-disposition"]
-            compress_header = r.headers.get("airshare-compress") or "false"
-            if compress_header == "true":
-                decompress = True
-            file_name = header.split("; ")[1].split("=")[1] \
-                              .replace("'", "")
-            file_path = os.getcwd() + os.path.sep + file_name
-            file_size = int(header.split("=")[-1])
-            if os.path.isfile(file_path):
-                file_name, file_ext = os.path.splitext(file_name)
-                file_name += "-" + strftime("%Y%m%d%H%M%S") + file_ext
-                file_path = os.getcwd() + os.path.sep + file_name
-            with open(file_path, "wb") as f:
-                desc = "Downloading `" + file_name + "`"
-                bar = tqdm(desc=desc, total=file_size, unit="B",
-                           unit_scale=1, leave=False)
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        bar.update(len(chunk))
-            file_path = os.path.realpath(file_path)
-            if is_zipfile(file_path) and decompress:
-                zip_dir = unzip_file(file_path)
-                tqdm.write("Downloaded and decompressed to `" + zip_dir + "`!")
-                os.remove(file_path)
-                file_path = zip_dir
-            else:
-                tqdm.write("Downloaded `" + file_path + "`!")
-            return file_path
+        file_path = None
+        if (resume or connections > 1) and not sync:
+            file_path, compress_header = _download_ranges(
+                url, resume, connections, hash_headers)
+        zip_dir = None
+        if file_path is None:
+            headers = {"airshare-compress": ", ".join(get_codecs()),
+                       "airshare-archive": ", ".join(_ARCHIVE_WRITERS)}
+            headers.update(hash_headers)
+            r = None
+            cache = None
+            if sync and chunk_cache:
+                cache = get_chunk_cache()
+            # The digest is requested over the connection of the download,
+            # which reaches the worker of the File Sender that hashed it.
+            with requests.Session() as session:
+                if sync:
+                    r = _request_sync(url, headers, cache, session)
+                if r is None:
+                    r = session.get(url + "/download", headers=headers,
+                                    stream=True)
+                with r:
+                    r.raise_for_status()
+                    compress_header = r.headers.get("airshare-compress")
+                    archive, codec = parse_compress_header(compress_header)
+                    file_name, file_size = _get_file_details(r.headers)
+                    decode = get_decoder(codec, file_size)
+                    file_name, file_path = _get_unique_path(file_name)
+                    hasher, hash_url = _get_download_hasher(url, r.headers)
+                    if archive in _ARCHIVE_WRITERS:
+                        f, zip_dir = _get_archive_writer(
+                            archive, file_path, cache, replace=True)
+                    else:
+                        f = open(file_path, "wb")
+                    try:
+                        with f:
+                            desc = "Downloading `" + file_name + "`"
+                            bar = tqdm(desc=desc, total=file_size, unit="B",
+                                       unit_scale=1, leave=False)
+                            _write_response(r, f, decode, bar, hasher)
+                    except IntegrityError:
+                        if zip_dir is None:
+                            os.remove(file_path)
+                        raise IntegrityError(zip_dir or file_path) from None
+                if hasher is not None \
+                        and not _check_digest(session, hash_url, hasher):
+                    if zip_dir is None:
+                        os.remove(file_path)
+                    raise IntegrityError(zip_dir or file_path)
+        if zip_dir is not None and archive == "sync":
+            tqdm.write("Downloaded and synced `" + zip_dir + "`!")
+            if cache is not None:
+                tqdm.write(_get_cache_stats(cache))
+            return zip_dir
+        if zip_dir is not None:
+            tqdm.write("Downloaded and decompressed to `" + zip_dir + "`!")
+            return zip_dir
+        if parse_compress_header(compress_header)[0] == "zip":
+            decompress = True
+        file_path = os.path.realpath(file_path)
+        if is_zipfile(file_path) and decompress:
+            zip_dir = unzip_file(file_path)
+            tqdm.write("Downloaded and decompressed to `" + zip_dir + "`!")
+            os.remove(file_path)
+            file_path = zip_dir
+        else:
+            tqdm.write("Downloaded `" + file_path + "`!")
+        return file_path
+
+
+def _get_receive_app(*, decompress=False, max_uploads=64,
+                     max_client_uploads=16, sync=False, replace=False,
+                     chunk_cache=False, directory=None):
+    r"""Builds the application receiving uploaded files.
+
+    Parameters are as for `receive_server`, which serves the application on
+    its own, while `daemon.daemon_server` serves many of them on one port.
+    The single-threaded executors that write the files are kept in the
+    'writers' list of the application, to be shut down along with it.
+
+    Returns
+    -------
+    app : aiohttp.web.Application
+        Application receiving uploaded files.
+    """
+    app = web.Application()
+    app["decompress"] = decompress
+    app["directory"] = None
+    if directory is not None:
+        app["directory"] = os.path.abspath(directory)
+        os.makedirs(app["directory"], exist_ok=True)
+    app["sync"] = sync
+    app["replace"] = replace
+    app["chunk_cache"] = get_chunk_cache() if chunk_cache else None
+    writers = min(32, (os.cpu_count() or 1) + 4)
+    app["writers"] = [ThreadPoolExecutor(max_workers=1)
+                      for _ in range(writers)]
+    app["next_writer"] = cycle(app["writers"])
+    app["max_uploads"] = max_uploads
+    app["max_client_uploads"] = max_client_uploads
+    # Uploads in progress: their count, the count by client address, and
+    # their progress bar.
+    app["uploads"] = {"count": 0, "clients": {}, "progress": None}
+    # Directories of the recent multi-file uploads, by their upload ID.
+    app["batch_dirs"] = OrderedDict()
+    app.router.add_get(path="/", handler=_upload_page)
+    app.router.add_get(path="/airshare", handler=_is_airshare_upload_receiver)
+    if sync:
+        app.router.add_post(path="/sync", handler=_chunk_index_sender)
+    app.router.add_post(path="/upload", handler=_uploaded_file_receiver,
+                        expect_handler=_upload_expect_handler)
+    return app
 
 
-def receive_server(*, code, decompress=False, port=8000):
+def receive_server(*, code, decompress=False, port=8000, max_uploads=64,
+                   max_client_uploads=16, sync=False, replace=False,
+                   chunk_cache=False, directory=None):
     r"""Serves a file receiver and registers it as a Multicast-DNS service.
 
     Parameters
@@ -156,25 +1440,45 @@ def receive_server(*, code, decompress=False, port=8000):
         Flag to enable or disable decompression (Zip).
     port : int, default=8000
         Port number at which the server is hosted on the device.
+    max_uploads : int or None, default=64
+        Maximum number of uploads received at the same time, beyond which
+        uploads are turned away with '503 Service Unavailable' and a
+        'Retry-After' header. If None, uploads are not limited.
+    max_client_uploads : int or None, default=16
+        Maximum number of uploads received at the same time from a single
+        client address. If None, clients are only limited by `max_uploads`.
+    sync : boolean, default=False
+        Flag to accept sync uploads (see `sender.send`), which are synced
+        with the directory of the same name in the current directory,
+        receiving only the chunks that its files do not already hold. The
+        chunks of the directory are only disclosed to senders that hold
+        them.
+    replace : boolean, default=False
+        Flag to replace the directory with a sync upload, deleting its files
+        that are not in the upload. Without it, sync uploads are written
+        into a new directory, as Zip Archives are decompressed.
+    chunk_cache : boolean, default=False
+        Flag to keep the chunks of synced uploads in the on-disk chunk cache
+        (see `utils.get_chunk_cache`), and to rebuild files from the chunks
+        cached by earlier syncs, from any sender.
+    directory : str or None
+        Directory to write the uploaded files in, and to sync directories
+        of, instead of the current directory.
     """
     info = get_service_info(code)
     if info is not None:
         raise CodeExistsError(code)
-    addresses = [get_local_ip_address()]
-    register_service(code, addresses, port)
+    app = _get_receive_app(decompress=decompress, max_uploads=max_uploads,
+                           max_client_uploads=max_client_uploads,
+                           sync=sync, replace=replace,
+                           chunk_cache=chunk_cache, directory=directory)
+    addresses = get_local_ip_addresses()
+    info = register_service(code, addresses, port)
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    app = web.Application()
-    app["decompress"] = decompress
-    app["progress_queue"] = asyncio.Queue()
-    for pos in range(5):
-        app["progress_queue"].put_nowait(pos)
-    app.router.add_get(path="/", handler=_upload_page)
-    app.router.add_get(path="/airshare", handler=_is_airshare_upload_receiver)
-    app.router.add_post(path="/upload", handler=_uploaded_file_receiver)
     runner = web.AppRunner(app)
     loop.run_until_complete(runner.setup())
-    site = web.TCPSite(runner, "0.0.0.0", str(port))
+    site = web.TCPSite(runner, port=port)
     loop.run_until_complete(site.start())
     url_port = ""
     if port != 80:
@@ -188,10 +1492,17 @@ def receive_server(*, code, decompress=False, port=8000):
     qr_code("http://" + ip)
     if decompress:
         print("Note: Any Zip Archives will be decompressed!")
-    loop.run_forever()
+    if sync and replace:
+        print("Note: Synced directories will be replaced!")
+    try:
+        loop.run_forever()
+    finally:
+        unregister_service(info)
 
 
-def receive_server_proc(*, code, decompress=False, port=8000):
+def receive_server_proc(*, code, decompress=False, port=8000, max_uploads=64,
+                        max_client_uploads=16, sync=False, replace=False,
+                        chunk_cache=False, directory=None):
     r"""Creates a process with 'receive_server' as the target.
 
     Parameters
@@ -202,12 +1513,40 @@ def receive_server_proc(*, code, decompress=False, port=8000):
         Flag to enable or disable decompression (Zip).
     port : int, default=8000
         Port number at which the server is hosted on the device.
+    max_uploads : int or None, default=64
+        Maximum number of uploads received at the same time, beyond which
+        uploads are turned away with '503 Service Unavailable' and a
+        'Retry-After' header. If None, uploads are not limited.
+    max_client_uploads : int or None, default=16
+        Maximum number of uploads received at the same time from a single
+        client address. If None, clients are only limited by `max_uploads`.
+    sync : boolean, default=False
+        Flag to accept sync uploads (see `sender.send`), which are synced
+        with the directory of the same name in the current directory,
+        receiving only the chunks that its files do not already hold. The
+        chunks of the directory are only disclosed to senders that hold
+        them.
+    replace : boolean, default=False
+        Flag to replace the directory with a sync upload, deleting its files
+        that are not in the upload. Without it, sync uploads are written
+        into a new directory, as Zip Archives are decompressed.
+    chunk_cache : boolean, default=False
+        Flag to keep the chunks of synced uploads in the on-disk chunk cache
+        (see `utils.get_chunk_cache`), and to rebuild files from the chunks
+        cached by earlier syncs, from any sender.
+    directory : str or None
+        Directory to write the uploaded files in, and to sync directories
+        of, instead of the current directory.
 
     Returns
     -------
     process: multiprocessing.Process
         A multiprocessing.Process object with 'receive_server' as target.
     """
-    kwargs = {"code": code, "decompress": decompress, "port": port}
+    kwargs = {"code": code, "decompress": decompress, "port": port,
+              "max_uploads": max_uploads,
+              "max_client_uploads": max_client_uploads, "sync": sync,
+              "replace": replace, "chunk_cache": chunk_cache,
+              "directory": directory}
     process = Process(target=receive_server, kwargs=kwargs)
     return process
@@ -1,25 +1,44 @@
 """Module for sending data and hosting sending servers."""
 
 
+import aiohttp
 from aiohttp import web
 import asyncio
+from collections import OrderedDict
+from functools import partial
 import humanize
-from multiprocessing import Process
+from multiprocessing import get_context, Process
+from multiprocessing.connection import wait
 import os
 import pkgutil
 import platform
-import requests
-from requests_toolbelt import MultipartEncoder
 import socket
 import sys
+import threading
+from time import monotonic
+from uuid import uuid4
+from zipfile import ZipFile
 
 
 from .exception import CodeExistsError, CodeNotFoundError, IsNotReceiverError
-from .utils import get_local_ip_address, get_service_info, get_zip_file, \
-    qr_code, register_service
+from .utils import get_codec_profile, get_codecs, get_compress_header, \
+    get_compression_sample, get_encoder, get_file_members, get_hasher, \
+    get_local_ip_addresses, get_manifest_cache, get_service_info, \
+    get_service_url, get_sync_manifest, get_sync_stream, get_tar_stream, \
+    get_zip_file, get_zip_stream, qr_code, register_service, select_codec, \
+    select_hash_algorithm, unregister_service
 
 
-__all__ = ["send", "send_server", "send_server_proc"]
+__all__ = ["send", "send_async", "send_server", "send_server_proc"]
+
+
+_SENDFILE_ERRORS = (NotImplementedError,
+                    getattr(asyncio, "SendfileNotAvailableError",
+                            NotImplementedError))
+_BROADCAST_CACHE_SIZE = 256 * 1024 * 1024
+# Minimum number of seconds between listings of the shared files of a
+# browsable share, for requests of files that were not listed.
+_RESCAN_INTERVAL = 5
 
 
 # Request handlers
@@ -36,7 +55,7 @@ async def _text_sender(request):
     address = ""
     peername = request.transport.get_extra_info("peername")
     if peername is not None:
-        host, _ = peername
+        host = peername[0]
         address = " (by " + str(host) + ")"
     print("Content viewed" + address + "!")
     return web.Response(text=request.app["text"])
@@ -48,33 +67,624 @@ async def _download_page(request):
     return web.Response(text=download, content_type="text/html")
 
 
+async def _send_file(request, response, file_path, offset, count):
+    r"""Writes a byte range of a file into a prepared response.
+
+    The kernel's zero-copy `sendfile` is used when the event loop and the
+    transport support it, otherwise the file is streamed in chunks.
+
+    Parameters
+    ----------
+    request : aiohttp.web.Request
+        Request whose transport the file is written to.
+    response : aiohttp.web.StreamResponse
+        Prepared response to write the file into.
+    file_path : str
+        Path of the file to send.
+    offset : int
+        Offset of the first byte to send.
+    count : int
+        Number of bytes to send.
+    """
+    loop = asyncio.get_event_loop()
+    transport = request.transport
+    with open(file_path, "rb") as f:
+        if hasattr(loop, "sendfile") and transport is not None:
+            try:
+                await loop.sendfile(transport, f, offset, count,
+                                    fallback=False)
+                return
+            except _SENDFILE_ERRORS:
+                pass
+        f.seek(offset)
+        while count > 0:
+            chunk = f.read(min(count, 65536))
+            if not chunk:
+                break
+            count -= len(chunk)
+            await response.write(chunk)
+
+
+def _get_byte_range(range_header, size):
+    r"""Parses a single-range `Range` header against the size of a file.
+
+    Parameters
+    ----------
+    range_header : str
+        Value of the `Range` request header.
+    size : int
+        Size of the requested file in bytes.
+
+    Returns
+    -------
+    byte_range : tuple or None
+        Inclusive `(first, last)` byte positions of the range, or None if the
+        header is to be ignored (malformed or multiple ranges).
+
+    Raises
+    ------
+    ValueError
+        If the range cannot be satisfied for a file of the given size.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if sep != "-" or not (first + last).isdigit():
+        return None
+    if first == "":
+        if int(last) == 0 or size == 0:
+            raise ValueError("Unsatisfiable range: " + range_header)
+        return max(0, size - int(last)), size - 1
+    first = int(first)
+    last = size - 1 if last == "" else min(int(last), size - 1)
+    if first >= size:
+        raise ValueError("Unsatisfiable range: " + range_header)
+    if last < first:
+        return None
+    return first, last
+
+
+def _read_file(file_path, chunk_size=1024 * 1024, offset=0, count=None):
+    r"""Yields the contents of a file, or `count` bytes of it from `offset`,
+    in chunks of bytes."""
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        while count is None or count > 0:
+            size = chunk_size if count is None else min(count, chunk_size)
+            chunk = f.read(size)
+            if not chunk:
+                break
+            if count is not None:
+                count -= len(chunk)
+            yield chunk
+
+
+class _BlockCache:
+    """In-memory cache of the blocks of shared files, evicted least recently
+    used.
+
+    Concurrent downloads of a file read it through the cache, so that every
+    block is read from disk once while downloads keep within `max_size`
+    bytes of each other, and written to all of their sockets. A block being
+    read is waited for by the other downloads instead of being read again.
+    """
+
+    def __init__(self, max_size, block_size=1024 * 1024):
+        self.max_size = max_size
+        self.block_size = block_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._blocks = OrderedDict()
+        self._loading = {}
+        self._size = 0
+
+    def _get(self, file_path, etag, index):
+        key = (file_path, etag, index)
+        while True:
+            with self._lock:
+                block = self._blocks.get(key)
+                if block is not None:
+                    self._blocks.move_to_end(key)
+                    self.hits += 1
+                    return block
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            loading.wait()
+        try:
+            with open(file_path, "rb") as f:
+                f.seek(index * self.block_size)
+                block = f.read(self.block_size)
+            with self._lock:
+                self.misses += 1
+                self._blocks[key] = block
+                self._size += len(block)
+                while self._size > self.max_size and len(self._blocks) > 1:
+                    _, evicted = self._blocks.popitem(last=False)
+                    self._size -= len(evicted)
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+        return block
+
+    def read(self, file_path, etag, offset=0, count=0):
+        r"""Yields `count` bytes of a file from `offset`, in blocks.
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the file.
+        etag : str
+            Validator (ETag) of the file, keying its blocks along with its
+            path, so that blocks of earlier contents are not served.
+        offset : int, default=0
+            Offset of the first byte.
+        count : int, default=0
+            Number of bytes.
+        """
+        index, skip = divmod(offset, self.block_size)
+        while count > 0:
+            block = self._get(file_path, etag, index)
+            if len(block) <= skip:
+                break
+            if skip or count < len(block) - skip:
+                block = block[skip:skip + count]
+            count -= len(block)
+            skip = 0
+            index += 1
+            yield block
+
+    def stats(self):
+        r"""Returns the `hits`, `misses` and `size` in bytes of the cache."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": self._size}
+
+
+def _hash_stream(stream, hasher):
+    r"""Yields the chunks of a stream of bytes, hashing them on the way."""
+    for chunk in stream:
+        hasher.update(chunk)
+        yield chunk
+
+
+def _encode_stream(stream, codec):
+    r"""Yields the chunks of a stream of bytes encoded with a codec."""
+    encode = get_encoder(codec)
+    for chunk in stream:
+        chunk = encode(chunk)
+        if chunk:
+            yield chunk
+    chunk = encode(b"", final=True)
+    if chunk:
+        yield chunk
+
+
+async def _iterate_stream(stream):
+    r"""Asynchronously yields the chunks of a stream of bytes.
+
+    The stream is advanced in the default executor, so that reading and
+    encoding do not block the event loop.
+
+    Parameters
+    ----------
+    stream : iterator
+        Iterator yielding chunks of bytes.
+    """
+    loop = asyncio.get_event_loop()
+    chunk = await loop.run_in_executor(None, next, stream, None)
+    while chunk is not None:
+        yield chunk
+        chunk = await loop.run_in_executor(None, next, stream, None)
+
+
+async def _write_stream(response, stream, hasher=None, digest=None):
+    r"""Writes a stream of bytes into a prepared response.
+
+    Parameters
+    ----------
+    response : aiohttp.web.StreamResponse
+        Prepared response to write the stream into.
+    stream : iterator
+        Iterator yielding chunks of bytes.
+    hasher : object or None
+        Hasher fed with the content of the stream as it is read (see
+        `_hash_stream`).
+    digest : asyncio.Future or None
+        Future set to the hex digest of `hasher` once the whole stream is
+        written, or to None if it is not.
+
+    Returns
+    -------
+    size : int
+        Number of bytes written.
+    """
+    size = 0
+    try:
+        async for chunk in _iterate_stream(stream):
+            await response.write(chunk)
+            size += len(chunk)
+    except BaseException:
+        if digest is not None:
+            digest.set_result(None)
+        raise
+    if digest is not None:
+        digest.set_result(hasher.hexdigest())
+    return size
+
+
+async def _get_codec(request):
+    r"""Selects the codec for a download, GET helper for route '/download'.
+
+    The sender's codec is used if the receiver lists it in its
+    'airshare-compress' request header, otherwise the content is stored.
+    With 'auto', the codec is selected from the profile of a sample of the
+    content, measured once when sharing starts, and the link speed last
+    measured for the receiver.
+
+    Parameters
+    ----------
+    request : aiohttp.web.Request
+        Download request.
+
+    Returns
+    -------
+    codec : str
+        Codec to encode the download with.
+    """
+    accepted = request.headers.get("airshare-compress", "").split(",")
+    accepted = [x.strip().lower() for x in accepted if x.strip()]
+    codec = request.app["codec"]
+    if codec == "auto" and accepted:
+        link_speed = request.app["link_speeds"].get(request.remote)
+        codec = select_codec(None, link_speed, accepted,
+                             request.app["codec_profile"])
+    if codec.partition(":")[0] not in accepted:
+        codec = "store"
+    return codec
+
+
+def _get_hasher(request, response):
+    r"""Sets up the hashing of a download, GET helper for '/download'.
+
+    If the receiver lists hash algorithms in its 'airshare-hash' request
+    header, the content is hashed as it is read, with the fastest algorithm
+    it accepts. The algorithm and an id are given in the 'airshare-hash'
+    response header, and the digest is served at '/hash/{id}' once the
+    content is written, like a trailer.
+
+    Parameters
+    ----------
+    request : aiohttp.web.Request
+        Download request.
+    response : aiohttp.web.StreamResponse
+        Unprepared response to the request.
+
+    Returns
+    -------
+    hasher : object or None
+        Hasher to feed with the content, or None if it is not hashed.
+    digest : asyncio.Future or None
+        Future to set to the hex digest of the content.
+    """
+    accepted = request.headers.get("airshare-hash")
+    if accepted is None or request.method != "GET":
+        return None, None
+    algorithm = select_hash_algorithm(accepted.split(","))
+    if algorithm is None:
+        return None, None
+    digest_id = uuid4().hex
+    digests = request.app["digests"]
+    digests[digest_id] = asyncio.get_event_loop().create_future()
+    while len(digests) > 1024:
+        digests.popitem(last=False)
+    response.headers["airshare-hash"] = algorithm + "; id=" + digest_id
+    return get_hasher(algorithm), digests[digest_id]
+
+
+async def _hash_sender(request):
+    r"""Returns the digest of a download, GET handler for '/hash/{id}'.
+
+    The digest is returned as JSON once the download has been written.
+    """
+    digest = request.app["digests"].get(request.match_info["id"])
+    if digest is None:
+        raise web.HTTPNotFound(text="Unknown digest!")
+    try:
+        result = await asyncio.wait_for(asyncio.shield(digest), 60)
+    except asyncio.TimeoutError:
+        result = None
+    request.app["digests"].pop(request.match_info["id"], None)
+    if result is None:
+        raise web.HTTPNotFound(text="The download was not completed!")
+    return web.json_response({"digest": result})
+
+
+def _get_file_info(file_path, file_name=None, compress="false"):
+    r"""Describes a file to be streamed with `_stream_file`.
+
+    Parameters
+    ----------
+    file_path : str
+        Path of the file.
+    file_name : str or None
+        File name to be assigned to the file, its own name by default.
+    compress : str, default="false"
+        Whether the file is a Zip Archive of the shared content, 'true' or
+        'false'.
+
+    Returns
+    -------
+    file_info : dict
+        The `path`, `name`, `size`, `mtime`, validator (`etag`) and
+        `compress` flag of the file.
+    """
+    file_path = os.path.realpath(file_path)
+    file_stat = os.stat(file_path)
+    return {"path": file_path,
+            "name": file_name or file_path.split(os.path.sep)[-1],
+            "size": file_stat.st_size, "mtime": file_stat.st_mtime,
+            "etag": "\"{:x}-{:x}\"".format(file_stat.st_size,
+                                           file_stat.st_mtime_ns),
+            "compress": compress}
+
+
+async def _stream_file(request, file_info):
+    r"""Streams a file, or a byte range of it, in response to a request.
+
+    Parameters
+    ----------
+    request : aiohttp.web.Request
+        Download request, GET or HEAD.
+    file_info : dict
+        Description of the file, see `_get_file_info`.
+
+    Returns
+    -------
+    response : aiohttp.web.StreamResponse
+        Response streaming the file.
+    """
+    address = ""
+    peername = request.transport.get_extra_info("peername")
+    if peername is not None:
+        host = peername[0]
+        address = " (by " + str(host) + ")"
+    response = web.StreamResponse()
+    file_path = file_info["path"]
+    file_name = file_info["name"]
+    file_size = file_info["size"]
+    etag = file_info["etag"]
+    header = "attachment; filename=\"{}\"; size={}" \
+             .format(file_name, file_size)
+    response.headers["content-type"] = "application/octet-stream"
+    response.headers["content-disposition"] = header
+    response.last_modified = file_info["mtime"]
+    byte_range = None
+    last_modified = response.headers["last-modified"]
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range", etag)
+    codec = "store"
+    if range_header is None:
+        codec = await _get_codec(request)
+    response.headers["airshare-compress"] = get_compress_header(
+        file_info["compress"] == "true", codec)
+    if codec == "store":
+        response.headers["accept-ranges"] = "bytes"
+        response.headers["etag"] = etag
+    if range_header is not None and if_range in (etag, last_modified):
+        try:
+            byte_range = _get_byte_range(range_header, file_size)
+        except ValueError:
+            response.set_status(416)
+            response.headers["content-range"] = "bytes */" + str(file_size)
+            response.headers["content-length"] = "0"
+            await response.prepare(request)
+            await response.write_eof()
+            return response
+    if byte_range is None:
+        first, last = 0, file_size - 1
+        if request.method == "GET":
+            print("Content requested" + address + ", transferring!")
+        elif request.method == "HEAD":
+            print("Content examined" + address + "!")
+    else:
+        first, last = byte_range
+        response.set_status(206)
+        response.headers["content-range"] = "bytes {}-{}/{}" \
+                                            .format(first, last, file_size)
+    if codec == "store":
+        response.headers["content-length"] = str(last - first + 1)
+    else:
+        response.enable_chunked_encoding()
+    hasher, digest = _get_hasher(request, response)
+    await response.prepare(request)
+    if request.method == "GET":
+        start = monotonic()
+        block_cache = request.app["block_cache"]
+        if codec == "store" and hasher is None:
+            size = last - first + 1
+            await _send_file(request, response, file_path, first, size)
+        else:
+            if block_cache is not None:
+                stream = block_cache.read(file_path, etag, first,
+                                          last - first + 1)
+            else:
+                stream = _read_file(file_path, offset=first,
+                                    count=last - first + 1)
+            if hasher is not None:
+                stream = _hash_stream(stream, hasher)
+            if codec != "store":
+                stream = _encode_stream(stream, codec)
+            size = await _write_stream(response, stream, hasher, digest)
+        if byte_range is None and size >= 1024 * 1024:
+            request.app["link_speeds"][request.remote] = \
+                size / max(monotonic() - start, 1e-3)
+    await response.write_eof()
+    return response
+
+
 async def _file_stream_sender(request):
     """Streams a file from the server, GET handler for route '/download'."""
+    return await _stream_file(request, request.app["file"])
+
+
+def _get_file_list(files):
+    r"""Lists the files of a browsable share.
+
+    Parameters
+    ----------
+    files : list
+        List of paths of the shared files and directories.
+
+    Returns
+    -------
+    file_list : list
+        The relative `path` (with '/' separators, as the files would be
+        unzipped), `size` and `mtime` of every file.
+    file_paths : dict
+        Dictionary of the paths of the files, by relative path.
+    """
+    file_list = []
+    file_paths = {}
+    for file_path, relative_path in get_file_members(files):
+        try:
+            file_stat = os.stat(file_path)
+        except FileNotFoundError:
+            continue
+        file_list.append({"path": relative_path, "size": file_stat.st_size,
+                          "mtime": file_stat.st_mtime})
+        file_paths[relative_path] = file_path
+    return file_list, file_paths
+
+
+async def _scan_files(app):
+    r"""Lists the shared files of an application, and keeps their paths in
+    its 'file_paths' holder."""
+    file_paths = app["file_paths"]
+    file_paths["scanned"] = monotonic()
+    loop = asyncio.get_event_loop()
+    file_list, file_paths["paths"] = await loop.run_in_executor(
+        None, _get_file_list, app["zip_files"])
+    return file_list
+
+
+async def _file_list_sender(request):
+    """Lists the shared files as JSON, GET handler for route '/files'."""
+    file_list = await _scan_files(request.app)
+    return web.json_response({"files": file_list})
+
+
+async def _browse_file_sender(request):
+    r"""Streams a shared file by its relative path, GET handler for route
+    '/download/{path}'.
+
+    Files that were not listed are looked up by listing the files again, at
+    most once every few seconds, so that requests for missing files do not
+    walk the shared directories each time.
+    """
+    loop = asyncio.get_event_loop()
+    path = request.match_info["path"]
+    file_paths = request.app["file_paths"]
+    if path not in file_paths["paths"] and (
+            file_paths["scanned"] is None
+            or monotonic() - file_paths["scanned"] >= _RESCAN_INTERVAL):
+        await _scan_files(request.app)
+    if path not in file_paths["paths"]:
+        raise web.HTTPNotFound(text="File not found: " + path)
+    try:
+        file_info = await loop.run_in_executor(
+            None, _get_file_info, file_paths["paths"][path])
+    except FileNotFoundError:
+        raise web.HTTPNotFound(text="File not found: " + path)
+    return await _stream_file(request, file_info)
+
+
+def _get_archive_formats(headers):
+    r"""Lists the archive formats in a peer's 'airshare-archive' header."""
+    accepted = headers.get("airshare-archive", "zip").split(",")
+    return [x.strip().lower() for x in accepted]
+
+
+async def _zip_stream_sender(request):
+    r"""Streams an archive as it is built, GET handler for '/download'.
+
+    The archive is a Tar Archive if the sender shares one and the receiver
+    accepts it, otherwise a Zip Archive.
+    """
     address = ""
     peername = request.transport.get_extra_info("peername")
     if peername is not None:
-        host, _ = peername
+        host = peername[0]
         address = " (by " + str(host) + ")"
-    if request.method == "GET":
-        print("Content requested" + address + ", transferring!")
-    elif request.method == "HEAD":
+    response = web.StreamResponse()
+    archive, name = "zip", request.app["file_name"]
+    if request.app["tar"] and "tar" in _get_archive_formats(request.headers):
+        archive, name = "tar", get_tar_stream(request.app["zip_files"])[1]
+    header = "attachment; filename=\"{}\"".format(name)
+    codec = await _get_codec(request)
+    response.headers["content-type"] = "application/octet-stream"
+    response.headers["content-disposition"] = header
+    response.headers["airshare-compress"] = get_compress_header(archive,
+                                                                codec)
+    hasher, digest = _get_hasher(request, response)
+    if request.method == "HEAD":
         print("Content examined" + address + "!")
+        await response.prepare(request)
+        return response
+    print("Content requested" + address + ", transferring!")
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    if archive == "tar":
+        stream, _ = get_tar_stream(request.app["zip_files"])
+    else:
+        stream, _ = get_zip_stream(request.app["zip_files"],
+                                   compress=request.app["zip_compress"])
+    if hasher is not None:
+        stream = _hash_stream(stream, hasher)
+    start = monotonic()
+    size = await _write_stream(response, _encode_stream(stream, codec),
+                               hasher, digest)
+    if size >= 1024 * 1024:
+        request.app["link_speeds"][request.remote] = \
+            size / max(monotonic() - start, 1e-3)
+    await response.write_eof()
+    return response
+
+
+async def _sync_stream_sender(request):
+    r"""Streams a sync stream of the files, POST handler for '/sync'.
+
+    The chunks held by the receiver, listed in the JSON body of the request,
+    are left out of the stream.
+    """
+    address = ""
+    peername = request.transport.get_extra_info("peername")
+    if peername is not None:
+        host = peername[0]
+        address = " (by " + str(host) + ")"
+    chunks = (await request.json()).get("chunks", [])
+    stream, name = get_sync_stream(request.app["zip_files"], chunks,
+                                   cache=request.app["manifest_cache"])
+    codec = await _get_codec(request)
     response = web.StreamResponse()
-    file_path = request.app["file_path"]
-    file_name = request.app["file_name"]
-    file_size = str(request.app["file_size"])
-    header = "attachment; filename=\"{}\"; size={}" \
-             .format(file_name, file_size)
+    header = "attachment; filename=\"{}\"".format(name)
     response.headers["content-type"] = "application/octet-stream"
-    response.headers["content-length"] = str(request.app["file_size"])
     response.headers["content-disposition"] = header
-    response.headers["airshare-compress"] = request.app["compress"]
+    response.headers["airshare-compress"] = get_compress_header("sync",
+                                                                codec)
+    hasher, digest = _get_hasher(request, response)
+    if hasher is not None:
+        stream = _hash_stream(stream, hasher)
+    print("Content requested" + address + ", syncing!")
+    response.enable_chunked_encoding()
     await response.prepare(request)
-    with open(file_path, "rb") as f:
-        chunk = f.read(8192)
-        while chunk:
-            await response.write(chunk)
-            chunk = f.read(8192)
+    await _write_stream(response, _encode_stream(stream, codec), hasher,
+                        digest)
+    await response.write_eof()
     return response
 
 
@@ -91,27 +701,431 @@ async def _is_airshare_file_sender(request):
 # Sender functions
 
 
-def send(*, code, file, compress=False):
-    r"""Send file(s) or directories to a receiving server.
+def _get_zip_stats(zip_file_path, seconds):
+    r"""Describes the files and speed of building a Zip Archive.
+
+    Parameters
+    ----------
+    zip_file_path : str
+        Path of the Zip Archive.
+    seconds : float
+        Time taken to build the Zip Archive.
+
+    Returns
+    -------
+    stats : str
+        Number and size of the archived files and the rates they were
+        archived at, in files/s and bytes/s.
+    """
+    with ZipFile(zip_file_path) as zip_archive:
+        members = zip_archive.infolist()
+    size = sum(member.file_size for member in members)
+    seconds = max(seconds, 1e-3)
+    return "{} files, {} at {:.0f} files/s, {}/s".format(
+        len(members), humanize.naturalsize(size), len(members) / seconds,
+        humanize.naturalsize(size / seconds))
+
+
+async def _iterate_digest(hasher):
+    r"""Asynchronously yields the hex digest of a hasher, once it is asked
+    for."""
+    yield hasher.hexdigest().encode()
+
+
+def _build_zip_file(files, compress, cache=None):
+    r"""Builds a Zip Archive of files to send, or reuses a cached one.
+
+    Parameters
+    ----------
+    files : list
+        List of paths of files and directories to archive.
+    compress : boolean
+        Flag to enable or disable compression (Deflate).
+    cache : object or None
+        Manifest cache to reuse the archive from, see
+        `utils.get_manifest_cache`.
+
+    Returns
+    -------
+    zip_file_path : str
+        Path of the Zip Archive.
+    zip_file_name : str
+        File name to be assigned to the Zip Archive.
+    """
+    hits = 0 if cache is None else cache.hits
+    print("Compressing...")
+    start = monotonic()
+    zip_file_path, name = get_zip_file(files, compress, cache)
+    if cache is not None and cache.hits > hits:
+        print("Reusing `" + name + "`, as the files are unchanged!")
+    else:
+        print("Compressed to `" + name + "` ("
+              + _get_zip_stats(zip_file_path, monotonic() - start) + ")!")
+    return zip_file_path, name
+
+
+def _get_multipart_body(files):
+    r"""Wraps streams of bytes as a multipart/form-data body of files.
+
+    Every file with a hasher is followed by an 'airshare-hash' field, which
+    holds the hex digest of the file once its field has been sent.
+
+    Parameters
+    ----------
+    files : list
+        List of the `(name, stream, hasher)` of the uploaded files, where
+        `stream` is an iterator yielding the contents of the file in chunks
+        of bytes, or the contents of a small file, and `hasher` is fed with
+        the contents as they are read, or None.
+
+    Returns
+    -------
+    body : aiohttp.MultipartWriter
+        Multipart/form-data body, streamed with chunked transfer encoding
+        unless all contents are given as bytes.
+    """
+    body = aiohttp.MultipartWriter("form-data")
+    for index, (name, stream, hasher) in enumerate(files):
+        header = "form-data; name=\"field{}\"; filename=\"{}\"" \
+                 .format(index, name.replace("\"", ""))
+        if not isinstance(stream, bytes):
+            stream = _iterate_stream(stream)
+        body.append(stream,
+                    {"content-type": "application/octet-stream",
+                     "content-disposition": header})
+        if hasher is not None:
+            body.append(_iterate_digest(hasher),
+                        {"content-type": "text/plain",
+                         "content-disposition":
+                             "form-data; name=\"airshare-hash\""})
+    return body
+
+
+def _get_client_session(limit=100):
+    r"""Creates a client session for uploads, without a total timeout.
+
+    Parameters
+    ----------
+    limit : int, default=100
+        Maximum number of simultaneous connections of the session.
+
+    Returns
+    -------
+    session : aiohttp.ClientSession
+        Client session with a bounded pool of keep-alive connections.
+    """
+    connector = aiohttp.TCPConnector(limit=limit)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def _upload(session, url, get_files, headers, retry_timeout=60):
+    r"""Uploads streams of bytes as files to a receiving server.
+
+    The body is only sent once the server accepts the upload, with 'Expect:
+    100-continue'. Uploads turned away with '503 Service Unavailable' and
+    'Retry-After' are retried after the given delay, until `retry_timeout`
+    runs out.
+
+    Parameters
+    ----------
+    session : aiohttp.ClientSession
+        Client session to upload with.
+    url : str
+        Base URL of the receiving server.
+    get_files : function
+        Function returning the list of the `(name, stream, hasher)` of the
+        files to upload, where `name` is the file name or relative path of
+        the file, `stream` an iterator yielding its contents in chunks of
+        bytes, or the contents of a small file, and `hasher` the hasher fed
+        with its contents, or None. Run in the default executor, once for
+        every attempt.
+    headers : dict
+        Additional headers of the upload request.
+    retry_timeout : float, default=60
+        Time in seconds after which an upload still turned away is given up,
+        and its '503' status code returned.
+
+    Returns
+    -------
+    status_code : int
+        Status code of upload POST request.
+    """
+    loop = asyncio.get_event_loop()
+    deadline = monotonic() + retry_timeout
+    while True:
+        files = await loop.run_in_executor(None, get_files)
+        body = _get_multipart_body(files)
+        async with session.post(url + "/upload", data=body, headers=headers,
+                                expect100=True) as r:
+            await r.read()
+            retry_after = r.headers.get("retry-after")
+            if r.status != 503 or retry_after is None:
+                return r.status
+        delay = int(retry_after) if retry_after.isdigit() else 1
+        if monotonic() + delay > deadline:
+            return r.status
+        await asyncio.sleep(delay)
+
+
+def _read_upload(name, file_path, codec, zip_files=None, deflate=False,
+                 archive="zip", chunks=(), algorithm=None, cache=None,
+                 manifest=None):
+    r"""Prepares a file, or an archive streamed as it is built, for upload.
+
+    Parameters
+    ----------
+    name : str
+        File name of the uploaded file.
+    file_path : str
+        Path of the file to upload, unless a Zip Archive is streamed.
+    codec : str
+        Codec to encode the file with.
+    zip_files : list or None
+        List of paths of the files and directories to stream a Zip Archive
+        of, instead of uploading a file.
+    deflate : boolean, default=False
+        Flag to deflate the files of the streamed Zip Archive.
+    archive : str, default="zip"
+        Format of the archive of `zip_files` to stream: 'zip', 'tar' or
+        'sync' (a sync stream).
+    chunks : iterable, default=()
+        Digests of the chunks held by the receiver, left out of a sync
+        stream.
+    algorithm : str or None
+        Hash algorithm to hash the file with as it is read, if any.
+    cache : object or None
+        Manifest cache of the chunk lists of a sync stream.
+    manifest : tuple or None
+        Manifest of a sync stream, see `utils.get_sync_manifest`.
+
+    Returns
+    -------
+    files : list
+        List of the `(name, stream, hasher)` of the file, where `stream` is
+        an iterator yielding its contents in chunks of bytes, and `hasher`
+        the hasher fed with them, or None.
+    """
+    if zip_files is not None and archive == "sync":
+        stream, _ = get_sync_stream(zip_files, chunks, cache=cache,
+                                    manifest=manifest)
+    elif zip_files is not None and archive == "tar":
+        stream, _ = get_tar_stream(zip_files)
+    elif zip_files is not None:
+        stream, _ = get_zip_stream(zip_files, compress=deflate)
+    else:
+        stream = _read_file(file_path)
+    hasher = None
+    if algorithm is not None:
+        hasher = get_hasher(algorithm)
+        stream = _hash_stream(stream, hasher)
+    if codec != "store":
+        stream = _encode_stream(stream, codec)
+    return [(name, stream, hasher)]
+
+
+def _get_upload_batches(members, batch, count=256, size=16 * 1024 * 1024):
+    r"""Groups files into the batches they are uploaded in.
+
+    Parameters
+    ----------
+    members : list
+        List of the `(file_path, relative_path)` of the files to upload.
+    batch : boolean
+        Flag to upload multiple files in a request. Without it, every batch
+        holds a single file.
+    count : int, default=256
+        Maximum number of files in a batch.
+    size : int, default=16777216
+        Size in bytes after which a batch takes no more files.
+
+    Returns
+    -------
+    batches : list
+        List of batches, each a list of the `(file_path, relative_path,
+        file_size)` of its files.
+    """
+    batches = []
+    batch_size = size
+    for file_path, relative_path in members:
+        file_size = os.path.getsize(file_path)
+        if not batch or batch_size >= size or len(batches[-1]) >= count:
+            batches.append([])
+            batch_size = 0
+        batches[-1].append((file_path, relative_path, file_size))
+        batch_size += file_size
+    return batches
+
+
+def _read_upload_batch(batch, codec, algorithm=None):
+    r"""Prepares the files of a batch for upload.
+
+    Files smaller than a chunk are read (and encoded) in one go, larger
+    files are streamed as they are uploaded.
+
+    Parameters
+    ----------
+    batch : list
+        List of the `(file_path, relative_path, file_size)` of the files.
+    codec : str
+        Codec to encode the files with.
+    algorithm : str or None
+        Hash algorithm to hash the files with as they are read, if any.
+
+    Returns
+    -------
+    files : list
+        List of the `(relative_path, stream, hasher)` of the files, where
+        `stream` is an iterator yielding chunks of bytes or the contents of
+        the file, and `hasher` the hasher fed with them, or None.
+    """
+    files = []
+    for file_path, relative_path, file_size in batch:
+        stream = _read_file(file_path)
+        hasher = None
+        if algorithm is not None:
+            hasher = get_hasher(algorithm)
+            stream = _hash_stream(stream, hasher)
+        if codec != "store":
+            stream = _encode_stream(stream, codec)
+        if file_size < 1024 * 1024:
+            stream = b"".join(stream)
+        files.append((relative_path, stream, hasher))
+    return files
+
+
+async def _upload_files(session, url, members, codec, headers, connections,
+                        batch=False, algorithm=None):
+    r"""Uploads files concurrently, in batches of files per request.
+
+    Parameters
+    ----------
+    session : aiohttp.ClientSession
+        Client session to upload with.
+    url : str
+        Base URL of the receiving server.
+    members : list
+        List of the `(file_path, relative_path)` of the files to upload.
+    codec : str
+        Codec to encode the files with.
+    headers : dict
+        Additional headers of the upload requests.
+    connections : int
+        Maximum number of requests made at the same time.
+    batch : boolean, default=False
+        Flag to upload multiple files in a request, if the receiving server
+        supports it. Without it, every file is uploaded with its own request.
+    algorithm : str or None
+        Hash algorithm to hash the files with as they are read, if any.
+
+    Returns
+    -------
+    status_code : int
+        Highest status code of the upload POST requests.
+    """
+    loop = asyncio.get_event_loop()
+    batches = await loop.run_in_executor(None, _get_upload_batches, members,
+                                         batch)
+    batches = iter(batches)
+    status_codes = []
+    # The receiver places the directories of all the requests of the upload
+    # alike.
+    headers = dict(headers, **{"airshare-upload-id": uuid4().hex})
+
+    async def upload():
+        for files in batches:
+            get_files = partial(_read_upload_batch, files, codec, algorithm)
+            status_codes.append(await _upload(session, url, get_files,
+                                              headers))
+
+    await asyncio.gather(*[upload() for _ in range(connections)])
+    return max(status_codes)
+
+
+async def send_async(*, code, file, compress=False, stream=False, tar=False,
+                     sync=False, codec="store", connections=None, verify=None,
+                     hash_algorithm=None, manifest_cache=False, session=None,
+                     lookup_timeout=3):
+    r"""Send file(s) or directories to a receiving server, asynchronously.
+
+    The probe of the receiving server and the upload share the connections of
+    one client session, and the content is streamed from disk in chunks of
+    1 MiB read in the default executor.
 
     Parameters
     ----------
     code : str
-        Identifying code for the Airshare receiving server.
+        Identifying code for the Airshare receiving server, or its `host:port`
+        to reach it directly, without a Multicast-DNS lookup.
     file : str or list or None
         Relative path or list of paths of the files or directories to serve.
         For multiple files or directories, contents are automatically zipped.
     compress : boolean, default=False
-        Flag to enable or disable compression (Zip).
-        Effective when only one file is given.
+        Flag to enable or disable compression (Zip). Files are deflated in
+        parallel over all CPU cores, except those in formats that are already
+        compressed. Without it, multiple files or directories are zipped
+        without compression.
+    stream : boolean, default=False
+        Flag to build the Zip Archive while uploading it, instead of writing
+        it to a temporary file first. Effective when the files are zipped.
+    tar : boolean, default=False
+        Flag to archive the files as a Tar Archive, streamed while uploading
+        it and extracted as it arrives, with the permissions and
+        modification times of the files, instead of a Zip Archive. The
+        members are not compressed; with `compress`, the upload is encoded
+        with 'zstd' (or 'deflate') unless another codec is given. Receivers
+        that do not support Tar Archives get a streamed Zip Archive.
+    sync : boolean, default=False
+        Flag to sync the files into the directory of the same name at the
+        receiver (e.g. `dir` for `dir.zip`), like rsync: only the
+        content-defined chunks that its files do not already hold are sent,
+        and the synced directory is written next to it, or replaces it if
+        the receiver is set to. Compression works as with `tar`. Receivers
+        that do not accept sync uploads (see `receiver.receive_server`) get
+        the archive otherwise sent.
+    codec : str, default="store"
+        Codec to encode the upload with: 'store', 'deflate', 'zstd' or 'lz4',
+        optionally with a level ('zstd:9'), or 'auto' to select one from a
+        sample of the content. Codecs that the receiver cannot decode fall
+        back to 'store'.
+    connections : int or None
+        If given, multiple files or directories are uploaded without zipping,
+        as individual files over up to this many concurrent connections, in
+        batches of files per request if the receiver supports it. The
+        receiver recreates them with their relative paths.
+    verify : boolean or None, default=None
+        Flag to hash every file as it is read and send the digest after it,
+        for the receiver to verify the file against, if it supports it. By
+        default, files are only verified with a fast algorithm ('xxh3_128'
+        or 'blake3', from the optional `xxhash` and `blake3` packages)
+        available to both, or with `hash_algorithm` if it is given, as the
+        other algorithms hash slower than fast networks transfer.
+    hash_algorithm : str or None
+        Hash algorithm to verify files with ('xxh3_128', 'blake3', 'blake2b'
+        or 'sha256'), if the receiver supports it. By default, the fastest
+        algorithm available to both is used.
+    manifest_cache : boolean, default=False
+        Flag to keep the Zip Archive and the chunk lists of the files in the
+        on-disk manifest cache (see `utils.get_manifest_cache`), and to reuse
+        them from earlier uploads for as long as the files are unchanged.
+    session : aiohttp.ClientSession or None
+        Client session to reuse the keep-alive connections of across uploads.
+        If not given, a session is created and closed for this upload.
+    lookup_timeout : float, default=3
+        Time in seconds to wait for the receiving server to answer the lookup
+        of its code.
 
     Returns
     -------
     status_code : int
         Status code of upload POST request.
     """
-    info = get_service_info(code)
-    if info is None:
+    if connections is not None and connections < 1:
+        raise ValueError("The parameter `connections` must be at least 1!")
+    loop = asyncio.get_event_loop()
+    url = await loop.run_in_executor(None, get_service_url, code,
+                                     lookup_timeout)
+    if url is None:
         raise CodeNotFoundError(code)
     if type(file) is str:
         if file == "":
@@ -122,51 +1136,207 @@ def send(*, code, file, compress=False):
         file = None
     if file is None:
         raise ValueError("The parameter `file` must be non-empty!")
-    if compress or len(file) > 1 or os.path.isdir(file[0]):
+    if codec != "auto":
+        get_encoder(codec)
+    if hash_algorithm is not None:
+        get_hasher(hash_algorithm)
+        if verify is None:
+            verify = True
+    cache = None
+    if manifest_cache:
+        cache = await loop.run_in_executor(None, get_manifest_cache)
+    files = file
+    zip_files = None
+    members = None
+    deflate = bool(compress)
+    if (tar or sync) and deflate:
+        deflate = False
+        if codec == "store":
+            codec = "zstd" if "zstd" in get_codecs() else "deflate"
+    is_multiple = len(file) > 1 or os.path.isdir(file[0])
+    if compress or sync or (is_multiple and connections is None):
         compress = "true"
-        print("Compressing...")
-        file, name = get_zip_file(file)
-        print("Compressed to `" + name + "`!")
+        if stream or tar or sync:
+            zip_files, name = file, get_zip_stream(file)[1]
+        else:
+            file, name = await loop.run_in_executor(None, _build_zip_file,
+                                                    file, deflate, cache)
+    elif is_multiple:
+        compress = "false"
+        members = await loop.run_in_executor(None, list,
+                                             get_file_members(file))
+        if not members:
+            raise ValueError("The parameter `file` has no files to upload!")
+        name = members[0][1].split("/")[0]
     else:
         compress = "false"
         file, name = file[0], file[0].split(os.path.sep)[-1]
-    ip = socket.inet_ntoa(info.addresses[0])
-    url = "http://" + ip + ":" + str(info.port)
-    airshare_type = requests.get(url + "/airshare")
-    if airshare_type.text != "Upload Receiver":
-        raise IsNotReceiverError(code)
-    m = MultipartEncoder(fields={"field0": (name, open(file, "rb"))})
-    headers = {"content-type": m.content_type, "airshare-compress": compress}
-    r = requests.post(url + "/upload", data=m, headers=headers)
-    print("Uploaded `" + name + "` to Airshare `" + code + "`!")
-    return r.status_code
-
-
-def send_server(*, code, text=None, file=None, compress=False, port=8000):
-    r"""Serves a file or text and registers it as a Multicast-DNS service.
+    close_session = session is None
+    if close_session:
+        session = _get_client_session(connections or 100)
+    try:
+        async with session.get(url + "/airshare") as r:
+            airshare_type = await r.text()
+            accepted = r.headers.get("airshare-compress", "store")
+            batch = r.headers.get("airshare-upload") == "batch"
+            formats = _get_archive_formats(r.headers)
+            algorithms = r.headers.get("airshare-hash", "").split(",")
+        if airshare_type != "Upload Receiver":
+            raise IsNotReceiverError(code)
+        accepted = [x.strip().lower() for x in accepted.split(",")]
+        if codec == "auto":
+            sample = await loop.run_in_executor(None, get_compression_sample,
+                                                files)
+            codec = await loop.run_in_executor(None, select_codec, sample,
+                                               None, accepted)
+        elif codec.partition(":")[0] not in accepted:
+            codec = "store"
+        archive = compress == "true"
+        chunks, manifest = (), None
+        if zip_files is not None and sync and "sync" in formats:
+            archive, name = "sync", get_sync_stream(zip_files)[1]
+            manifest = await loop.run_in_executor(None, get_sync_manifest,
+                                                  zip_files, cache)
+            body = {"name": os.path.splitext(name)[0],
+                    "chunks": list(manifest[1])}
+            async with session.post(url + "/sync", json=body) as r:
+                r.raise_for_status()
+                chunks = (await r.json())["chunks"]
+        elif zip_files is not None and tar and "tar" in formats:
+            archive, name = "tar", get_tar_stream(zip_files)[1]
+        headers = {"airshare-compress": get_compress_header(archive, codec)}
+        algorithm = None
+        if verify is not False:
+            algorithm = select_hash_algorithm(algorithms, hash_algorithm,
+                                              fast=verify is None)
+        if algorithm is not None:
+            headers["airshare-hash"] = algorithm
+        if members is not None:
+            status_code = await _upload_files(session, url, members, codec,
+                                              headers, connections, batch,
+                                              algorithm)
+        else:
+            get_files = partial(_read_upload, name, file, codec, zip_files,
+                                deflate, archive, chunks, algorithm, cache,
+                                manifest)
+            status_code = await _upload(session, url, get_files, headers)
+    finally:
+        if close_session:
+            await session.close()
+        if cache is not None and zip_files is None and compress == "true":
+            cache.release(file)
+    count = ""
+    if members is not None:
+        count = " (" + str(len(members)) + " files)"
+    print("Uploaded `" + name + "`" + count + " to Airshare `" + code + "`!")
+    return status_code
+
+
+def send(*, code, file, compress=False, stream=False, tar=False, sync=False,
+         codec="store", connections=None, verify=None, hash_algorithm=None,
+         manifest_cache=False, lookup_timeout=3):
+    r"""Send file(s) or directories to a receiving server.
+
+    Runs `send_async` in a new event loop.
 
     Parameters
     ----------
     code : str
-        Identifying code for the Airshare service and server.
-    text : str or None
-        String value to be shared.
-        If both `text` and `files` are given, `text` will be shared.
-        Must be given if `files` is not given.
+        Identifying code for the Airshare receiving server, or its `host:port`
+        to reach it directly, without a Multicast-DNS lookup.
     file : str or list or None
-        Relative path or list of paths of the files or directories to serve. If
-        multiple files or directories are given, the contents are automatically
-        zipped. If not given or both `files` and `text` are given, `text` will
-        be shared. Must be given if `text` is not given.
+        Relative path or list of paths of the files or directories to serve.
+        For multiple files or directories, contents are automatically zipped.
     compress : boolean, default=False
-        Flag to enable or disable compression (Zip).
-        Effective when only one file is given.
-    port : int, default=8000
-        Port number at which the server is hosted on the device.
+        Flag to enable or disable compression (Zip). Files are deflated in
+        parallel over all CPU cores, except those in formats that are already
+        compressed. Without it, multiple files or directories are zipped
+        without compression.
+    stream : boolean, default=False
+        Flag to build the Zip Archive while uploading it, instead of writing
+        it to a temporary file first. Effective when the files are zipped.
+    tar : boolean, default=False
+        Flag to archive the files as a Tar Archive, streamed while uploading
+        it and extracted as it arrives, with the permissions and
+        modification times of the files, instead of a Zip Archive. The
+        members are not compressed; with `compress`, the upload is encoded
+        with 'zstd' (or 'deflate') unless another codec is given. Receivers
+        that do not support Tar Archives get a streamed Zip Archive.
+    sync : boolean, default=False
+        Flag to sync the files into the directory of the same name at the
+        receiver (e.g. `dir` for `dir.zip`), like rsync: only the
+        content-defined chunks that its files do not already hold are sent,
+        and the synced directory is written next to it, or replaces it if
+        the receiver is set to. Compression works as with `tar`. Receivers
+        that do not accept sync uploads (see `receiver.receive_server`) get
+        the archive otherwise sent.
+    codec : str, default="store"
+        Codec to encode the upload with: 'store', 'deflate', 'zstd' or 'lz4',
+        optionally with a level ('zstd:9'), or 'auto' to select one from a
+        sample of the content. Codecs that the receiver cannot decode fall
+        back to 'store'.
+    connections : int or None
+        If given, multiple files or directories are uploaded without zipping,
+        as individual files over up to this many concurrent connections, in
+        batches of files per request if the receiver supports it. The
+        receiver recreates them with their relative paths.
+    verify : boolean or None, default=None
+        Flag to hash every file as it is read and send the digest after it,
+        for the receiver to verify the file against, if it supports it. By
+        default, files are only verified with a fast algorithm ('xxh3_128'
+        or 'blake3', from the optional `xxhash` and `blake3` packages)
+        available to both, or with `hash_algorithm` if it is given, as the
+        other algorithms hash slower than fast networks transfer.
+    hash_algorithm : str or None
+        Hash algorithm to verify files with ('xxh3_128', 'blake3', 'blake2b'
+        or 'sha256'), if the receiver supports it. By default, the fastest
+        algorithm available to both is used.
+    manifest_cache : boolean, default=False
+        Flag to keep the Zip Archive and the chunk lists of the files in the
+        on-disk manifest cache (see `utils.get_manifest_cache`), and to reuse
+        them from earlier uploads for as long as the files are unchanged.
+    lookup_timeout : float, default=3
+        Time in seconds to wait for the receiving server to answer the lookup
+        of its code.
+
+    Returns
+    -------
+    status_code : int
+        Status code of upload POST request.
     """
-    info = get_service_info(code)
-    if info is not None:
-        raise CodeExistsError(code)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(send_async(
+            code=code, file=file, compress=compress, stream=stream, tar=tar,
+            sync=sync, codec=codec, connections=connections, verify=verify,
+            hash_algorithm=hash_algorithm, manifest_cache=manifest_cache,
+            lookup_timeout=lookup_timeout))
+    finally:
+        loop.close()
+
+
+def _get_send_app(*, text=None, file=None, compress=False, stream=False,
+                  tar=False, sync=False, codec="store", manifest_cache=False,
+                  browse=False, broadcast=False):
+    r"""Builds the application serving a file or text.
+
+    Parameters are as for `send_server`, which serves the application on
+    its own, while `daemon.daemon_server` serves many of them on one port.
+
+    Returns
+    -------
+    app : aiohttp.web.Application
+        Application serving the file or text.
+    content : str
+        The text, or the name of the file served.
+    file_size : str
+        Human readable size of the file, in parentheses, if it is known.
+    """
+    if codec != "auto":
+        get_encoder(codec)
+    if (tar or sync) and compress and codec == "store":
+        codec = "zstd" if "zstd" in get_codecs() else "deflate"
     if file is not None:
         if type(file) is str:
             if file == "":
@@ -177,43 +1347,214 @@ def send_server(*, code, text=None, file=None, compress=False, port=8000):
             file = None
     content = text or file
     name = None
+    zip_files = None
+    archive = None
+    cache = get_manifest_cache() if manifest_cache else None
     if content is None:
         raise ValueError("Either `file` or `text` (keyword arguments) must be"
                          + " given and non-empty!")
     elif text is None and file is not None:
-        if compress or len(file) > 1 or os.path.isdir(file[0]):
+        if compress or sync or len(file) > 1 or os.path.isdir(file[0]):
+            deflate = bool(compress) and not (tar or sync)
             compress = "true"
-            print("Compressing...")
-            content, name = get_zip_file(file)
-            print("Compressed to `" + name + "`!")
+            if stream or tar or sync or browse:
+                zip_files, name = file, get_zip_stream(file)[1]
+            else:
+                content, name = _build_zip_file(file, deflate, cache)
+                if cache is not None:
+                    archive = content
         else:
             compress = "false"
             content = file[0]
-    addresses = [get_local_ip_address()]
-    register_service(code, addresses, port)
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    app = web.Application()
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["codec"] = codec
+    app["link_speeds"] = {}
+    app["digests"] = OrderedDict()
+    app["block_cache"] = None
+    if broadcast:
+        app["block_cache"] = _BlockCache(_BROADCAST_CACHE_SIZE)
+    app["manifest_cache"] = cache
+    # Archive of the manifest cache that is served, released along with the
+    # application.
+    app["archive"] = archive
     file_size = ""
     if text is not None:
         app["text"] = content
         app.router.add_get(path="/", handler=_text_page)
         app.router.add_get(path="/text", handler=_text_sender)
         app.router.add_get(path="/airshare", handler=_is_airshare_text_sender)
-    elif file:
-        app["file_path"] = os.path.realpath(content)
-        app["file_name"] = name or app["file_path"].split(os.path.sep)[-1]
-        app["file_size"] = os.stat(app["file_path"]).st_size
+    elif zip_files is not None:
+        app["zip_files"] = zip_files
+        app["zip_compress"] = deflate
+        app["tar"] = tar
+        app["file_name"] = name
         app["compress"] = compress
-        file_size = " (" + humanize.naturalsize(app["file_size"]) + ")"
-        content = app["file_name"]
+        content = name
+        if codec == "auto":
+            app["codec_profile"] = get_codec_profile(
+                get_compression_sample(zip_files))
+        app.router.add_get(path="/", handler=_download_page)
+        app.router.add_get(path="/airshare", handler=_is_airshare_file_sender)
+        app.router.add_get(path="/download", handler=_zip_stream_sender)
+        app.router.add_get(path="/hash/{id}", handler=_hash_sender)
+        if sync:
+            app.router.add_post(path="/sync", handler=_sync_stream_sender)
+        if browse:
+            # Paths of the shared files by relative path, and when they were
+            # last listed.
+            app["file_paths"] = {"paths": {}, "scanned": None}
+            app.router.add_get(path="/files", handler=_file_list_sender)
+            app.router.add_get(path="/download/{path:.+}",
+                               handler=_browse_file_sender)
+    elif file:
+        app["file"] = _get_file_info(content, name, compress)
+        file_size = " (" + humanize.naturalsize(app["file"]["size"]) + ")"
+        content = app["file"]["name"]
+        if codec == "auto":
+            app["codec_profile"] = get_codec_profile(
+                get_compression_sample([app["file"]["path"]]))
         app.router.add_get(path="/", handler=_download_page)
         app.router.add_get(path="/airshare", handler=_is_airshare_file_sender)
         app.router.add_get(path="/download", handler=_file_stream_sender)
+        app.router.add_get(path="/hash/{id}", handler=_hash_sender)
+    return app, content, file_size
+
+
+def _send_worker(app, port):
+    r"""Serves an application at a port shared with other processes, target
+    of the worker processes of 'send_server'.
+
+    Every worker listens with its own socket bound with `SO_REUSEPORT`, so
+    that the kernel spreads incoming connections over the workers, and stops
+    if the parent process exits.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
     runner = web.AppRunner(app)
     loop.run_until_complete(runner.setup())
-    site = web.TCPSite(runner, "0.0.0.0", str(port))
+    site = web.TCPSite(runner, port=port, reuse_port=True)
     loop.run_until_complete(site.start())
+    parent = os.getppid()
+
+    def check_parent():
+        if os.getppid() != parent:
+            loop.stop()
+        else:
+            loop.call_later(1, check_parent)
+
+    check_parent()
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(runner.cleanup())
+
+
+def send_server(*, code, text=None, file=None, compress=False, port=8000,
+                stream=False, tar=False, sync=False, codec="store",
+                manifest_cache=False, browse=False, broadcast=False,
+                workers=1):
+    r"""Serves a file or text and registers it as a Multicast-DNS service.
+
+    Parameters
+    ----------
+    code : str
+        Identifying code for the Airshare service and server.
+    text : str or None
+        String value to be shared.
+        If both `text` and `files` are given, `text` will be shared.
+        Must be given if `files` is not given.
+    file : str or list or None
+        Relative path or list of paths of the files or directories to serve. If
+        multiple files or directories are given, the contents are automatically
+        zipped. If not given or both `files` and `text` are given, `text` will
+        be shared. Must be given if `text` is not given.
+    compress : boolean, default=False
+        Flag to enable or disable compression (Zip). Files are deflated in
+        parallel over all CPU cores, except those in formats that are already
+        compressed. Without it, multiple files or directories are zipped
+        without compression.
+    port : int, default=8000
+        Port number at which the server is hosted on the device.
+    stream : boolean, default=False
+        Flag to build the Zip Archive for every download while sending it,
+        instead of writing it to a temporary file before sharing. Streamed
+        archives cannot be resumed or downloaded in segments. Effective when
+        the files are zipped.
+    tar : boolean, default=False
+        Flag to archive the files as a Tar Archive, streamed for every
+        download and extracted as it arrives, with the permissions and
+        modification times of the files, instead of a Zip Archive. The
+        members are not compressed; with `compress`, downloads are encoded
+        with 'zstd' (or 'deflate') unless another codec is given. Receivers
+        that do not support Tar Archives, and browsers, get a streamed Zip
+        Archive.
+    sync : boolean, default=False
+        Flag to let receivers sync the files into their directory of the
+        same name, like rsync: only the content-defined chunks that its
+        files do not already hold are sent. Other downloads get a streamed
+        archive. Compression works as with `tar`.
+    codec : str, default="store"
+        Codec to encode downloads with: 'store', 'deflate', 'zstd' or 'lz4',
+        optionally with a level ('zstd:9'), or 'auto' to select one per
+        download from a sample of the content and the link speed measured for
+        the receiver. Receivers that cannot decode the codec, and resumed or
+        segmented downloads, get the content as it is.
+    manifest_cache : boolean, default=False
+        Flag to keep the Zip Archive and the chunk lists of the files in the
+        on-disk manifest cache (see `utils.get_manifest_cache`), and to reuse
+        them when the same files are shared again unchanged, so that sharing
+        starts without archiving them again and downloads of the archive can
+        be resumed across restarts.
+    browse : boolean, default=False
+        Flag to also serve the files of multiple files or directories one by
+        one: '/files' lists them as JSON, with their relative paths, and
+        '/download/{path}' streams the file at a relative path, with support
+        for Range requests. The archive of all files is streamed as with
+        `stream`.
+    broadcast : boolean, default=False
+        Flag to serve many receivers at once from a shared in-memory cache
+        of the blocks of the shared file (256 MiB, least recently used), so
+        that every block of a file that is hashed or encoded for its
+        receivers is read once and written to all of the receivers that
+        download it at around the same time. Files that are neither are
+        still written with `sendfile`, whose reads the page cache shares.
+    workers : int, default=1
+        Number of processes serving the downloads. With more than one, the
+        process forks the workers, which share the port with `SO_REUSEPORT`
+        so that the kernel spreads the receivers over them, and owns the
+        Multicast-DNS service itself. Every worker keeps its own digests
+        and block cache. Only supported where processes can be forked with
+        `SO_REUSEPORT`, such as Linux and macOS.
+    """
+    if workers > 1 and not (hasattr(socket, "SO_REUSEPORT")
+                            and hasattr(os, "fork")):
+        raise ValueError("Multiple `workers` are not supported on this"
+                         + " platform!")
+    info = get_service_info(code)
+    if info is not None:
+        raise CodeExistsError(code)
+    app, content, file_size = _get_send_app(
+        text=text, file=file, compress=compress, stream=stream, tar=tar,
+        sync=sync, codec=codec, manifest_cache=manifest_cache, browse=browse,
+        broadcast=broadcast)
+    addresses = get_local_ip_addresses()
+    info = register_service(code, addresses, port)
+    processes = []
+    if workers > 1:
+        context = get_context("fork")
+        processes = [context.Process(target=_send_worker, args=(app, port))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+    else:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, port=port)
+        loop.run_until_complete(site.start())
     url_port = ""
     if port != 80:
         url_port = ":" + str(port)
@@ -224,10 +1565,28 @@ def send_server(*, code, text=None, file=None, compress=False, port=8000):
     print("`" + content + "`" + file_size + " available at " + ip
           + " and `http://" + code + ".local" + url_port + quit_msg)
     qr_code("http://" + ip)
-    loop.run_forever()
+    try:
+        if processes:
+            wait([process.sentinel for process in processes])
+            for process in processes:
+                if process.exitcode:
+                    raise OSError("A worker of the server exited with code "
+                                  + str(process.exitcode) + "!")
+        else:
+            loop.run_forever()
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+        unregister_service(info)
+        if app["archive"] is not None:
+            app["manifest_cache"].release(app["archive"])
 
 
-def send_server_proc(*, code, text=None, file=None, compress=False, port=8000):
+def send_server_proc(*, code, text=None, file=None, compress=False, port=8000,
+                     stream=False, tar=False, sync=False, codec="store",
+                     manifest_cache=False, browse=False, broadcast=False,
+                     workers=1):
     r"""Creates a process with 'send_server' as the target.
 
     Parameters
@@ -244,10 +1603,33 @@ def send_server_proc(*, code, text=None, file=None, compress=False, port=8000):
         zipped. If not given or both `files` and `text` are given, `text` will
         be shared. Must be given if `text` is not given.
     compress : boolean, default=False
-        Flag to enable or disable compression (Zip).
-        Effective when only one file is given.
+        Flag to enable or disable compression (Zip). Files are deflated in
+        parallel over all CPU cores, except those in formats that are already
+        compressed. Without it, multiple files or directories are zipped
+        without compression.
     port : int, default=8000
         Port number at which the server is hosted on the device.
+    stream : boolean, default=False
+        Flag to build the Zip Archive for every download while sending it,
+        instead of writing it to a temporary file before sharing.
+    tar : boolean, default=False
+        Flag to stream a Tar Archive of the files instead of a Zip Archive,
+        to receivers that support it.
+    sync : boolean, default=False
+        Flag to let receivers sync the files into their directory of the
+        same name, receiving only the chunks they do not hold.
+    codec : str, default="store"
+        Codec to encode downloads with: 'store', 'deflate', 'zstd', 'lz4' or
+        'auto'.
+    manifest_cache : boolean, default=False
+        Flag to reuse the archive and chunk lists of unchanged files from the
+        on-disk manifest cache.
+    browse : boolean, default=False
+        Flag to also list the files and serve them one by one.
+    broadcast : boolean, default=False
+        Flag to serve many receivers at once from a shared block cache.
+    workers : int, default=1
+        Number of processes serving the downloads, sharing the port.
 
     Returns
     -------
@@ -255,6 +1637,8 @@ def send_server_proc(*, code, text=None, file=None, compress=False, port=8000):
         A multiprocessing.Process object with 'send_server' as target.
     """
     kwargs = {"code": code, "file": file, "text": text, "compress": compress,
-              "port": port}
+              "port": port, "stream": stream, "tar": tar, "sync": sync,
+              "codec": codec, "manifest_cache": manifest_cache,
+              "browse": browse, "broadcast": broadcast, "workers": workers}
     process = Process(target=send_server, kwargs=kwargs)
     return process
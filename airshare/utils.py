@@ -1,25 +1,80 @@
 """Utility functions for Airshare."""
 
 
+import atexit
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from functools import lru_cache
+import hashlib
+import ifaddr
+import ipaddress
+import json
 import mimetypes
 import os
 import pyperclip
 import re
+import select
+import shutil
 import socket
+import stat
+import struct
+import tarfile
 import tempfile
-from time import strftime
-from zipfile import ZipFile
-from zeroconf import IPVersion, ServiceInfo, Zeroconf
+import threading
+from time import monotonic, strftime
+from zipfile import BadZipFile, ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
+import zlib
+from zeroconf import IPVersion, ServiceBrowser, ServiceInfo, \
+    ServiceStateChange, Zeroconf
 
 
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+from .exception import IntegrityError
 from .qrcode import ErrorCorrectLevel, QRCode
 
 
-__all__ = ["get_local_ip_address", "qr_code", "get_service_info",
-           "register_service", "get_zip_file", "unzip_file",
+__all__ = ["get_local_ip_address", "get_local_ip_addresses", "qr_code",
+           "get_zeroconf", "get_service_info", "get_service_address",
+           "get_service_url", "register_service", "unregister_service",
+           "close_zeroconf", "get_zip_file", "get_zip_stream", "unzip_file",
+           "get_unzip_writer", "get_tar_stream", "get_untar_writer",
+           "get_file_members", "get_file_chunks", "get_chunk_index",
+           "get_chunk_cache", "get_manifest_cache", "get_sync_manifest",
+           "get_sync_stream", "get_sync_writer",
+           "get_codecs",
+           "get_encoder", "get_decoder",
+           "get_compress_header", "parse_compress_header",
+           "get_compression_sample", "get_codec_profile", "select_codec",
+           "get_hash_algorithms", "get_hasher", "select_hash_algorithm",
            "get_clipboard_paths", "is_file_copyable"]
 
 
+_COMPRESSED_EXTENSIONS = {
+    ".7z", ".aac", ".apk", ".avi", ".br", ".bz2", ".docx", ".flac", ".gif",
+    ".gz", ".heic", ".jar", ".jpeg", ".jpg", ".lz4", ".m4a", ".m4v", ".mkv",
+    ".mov", ".mp3", ".mp4", ".odt", ".ogg", ".opus", ".png", ".pptx", ".rar",
+    ".tgz", ".webm", ".webp", ".whl", ".xlsx", ".xz", ".zip", ".zst"
+}
+
+
 # Local IP Address
 
 
@@ -39,6 +94,35 @@ def get_local_ip_address():
     return ip
 
 
+def get_local_ip_addresses():
+    r"""Obtains the device's local network IP addresses, IPv4 and IPv6.
+
+    Loopback and link-local addresses are left out. The address given by
+    `get_local_ip_address` comes first, for receivers that only connect to
+    the first address of a service.
+
+    Returns
+    -------
+    ips : list
+        Packed representations of the device's local IP Addresses, of 4
+        bytes for IPv4 and 16 bytes for IPv6.
+    """
+    ips = [get_local_ip_address()]
+    for adapter in ifaddr.get_adapters():
+        for adapter_ip in adapter.ips:
+            family, ip = socket.AF_INET, adapter_ip.ip
+            if isinstance(ip, tuple):
+                family, ip = socket.AF_INET6, ip[0]
+            address = ipaddress.ip_address(ip)
+            if address.is_loopback or address.is_link_local \
+                    or address.is_unspecified:
+                continue
+            ip = socket.inet_pton(family, ip)
+            if ip not in ips:
+                ips.append(ip)
+    return ips
+
+
 # QR Code Utility
 
 
@@ -59,26 +143,269 @@ def qr_code(url):
 # Zeroconf Utilities
 
 
-def get_service_info(code):
+_SERVICE_TYPE = "_airshare._http._tcp.local."
+
+
+class _ZeroconfManager:
+    """Process-wide Zeroconf instance, shared by all lookups and services.
+
+    Once a service is looked up, a browser of Airshare services keeps a
+    cache of their details up to date as they are added, updated and
+    removed, so that lookups of known services are answered from memory.
+    Only the browser fills the cache, as the records of a service that has
+    just been removed may still answer a query for a moment. Services are
+    resolved in their own threads, off the callbacks of the browser, and
+    every event of a service bumps its generation, so that a resolution
+    overtaken by a later event (e.g. a removal) is dropped.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._zeroconf = None
+        self._browser = None
+        self._services = {}
+        self._generations = {}
+
+    def get_zeroconf(self):
+        with self._lock:
+            if self._zeroconf is None:
+                try:
+                    self._zeroconf = Zeroconf(ip_version=IPVersion.All)
+                except OSError:
+                    self._zeroconf = Zeroconf(ip_version=IPVersion.V4Only)
+            return self._zeroconf
+
+    def _on_service_state_change(self, zeroconf, service_type, name,
+                                 state_change):
+        key = name.lower()
+        with self._lock:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+            if state_change is ServiceStateChange.Removed:
+                self._services.pop(key, None)
+                return
+        threading.Thread(target=self._resolve_service, daemon=True,
+                         args=(zeroconf, service_type, name,
+                               generation)).start()
+
+    def _resolve_service(self, zeroconf, service_type, name, generation):
+        info = zeroconf.get_service_info(service_type, name)
+        key = name.lower()
+        with self._lock:
+            if info is not None and self._browser is not None \
+                    and self._generations.get(key) == generation:
+                self._services[key] = info
+
+    def get_service_info(self, name, timeout=3):
+        zeroconf = self.get_zeroconf()
+        with self._lock:
+            info = self._services.get(name.lower())
+            if info is not None:
+                return info
+            if self._browser is None:
+                handlers = [self._on_service_state_change]
+                self._browser = ServiceBrowser(zeroconf, _SERVICE_TYPE,
+                                               handlers=handlers)
+        return zeroconf.get_service_info(_SERVICE_TYPE, name,
+                                         int(timeout * 1000))
+
+    def close(self):
+        with self._lock:
+            zeroconf, browser = self._zeroconf, self._browser
+            self._zeroconf = self._browser = None
+            self._services = {}
+            self._generations = {}
+        if browser is not None:
+            browser.cancel()
+        if zeroconf is not None:
+            zeroconf.close()
+
+
+_zeroconf_manager = _ZeroconfManager()
+atexit.register(_zeroconf_manager.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_zeroconf_manager._reset)
+
+
+def get_zeroconf():
+    r"""Returns the Zeroconf instance shared by the process.
+
+    It is created on first use, and closed by `close_zeroconf` or when the
+    interpreter exits.
+
+    Returns
+    -------
+    zeroconf : zeroconf.Zeroconf
+        Shared Zeroconf instance.
+    """
+    return _zeroconf_manager.get_zeroconf()
+
+
+def get_service_info(code, timeout=3):
     r"""Get service information for an Airshare service.
 
+    Services already seen by the shared browser of Airshare services are
+    answered from its cache, other services are looked up with a query that
+    returns as soon as the service answers.
+
     Parameters
     ----------
     code : str
         Identifying code for the Airshare service.
+    timeout : float, default=3
+        Time in seconds to wait for the service to answer.
 
     Returns
     -------
     info : zeroconf.ServiceInfo
-        Details of the Airshare service.
+        Details of the Airshare service, or None if it did not answer.
     """
-    zeroconf = Zeroconf(ip_version=IPVersion.V4Only)
-    service = "_airshare._http._tcp.local."
-    info = zeroconf.get_service_info(service, code + service)
-    return info
+    return _zeroconf_manager.get_service_info(code + _SERVICE_TYPE, timeout)
+
+
+def _get_fastest_address(addresses, timeout=3):
+    r"""Races connections to the addresses of a service, happy eyeballs style.
+
+    Connections to all addresses are started at once, and the address whose
+    connection is established first, i.e. with the lowest round-trip time,
+    is returned.
+
+    Parameters
+    ----------
+    addresses : list
+        List of `(host, port)` addresses of the service.
+    timeout : float, default=3
+        Time in seconds to wait for a connection.
+
+    Returns
+    -------
+    address : tuple
+        The `(host, port)` connected to first, or the first address if no
+        connection is established in time.
+    """
+    if len(addresses) == 1:
+        return addresses[0]
+    connections = {}
+    try:
+        for host, port in addresses:
+            family = socket.AF_INET6 if ":" in host else socket.AF_INET
+            try:
+                s = socket.socket(family, socket.SOCK_STREAM)
+            except OSError:
+                continue
+            s.setblocking(False)
+            s.connect_ex((host, port))
+            connections[s] = host, port
+        deadline = monotonic() + timeout
+        while connections and monotonic() < deadline:
+            pending = list(connections)
+            _, connected, failed = select.select(
+                [], pending, pending, deadline - monotonic())
+            for s in set(connected + failed):
+                error = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if error == 0 and s not in failed:
+                    return connections[s]
+                s.close()
+                del connections[s]
+    finally:
+        for s in connections:
+            s.close()
+    return addresses[0]
+
+
+def _parse_address(code):
+    r"""Returns the `(host, port)` of a `host:port` code, or None.
+
+    The host is an IP address, or a host name with a dot in it, so that a
+    plain code such as 'party:2024' is still looked up.
+    """
+    host, sep, port = code.rpartition(":")
+    if not sep or not port.isdigit():
+        return None
+    if host.startswith("[") and host.endswith("]"):
+        host = host[1:-1]
+    elif ":" in host:
+        return None
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        if "." not in host.strip("."):
+            return None
+    return host, int(port)
+
+
+def _resolve_service(code, timeout=3):
+    r"""Resolves the `(host, port)` and path of an Airshare service."""
+    host_port, slash, path = code.partition("/")
+    address = _parse_address(host_port)
+    if address is not None:
+        return address, "/" + path.strip("/") if path.strip("/") else ""
+    info = get_service_info(code, timeout)
+    if info is None or not info.parsed_addresses():
+        return None, ""
+    addresses = [(x, info.port) for x in info.parsed_addresses()]
+    path = (info.properties or {}).get(b"path") or b""
+    return _get_fastest_address(addresses, timeout), path.decode()
+
+
+def get_service_address(code, timeout=3):
+    r"""Resolves the address of an Airshare service.
+
+    A code of the form `host:port` (e.g. '192.168.1.5:8000',
+    '[fd00::5]:8000' or 'nas.example.com:8000'), with an IP address or a
+    dotted host name, is the address of the service itself, and is
+    returned without a Multicast-DNS lookup, so that services can be
+    reached directly, even across networks. Of the IPv4 and IPv6 addresses
+    a service advertises, the one connected to first is returned.
+
+    Parameters
+    ----------
+    code : str
+        Identifying code for the Airshare service, or its `host:port`.
+    timeout : float, default=3
+        Time in seconds to wait for the service to answer.
+
+    Returns
+    -------
+    address : tuple or None
+        The `(host, port)` of the service, or None if it did not answer.
+    """
+    return _resolve_service(code, timeout)[0]
 
 
-def register_service(code, addresses, port):
+def get_service_url(code, timeout=3):
+    r"""Resolves the base URL of an Airshare service.
+
+    The URL includes the path the service advertises, for servers hosting
+    several services. A `host:port` code may be followed by the path (e.g.
+    '192.168.1.5:8000/code').
+
+    Parameters
+    ----------
+    code : str
+        Identifying code for the Airshare service, or its `host:port`.
+    timeout : float, default=3
+        Time in seconds to wait for the service to answer.
+
+    Returns
+    -------
+    url : str or None
+        Base URL of the service (e.g. 'http://192.168.1.5:8000'), or None if
+        it did not answer.
+    """
+    address, path = _resolve_service(code, timeout)
+    if address is None:
+        return None
+    host, port = address
+    if ":" in host:
+        host = "[" + host + "]"
+    return "http://" + host + ":" + str(port) + path
+
+
+def register_service(code, addresses, port, path=None):
     r"""Registers an Airshare Multicast-DNS service based in the local network.
 
     Parameters
@@ -86,73 +413,601 @@ def register_service(code, addresses, port):
     code : str
         Identifying code for the Airshare service.
     addresses : list
-        List of local network IP Addresses for the service.
+        List of packed local network IP Addresses (IPv4 or IPv6) for the
+        service.
     port : int
         Port number for the Airshare service's server.
+    path : str or None
+        Path of the service on the server (e.g. '/code' for a server hosting
+        several services), advertised in the 'path' TXT property.
 
     Returns
     -------
     info : zeroconf.ServiceInfo
         Details of the Airshare service.
     """
-    zeroconf = Zeroconf(ip_version=IPVersion.V4Only)
-    service = "_airshare._http._tcp.local."
     info = ServiceInfo(
-        service,
-        code + service,
+        _SERVICE_TYPE,
+        code + _SERVICE_TYPE,
         addresses=addresses,
         port=port,
+        properties={"path": path} if path else {},
         server=code + ".local."
     )
-    zeroconf.register_service(info)
+    get_zeroconf().register_service(info)
     return info
 
 
+def unregister_service(info):
+    r"""Unregisters an Airshare Multicast-DNS service.
+
+    Parameters
+    ----------
+    info : zeroconf.ServiceInfo
+        Details of the Airshare service, as returned by `register_service`.
+    """
+    get_zeroconf().unregister_service(info)
+
+
+def close_zeroconf():
+    r"""Unregisters all services and closes the shared Zeroconf instance.
+
+    This is done when the interpreter exits, and a new instance is created
+    on next use.
+    """
+    _zeroconf_manager.close()
+
+
 # Zip and Unzip
 
 
-def get_zip_file(files):
-    r"""Creates a temporary Zip Archive of files and directories.
+def _get_zip_members(files, directories=False):
+    r"""Walks the files to archive along with their names in the archive.
 
     Parameters
     ----------
     files : list
         List of paths of files and directories to compress.
+    directories : boolean, default=False
+        Flag to also yield the directories walked, before their contents,
+        except the directory itself when it is the only one given.
 
-    Returns
-    -------
-    zip_file_path : str
-        Canonical file path of the temporary Zip Archive file.
-    zip_file_name : str
-        File name to be assigned to the Zip Archive (during sending).
+    Yields
+    ------
+    member : tuple
+        The `(file_path, arcname)` of the next file to archive.
     """
     files = [os.path.realpath(x) for x in files]
-    _, zip_file_path = tempfile.mkstemp(prefix="airshare", suffix=".zip")
-    zip_archive = ZipFile(zip_file_path, "w")
-    num_files = len(files)
     index = -1
-    if num_files == 1:
+    if len(files) == 1:
         index = 0
     for item in files:
         index += len(item.split(os.path.sep))
         if os.path.isdir(item):
             for root, _, file_list in os.walk(item):
+                if directories and root.split(os.path.sep)[index:]:
+                    yield root, os.path.join(
+                        *tuple(root.split(os.path.sep)[index:]))
                 for file in file_list:
                     file_path = os.path.realpath(os.path.join(root, file))
-                    zip_archive.write(file_path, os.path.join(
-                        *tuple(root.split(os.path.sep)[index:] + [file])))
+                    yield file_path, os.path.join(
+                        *tuple(root.split(os.path.sep)[index:] + [file]))
         else:
             file_path = os.path.realpath(item)
-            zip_archive.write(file_path, os.path.join(
-                *tuple(file_path.split(os.path.sep)[index:])))
+            yield file_path, os.path.join(
+                *tuple(file_path.split(os.path.sep)[index:]
+                       or [os.path.basename(file_path)]))
         index = -1
-    zip_archive.close()
-    zip_file_path = os.path.abspath(zip_file_path)
+
+
+def _get_zip_name(files):
+    r"""Returns the file name to be assigned to a Zip Archive of files.
+
+    Parameters
+    ----------
+    files : list
+        List of paths of files and directories to compress.
+
+    Returns
+    -------
+    zip_file_name : str
+        File name to be assigned to the Zip Archive (during sending).
+    """
     zip_file_name = "airshare.zip"
-    if num_files == 1:
+    if len(files) == 1:
         zip_file_name = os.path.splitext(
             os.path.realpath(files[0]).split(os.path.sep)[-1])[0] + ".zip"
-    return zip_file_path, zip_file_name
+    return zip_file_name
+
+
+def _deflate_file(file_path, chunk_size=1024 * 1024):
+    r"""Deflates a file for a Zip Archive, run in a worker process.
+
+    Compressed data of up to a few chunks is returned in memory, larger
+    results are spilled into a temporary file.
+
+    Parameters
+    ----------
+    file_path : str
+        Path of the file to deflate.
+    chunk_size : int, default=1048576
+        Size of the chunks in which the file is read.
+
+    Returns
+    -------
+    crc : int
+        CRC-32 of the file's contents.
+    file_size : int
+        Size of the file's contents in bytes.
+    compress_size : int
+        Size of the deflated contents in bytes.
+    data : bytes or str or None
+        Deflated contents, path of the temporary file holding them, or None
+        if deflating does not make the file any smaller.
+    """
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+                                  -15)
+    crc, file_size, compress_size = 0, 0, 0
+    chunks, spill = [], None
+    with open(file_path, "rb") as f:
+        chunk = f.read(chunk_size)
+        while chunk or compressor is not None:
+            if chunk:
+                crc = zlib.crc32(chunk, crc)
+                file_size += len(chunk)
+                data = compressor.compress(chunk)
+                chunk = f.read(chunk_size)
+            else:
+                data, compressor = compressor.flush(), None
+            compress_size += len(data)
+            chunks.append(data)
+            if spill is None and compress_size > 4 * chunk_size:
+                spill = tempfile.NamedTemporaryFile(prefix="airshare",
+                                                    delete=False)
+            if spill is not None:
+                spill.write(b"".join(chunks))
+                chunks = []
+    if spill is not None:
+        spill.close()
+        if compress_size >= file_size:
+            os.remove(spill.name)
+            return crc, file_size, compress_size, None
+        return crc, file_size, compress_size, spill.name
+    if compress_size >= file_size:
+        return crc, file_size, compress_size, None
+    return crc, file_size, compress_size, b"".join(chunks)
+
+
+_ZIP64_LIMIT = (1 << 31) - 1
+_LOCAL_FILE_HEADER = struct.Struct("<4sHHHHHLLLHH")
+_ZIP_CENTRAL_HEADER = struct.Struct("<4sHHHHHHLLLHHHHHLL")
+_ZIP_END = struct.Struct("<4sHHHHLLH")
+_ZIP64_END = struct.Struct("<4sQHHLLQQQQ")
+_ZIP64_LOCATOR = struct.Struct("<4sLQL")
+
+
+class _ZipWriter:
+    """Writes a Zip Archive into a file object, seekable or not.
+
+    Stored members are copied as they are read. Their sizes and CRC-32 are
+    patched into their local header afterwards if the file object is
+    seekable, and written in a data descriptor after them otherwise.
+    Members deflated beforehand are written with all of their details in
+    their local header. Zip64 extensions are used where sizes, offsets or
+    the number of members need them.
+    """
+
+    def __init__(self, fp):
+        self._fp = fp
+        self._seekable = hasattr(fp, "seek")
+        self._offset = 0
+        self._members = []
+
+    def _write(self, data):
+        self._fp.write(data)
+        self._offset += len(data)
+
+    def _get_local_header(self, zip_info, flags, method, zip64, crc,
+                          compress_size, file_size):
+        extra = b""
+        if zip64:
+            extra = struct.pack("<HHQQ", 0x0001, 16, file_size,
+                                compress_size)
+            compress_size = file_size = 0xFFFFFFFF
+        name = zip_info.filename.encode("utf-8" if flags & 0x800
+                                        else "ascii")
+        return _LOCAL_FILE_HEADER.pack(
+            b"PK\x03\x04", 45 if zip64 else 20, flags, method,
+            *_get_dos_date_time(zip_info.date_time), crc, compress_size,
+            file_size, len(name), len(extra)) + name + extra
+
+    def write_stored(self, zip_info, f, chunk_size):
+        r"""Writes a file as it is read, yielding after every chunk."""
+        flags = _get_zip_flags(zip_info.filename)
+        zip64 = zip_info.file_size * 1.05 > _ZIP64_LIMIT
+        if not self._seekable:
+            flags |= 0x08
+        header_offset = self._offset
+        header = self._get_local_header(zip_info, flags, ZIP_STORED, zip64,
+                                        0, 0, 0)
+        self._write(header)
+        crc, file_size = 0, 0
+        chunk = f.read(chunk_size)
+        while chunk:
+            crc = zlib.crc32(chunk, crc)
+            file_size += len(chunk)
+            self._write(chunk)
+            yield
+            chunk = f.read(chunk_size)
+        if file_size > _ZIP64_LIMIT and not zip64:
+            raise OSError("File changed while archiving: "
+                          + zip_info.filename)
+        if self._seekable:
+            self._fp.seek(header_offset)
+            self._fp.write(self._get_local_header(
+                zip_info, flags, ZIP_STORED, zip64, crc, file_size,
+                file_size))
+            self._fp.seek(self._offset)
+        else:
+            self._write(struct.pack("<4sLQQ" if zip64 else "<4sLLL",
+                                    b"PK\x07\x08", crc, file_size,
+                                    file_size))
+        self._members.append((zip_info, flags, ZIP_STORED, zip64, crc,
+                              file_size, file_size, header_offset))
+
+    def write_deflated(self, zip_info, crc, file_size, compress_size):
+        r"""Writes the local header of a member deflated beforehand, to be
+        followed by the `compress_size` bytes of its deflated data."""
+        flags = _get_zip_flags(zip_info.filename)
+        zip64 = max(file_size, compress_size) > _ZIP64_LIMIT
+        header_offset = self._offset
+        self._write(self._get_local_header(zip_info, flags, ZIP_DEFLATED,
+                                           zip64, crc, compress_size,
+                                           file_size))
+        self._members.append((zip_info, flags, ZIP_DEFLATED, zip64, crc,
+                              compress_size, file_size, header_offset))
+
+    def write(self, data):
+        r"""Writes data of the member being written."""
+        self._write(data)
+
+    def close(self):
+        r"""Writes the central directory."""
+        start = self._offset
+        for zip_info, flags, method, zip64, crc, compress_size, file_size, \
+                header_offset in self._members:
+            fields = []
+            if max(file_size, compress_size) > _ZIP64_LIMIT:
+                fields += [file_size, compress_size]
+                file_size = compress_size = 0xFFFFFFFF
+            if header_offset > _ZIP64_LIMIT:
+                fields.append(header_offset)
+                header_offset = 0xFFFFFFFF
+            extra = b""
+            if fields:
+                extra = struct.pack("<HH" + "Q" * len(fields), 0x0001,
+                                    8 * len(fields), *fields)
+            version = 45 if zip64 or fields else 20
+            name = zip_info.filename.encode("utf-8" if flags & 0x800
+                                            else "ascii")
+            self._write(_ZIP_CENTRAL_HEADER.pack(
+                b"PK\x01\x02", zip_info.create_system << 8 | version,
+                version, flags, method,
+                *_get_dos_date_time(zip_info.date_time), crc, compress_size,
+                file_size, len(name), len(extra), 0, 0, 0,
+                zip_info.external_attr, header_offset) + name + extra)
+        count, size = len(self._members), self._offset - start
+        if count >= 0xFFFF or max(size, start) > _ZIP64_LIMIT:
+            end = self._offset
+            self._write(_ZIP64_END.pack(b"PK\x06\x06", 44, 45, 45, 0, 0,
+                                        count, count, size, start))
+            self._write(_ZIP64_LOCATOR.pack(b"PK\x06\x07", 0, end, 1))
+            count = min(count, 0xFFFF)
+            size = min(size, 0xFFFFFFFF)
+            start = min(start, 0xFFFFFFFF)
+        self._write(_ZIP_END.pack(b"PK\x05\x06", 0, 0, count, count, size,
+                                  start, 0))
+        self._fp.flush()
+
+
+def _get_zip_flags(name):
+    r"""Returns the general purpose flags of a member, for its name."""
+    try:
+        name.encode("ascii")
+    except UnicodeEncodeError:
+        return 0x800
+    return 0
+
+
+def _get_dos_date_time(date_time):
+    r"""Packs a `(year, month, day, hour, minute, second)` tuple as the MS-DOS
+    date and time of a Zip Archive member."""
+    year, month, day, hour, minute, second = date_time
+    return (year - 1980) << 9 | month << 5 | day, \
+        hour << 11 | minute << 5 | second // 2
+
+
+class _DeflatePool:
+    """Pool of worker processes deflating archive members, shared by the
+    archives being built at the same time, and shut down once none are so
+    that no idle workers outlive their use.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._users = 0
+
+    def acquire(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(os.cpu_count() or 1)
+            self._users += 1
+            return self._executor
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            if self._users == 0:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+_deflate_pool = _DeflatePool()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_deflate_pool._reset)
+
+
+def _remove_spill(deflated):
+    r"""Removes the temporary file of a deflated member that was not
+    written, once it is deflated."""
+    if not deflated.cancelled() and deflated.exception() is None \
+            and type(deflated.result()[3]) is str:
+        os.remove(deflated.result()[3])
+
+
+def _write_zip_member(zip_writer, file_path, zip_info, deflated,
+                      chunk_size):
+    r"""Writes a file into a Zip Archive, yielding after every chunk.
+
+    Parameters
+    ----------
+    zip_writer : _ZipWriter
+        Zip Archive being written.
+    file_path : str
+        Path of the file to write.
+    zip_info : zipfile.ZipInfo
+        Details of the archive member.
+    deflated : concurrent.futures.Future or None
+        Result of `_deflate_file` for the file, or None to store it as is.
+    chunk_size : int
+        Size of the chunks in which data is copied.
+    """
+    result = None if deflated is None else deflated.result()
+    if result is None or result[3] is None:
+        with open(file_path, "rb") as f:
+            yield from zip_writer.write_stored(zip_info, f, chunk_size)
+        return
+    crc, file_size, compress_size, data = result
+    zip_writer.write_deflated(zip_info, crc, file_size, compress_size)
+    if type(data) is bytes:
+        zip_writer.write(data)
+        yield
+    else:
+        try:
+            with open(data, "rb") as f:
+                chunk = f.read(chunk_size)
+                while chunk:
+                    zip_writer.write(chunk)
+                    yield
+                    chunk = f.read(chunk_size)
+        finally:
+            os.remove(data)
+
+
+def _write_zip(fp, files, compress, chunk_size):
+    r"""Writes files and directories into a Zip Archive.
+
+    With compression, files are deflated in parallel by the pool of worker
+    processes shared with the other archives being built, while the archive
+    is written in order.
+    Files in formats that are already compressed, and files that deflating
+    does not shrink, are stored as they are.
+
+    Parameters
+    ----------
+    fp : file-like
+        File object to write the Zip Archive into, seekable or not.
+    files : list
+        List of paths of files and directories to compress.
+    compress : boolean
+        Flag to enable or disable compression (Deflate).
+    chunk_size : int
+        Size of the chunks in which data is copied.
+
+    Yields
+    ------
+    None
+        After every chunk written into the archive.
+    """
+    zip_writer = _ZipWriter(fp)
+    executor = None
+    window = 1
+    if compress:
+        executor = _deflate_pool.acquire()
+        window = 4 * (os.cpu_count() or 1)
+    pending = deque()
+    try:
+        for file_path, arcname in _get_zip_members(files):
+            zip_info = ZipInfo.from_file(file_path, arcname)
+            extension = os.path.splitext(arcname)[1].lower()
+            deflated = None
+            if compress and zip_info.file_size > 0 \
+                    and extension not in _COMPRESSED_EXTENSIONS:
+                deflated = executor.submit(_deflate_file, file_path,
+                                           chunk_size)
+            pending.append((file_path, zip_info, deflated))
+            if len(pending) >= window:
+                yield from _write_zip_member(zip_writer, *pending.popleft(),
+                                             chunk_size)
+        while pending:
+            yield from _write_zip_member(zip_writer, *pending.popleft(),
+                                         chunk_size)
+        zip_writer.close()
+    finally:
+        for _, _, deflated in pending:
+            if deflated is not None and not deflated.cancel():
+                deflated.add_done_callback(_remove_spill)
+        if executor is not None:
+            _deflate_pool.release()
+
+
+def get_zip_file(files, compress=False, cache=None):
+    r"""Creates a temporary Zip Archive of files and directories.
+
+    Parameters
+    ----------
+    files : list
+        List of paths of files and directories to compress.
+    compress : boolean, default=False
+        Flag to enable or disable compression (Deflate), done in parallel
+        over all CPU cores.
+    cache : object or None
+        Manifest cache (see `get_manifest_cache`) to reuse the archive from
+        if none of the files have changed since it was built, and to keep
+        the archive in otherwise.
+
+    Returns
+    -------
+    zip_file_path : str
+        Canonical file path of the temporary Zip Archive file. An archive
+        of the cache is not evicted until it is released with the cache's
+        `release(zip_file_path)` method.
+    zip_file_name : str
+        File name to be assigned to the Zip Archive (during sending).
+    """
+    if cache is None:
+        fd, zip_file_path = tempfile.mkstemp(prefix="airshare", suffix=".zip")
+    else:
+        key = [[os.path.realpath(x) for x in files], bool(compress)]
+        members = [[arcname] + _get_file_signature(os.stat(file_path))
+                   for file_path, arcname in _get_zip_members(files)]
+        zip_file_path = cache.get_archive(key, members)
+        if zip_file_path is not None:
+            return os.path.abspath(zip_file_path), _get_zip_name(files)
+        fd, zip_file_path = tempfile.mkstemp(prefix=".", dir=cache.directory)
+    os.close(fd)
+    with open(zip_file_path, "wb") as f:
+        for _ in _write_zip(f, files, compress, 1024 * 1024):
+            pass
+    if cache is not None:
+        zip_file_path = cache.put_archive(key, members, zip_file_path)
+    zip_file_path = os.path.abspath(zip_file_path)
+    return zip_file_path, _get_zip_name(files)
+
+
+class _StreamBuffer:
+    """Unseekable file-like object collecting the bytes written to it."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def read(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def _zip_stream(files, compress, chunk_size):
+    r"""Generates a Zip Archive of files while walking and reading them.
+
+    Parameters
+    ----------
+    files : list
+        List of paths of files and directories to compress.
+    compress : boolean
+        Flag to enable or disable compression (Deflate).
+    chunk_size : int
+        Approximate size of the chunks of the archive to yield.
+
+    Yields
+    ------
+    chunk : bytes
+        The next chunk of the Zip Archive.
+    """
+    buffer = _StreamBuffer()
+    for _ in _write_zip(buffer, files, compress, chunk_size):
+        if buffer.size >= chunk_size:
+            yield buffer.read()
+    yield buffer.read()
+
+
+def get_zip_stream(files, compress=False, chunk_size=1024 * 1024):
+    r"""Creates a Zip Archive of files and directories as a stream.
+
+    The archive is built while the files are walked and read, so that it can
+    be sent without being written to disk first. Its size is not known in
+    advance.
+
+    Parameters
+    ----------
+    files : list
+        List of paths of files and directories to compress.
+    compress : boolean, default=False
+        Flag to enable or disable compression (Deflate), done in parallel
+        over all CPU cores.
+    chunk_size : int, default=1048576
+        Approximate size of the chunks of the archive to yield.
+
+    Returns
+    -------
+    zip_stream : generator
+        Generator yielding the Zip Archive in chunks of bytes.
+    zip_file_name : str
+        File name to be assigned to the Zip Archive (during sending).
+    """
+    return _zip_stream(files, compress, chunk_size), _get_zip_name(files)
+
+
+def _make_extract_dir(archive_path):
+    r"""Creates the directory an archive file is extracted into, named after
+    the archive, suffixed with a timestamp (and a count) if taken.
+
+    Parameters
+    ----------
+    archive_path : str
+        Path of the archive file to extract.
+
+    Returns
+    -------
+    archive_dir : str
+        Canonical path of the new directory.
+    """
+    base_dir = os.path.splitext(archive_path)[0]
+    archive_dir, count = base_dir, 1
+    while True:
+        try:
+            os.mkdir(archive_dir)
+            return os.path.realpath(archive_dir)
+        except FileExistsError:
+            # Archives of the same name may be extracted in the same second.
+            archive_dir = base_dir + "-" + strftime("%Y%m%d%H%M%S")
+            if count > 1:
+                archive_dir += "-" + str(count)
+            count += 1
 
 
 def unzip_file(zip_file_path):
@@ -168,16 +1023,1881 @@ def unzip_file(zip_file_path):
     zip_dir : str
         Canonical path of the unzipped directory.
     """
-    zip_dir = zip_file_path[:-4]
-    if os.path.isdir(zip_dir):
-        zip_dir += "-" + strftime("%Y%m%d%H%M%S")
-    os.mkdir(zip_dir)
+    zip_dir = _make_extract_dir(zip_file_path)
     with ZipFile(zip_file_path, "r") as zip_archive:
         zip_archive.extractall(zip_dir)
-    zip_dir = os.path.realpath(zip_dir)
     return zip_dir
 
 
+def _get_extract_path(archive_dir, name):
+    r"""Returns the path a member of an archive is extracted to.
+
+    Parameters
+    ----------
+    archive_dir : str
+        Directory the archive is extracted into.
+    name : str
+        Name of the member in the archive.
+
+    Returns
+    -------
+    path : str
+        Path of the member, inside the directory whatever its name.
+    """
+    name = os.path.splitdrive(name)[1].replace("\\", "/")
+    parts = [x for x in name.split("/") if x not in ("", ".", "..")]
+    return os.path.join(archive_dir, *parts)
+
+
+class _UnzipStream:
+    """Unseekable file-like object unzipping the Zip Archive written to it.
+
+    Members are extracted as soon as their bytes are written. Members stored
+    with a data descriptor, whose size is only known after their data, end
+    where a data descriptor matches the CRC-32 and size of the data so far.
+    """
+
+    def __init__(self, zip_dir):
+        self.zip_dir = zip_dir
+        self._buffer = b""
+        self._position = 0
+        self._state = "header"
+        self._member = None
+        self._name = None
+        self._flags = 0
+        self._crc = 0
+        self._expected_crc = 0
+        self._size = 0
+        self._remaining = None
+        self._zip64 = False
+        self._decompressor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _extract(self, data):
+        self._size += len(data)
+        if self._decompressor is not None:
+            data = self._decompressor.decompress(data)
+        self._crc = zlib.crc32(data, self._crc)
+        if self._member is not None:
+            self._member.write(data)
+
+    def _end_member(self):
+        if self._decompressor is not None:
+            data = self._decompressor.flush()
+            self._crc = zlib.crc32(data, self._crc)
+            if self._member is not None:
+                self._member.write(data)
+        if self._member is not None:
+            self._member.close()
+            self._member = None
+        if self._flags & 0x08:
+            self._state = "descriptor"
+        else:
+            self._check_crc(self._expected_crc)
+            self._state = "header"
+
+    def _check_crc(self, crc):
+        if crc != self._crc:
+            raise BadZipFile("Bad CRC-32 for file " + repr(self._name))
+
+    def _read_header(self):
+        buffer, position = self._buffer, self._position
+        signature = buffer[position:position + 4]
+        if len(signature) < 4:
+            return False
+        if signature in (b"PK\x01\x02", b"PK\x05\x06"):
+            self._state = "end"
+            return True
+        if signature != b"PK\x03\x04":
+            raise BadZipFile("Bad magic number for file header")
+        if len(buffer) < position + _LOCAL_FILE_HEADER.size:
+            return False
+        _, _, flags, method, _, _, crc, compress_size, file_size, name_size, \
+            extra_size = _LOCAL_FILE_HEADER.unpack_from(buffer, position)
+        start = position + _LOCAL_FILE_HEADER.size
+        end = start + name_size + extra_size
+        if len(buffer) < end:
+            return False
+        if flags & 0x01:
+            raise BadZipFile("Encrypted members are not supported")
+        if method not in (ZIP_STORED, ZIP_DEFLATED):
+            raise BadZipFile("Unsupported compression method "
+                             + str(method))
+        encoding = "utf-8" if flags & 0x800 else "cp437"
+        self._name = buffer[start:start + name_size].decode(encoding)
+        extra = buffer[start + name_size:end]
+        self._zip64 = False
+        index = 0
+        while index + 4 <= len(extra):
+            tag, size = struct.unpack_from("<HH", extra, index)
+            if tag == 0x0001:
+                self._zip64 = True
+                field = index + 4
+                if file_size == 0xFFFFFFFF:
+                    file_size, = struct.unpack_from("<Q", extra, field)
+                    field += 8
+                if compress_size == 0xFFFFFFFF:
+                    compress_size, = struct.unpack_from("<Q", extra, field)
+            index += 4 + size
+        self._position = end
+        self._flags = flags
+        self._expected_crc = crc
+        self._crc = 0
+        self._size = 0
+        self._remaining = compress_size
+        if flags & 0x08 and compress_size == 0:
+            self._remaining = None
+        self._decompressor = None
+        if method == ZIP_DEFLATED:
+            self._decompressor = zlib.decompressobj(-15)
+        path = _get_extract_path(self.zip_dir, self._name)
+        if self._name.endswith("/"):
+            os.makedirs(path, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._member = open(path, "wb")
+        self._state = "data"
+        return True
+
+    def _take(self, size):
+        data = self._buffer[self._position:self._position + size]
+        self._position += len(data)
+        return data
+
+    def _read_data(self):
+        if self._remaining is not None:
+            data = self._take(self._remaining)
+            self._remaining -= len(data)
+            self._extract(data)
+            if self._remaining > 0:
+                return False
+            self._end_member()
+            return True
+        if self._decompressor is not None:
+            self._extract(self._take(len(self._buffer)))
+            if not self._decompressor.eof:
+                return False
+            self._buffer = self._decompressor.unused_data
+            self._position = 0
+            self._end_member()
+            return True
+        buffer, position = self._buffer, self._position
+        descriptor_size = 24 if self._zip64 else 16
+        size_format = "<Q" if self._zip64 else "<L"
+        index = buffer.find(b"PK\x07\x08", position)
+        while index >= 0 and len(buffer) >= index + descriptor_size:
+            crc, = struct.unpack_from("<L", buffer, index + 4)
+            size, = struct.unpack_from(size_format, buffer, index + 8)
+            if size == self._size + index - position and crc == zlib.crc32(
+                    buffer[position:index], self._crc):
+                self._extract(self._take(index - position))
+                self._end_member()
+                return True
+            index = buffer.find(b"PK\x07\x08", index + 1)
+        if index < 0:
+            index = max(len(buffer) - 3, position)
+        self._extract(self._take(index - position))
+        return False
+
+    def _read_descriptor(self):
+        buffer, position = self._buffer, self._position
+        signature = buffer[position:position + 4]
+        if len(signature) < 4:
+            return False
+        start = position + (4 if signature == b"PK\x07\x08" else 0)
+        end = start + (20 if self._zip64 else 12)
+        if len(buffer) < end:
+            return False
+        crc, = struct.unpack_from("<L", buffer, start)
+        self._position = end
+        self._check_crc(crc)
+        self._state = "header"
+        return True
+
+    def _read_end(self):
+        self._position = len(self._buffer)
+        return False
+
+    def write(self, data):
+        self._buffer = self._buffer[self._position:] + bytes(data)
+        self._position = 0
+        while getattr(self, "_read_" + self._state)():
+            pass
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._member is not None:
+            self._member.close()
+            self._member = None
+        if self._state != "end":
+            raise BadZipFile("Zip Archive ended unexpectedly")
+
+
+def get_unzip_writer(zip_file_path):
+    r"""Creates a file-like object unzipping a Zip Archive as it is written.
+
+    The archive is unzipped into a new directory, named as by `unzip_file`,
+    without being written to disk itself.
+
+    Parameters
+    ----------
+    zip_file_path : str
+        Path the Zip Archive file would have been written to.
+
+    Returns
+    -------
+    writer : file-like
+        Unseekable file-like object to write the archive into, which raises
+        `zipfile.BadZipFile` if the archive is invalid or unsupported.
+    zip_dir : str
+        Canonical path of the unzipped directory.
+    """
+    zip_dir = _make_extract_dir(zip_file_path)
+    return _UnzipStream(zip_dir), zip_dir
+
+
+def _set_tar_mtime(tar_info, file_stat):
+    # The float `st_mtime` cannot hold nanoseconds, the PAX header can.
+    tar_info.mtime = file_stat.st_mtime_ns // 10**9
+    tar_info.pax_headers["mtime"] = str(Decimal(file_stat.st_mtime_ns)
+                                        / 10**9)
+
+
+def _tar_stream(files, chunk_size):
+    r"""Generates a Tar Archive of files while walking and reading them.
+
+    Members are written in the PAX format, with the permissions and
+    modification times of the files and directories.
+
+    Parameters
+    ----------
+    files : list
+        List of paths of files and directories to archive.
+    chunk_size : int
+        Approximate size of the chunks of the archive to yield.
+
+    Yields
+    ------
+    chunk : bytes
+        The next chunk of the Tar Archive.
+    """
+    buffer = _StreamBuffer()
+    for file_path, arcname in _get_zip_members(files, directories=True):
+        tar_info = tarfile.TarInfo(arcname.replace(os.path.sep, "/"))
+        if os.path.isdir(file_path):
+            file_stat = os.stat(file_path)
+            tar_info.type = tarfile.DIRTYPE
+            tar_info.mode = stat.S_IMODE(file_stat.st_mode)
+            _set_tar_mtime(tar_info, file_stat)
+            buffer.write(tar_info.tobuf(tarfile.PAX_FORMAT))
+            continue
+        with open(file_path, "rb") as f:
+            file_stat = os.fstat(f.fileno())
+            tar_info.mode = stat.S_IMODE(file_stat.st_mode)
+            _set_tar_mtime(tar_info, file_stat)
+            tar_info.size = file_stat.st_size
+            buffer.write(tar_info.tobuf(tarfile.PAX_FORMAT))
+            remaining = tar_info.size
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise OSError("File shrank while archiving: "
+                                  + file_path)
+                remaining -= len(chunk)
+                buffer.write(chunk)
+                if buffer.size >= chunk_size:
+                    yield buffer.read()
+        buffer.write(bytes(-tar_info.size % tarfile.BLOCKSIZE))
+        if buffer.size >= chunk_size:
+            yield buffer.read()
+    buffer.write(bytes(2 * tarfile.BLOCKSIZE))
+    yield buffer.read()
+
+
+def get_tar_stream(files, chunk_size=1024 * 1024):
+    r"""Creates a Tar Archive of files and directories as a stream.
+
+    Unlike a Zip Archive, a Tar Archive has no central directory, so that it
+    is both built and extracted in a single pass. Its members are not
+    compressed, which is left to the codec of the transfer.
+
+    Parameters
+    ----------
+    files : list
+        List of paths of files and directories to archive.
+    chunk_size : int, default=1048576
+        Approximate size of the chunks of the archive to yield.
+
+    Returns
+    -------
+    tar_stream : generator
+        Generator yielding the Tar Archive in chunks of bytes.
+    tar_file_name : str
+        File name to be assigned to the Tar Archive (during sending).
+    """
+    tar_file_name = os.path.splitext(_get_zip_name(files))[0] + ".tar"
+    return _tar_stream(files, chunk_size), tar_file_name
+
+
+def _parse_pax_headers(data):
+    r"""Parses the records of a PAX extended header into a dictionary."""
+    headers = {}
+    index = 0
+    while index < len(data):
+        space = data.index(b" ", index)
+        length = int(data[index:space])
+        key, _, value = data[space + 1:index + length - 1].partition(b"=")
+        headers[key.decode("utf-8")] = value.decode("utf-8",
+                                                    "surrogateescape")
+        index += length
+    return headers
+
+
+class _UntarStream:
+    """Unseekable file-like object extracting the Tar Archive written to it.
+
+    Regular files and directories are extracted with their permissions and
+    modification times, other members (links, devices) are skipped.
+    Directories get theirs once the archive is closed, after their contents.
+    """
+
+    def __init__(self, tar_dir):
+        self.tar_dir = tar_dir
+        self._buffer = b""
+        self._position = 0
+        self._state = "header"
+        self._member = None
+        self._tar_info = None
+        self._path = None
+        self._extended = None
+        self._headers = {}
+        self._remaining = 0
+        self._padding = 0
+        self._directories = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _take(self, size):
+        data = self._buffer[self._position:self._position + size]
+        self._position += len(data)
+        return data
+
+    def _read_header(self):
+        if len(self._buffer) - self._position < tarfile.BLOCKSIZE:
+            return False
+        block = self._take(tarfile.BLOCKSIZE)
+        if block == bytes(tarfile.BLOCKSIZE):
+            self._state = "end"
+            return True
+        try:
+            tar_info = tarfile.TarInfo.frombuf(block, "utf-8",
+                                               "surrogateescape")
+        except tarfile.HeaderError as e:
+            raise tarfile.ReadError(str(e))
+        self._tar_info = tar_info
+        if tar_info.type in (tarfile.XHDTYPE, tarfile.XGLTYPE,
+                             tarfile.GNUTYPE_LONGNAME):
+            self._extended = []
+        else:
+            headers, self._headers = self._headers, {}
+            tar_info.name = headers.get("path", tar_info.name)
+            tar_info.mtime = Decimal(headers.get("mtime", tar_info.mtime))
+            tar_info.size = int(headers.get("size", tar_info.size))
+            self._path = _get_extract_path(self.tar_dir, tar_info.name)
+            if tar_info.isdir():
+                os.makedirs(self._path, exist_ok=True)
+                self._directories.append((self._path, tar_info))
+            elif tar_info.isreg():
+                os.makedirs(os.path.dirname(self._path), exist_ok=True)
+                self._member = open(self._path, "wb")
+        self._remaining = tar_info.size
+        self._padding = -tar_info.size % tarfile.BLOCKSIZE
+        self._state = "data"
+        return True
+
+    def _end_member(self):
+        tar_info = self._tar_info
+        if self._extended is not None:
+            data, self._extended = b"".join(self._extended), None
+            if tar_info.type == tarfile.XHDTYPE:
+                self._headers.update(_parse_pax_headers(data))
+            elif tar_info.type == tarfile.GNUTYPE_LONGNAME:
+                self._headers["path"] = data.rstrip(b"\0").decode(
+                    "utf-8", "surrogateescape")
+        elif self._member is not None:
+            self._member.close()
+            self._member = None
+            os.chmod(self._path, tar_info.mode & 0o777)
+            mtime_ns = int(tar_info.mtime * 10 ** 9)
+            os.utime(self._path, ns=(mtime_ns, mtime_ns))
+        self._state = "padding"
+
+    def _read_data(self):
+        data = self._take(self._remaining)
+        self._remaining -= len(data)
+        if self._extended is not None:
+            self._extended.append(data)
+        elif self._member is not None:
+            self._member.write(data)
+        if self._remaining > 0:
+            return False
+        self._end_member()
+        return True
+
+    def _read_padding(self):
+        self._padding -= len(self._take(self._padding))
+        if self._padding > 0:
+            return False
+        self._state = "header"
+        return True
+
+    def _read_end(self):
+        self._position = len(self._buffer)
+        return False
+
+    def write(self, data):
+        self._buffer = self._buffer[self._position:] + bytes(data)
+        self._position = 0
+        while getattr(self, "_read_" + self._state)():
+            pass
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._member is not None:
+            self._member.close()
+            self._member = None
+        if self._state != "end":
+            raise tarfile.ReadError("Tar Archive ended unexpectedly")
+        while self._directories:
+            path, tar_info = self._directories.pop()
+            os.chmod(path, tar_info.mode & 0o777)
+            mtime_ns = int(tar_info.mtime * 10 ** 9)
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def get_untar_writer(tar_file_path):
+    r"""Creates a file-like object extracting a Tar Archive as it is written.
+
+    The archive is extracted into a new directory, named as by `unzip_file`,
+    without being written to disk itself.
+
+    Parameters
+    ----------
+    tar_file_path : str
+        Path the Tar Archive file would have been written to.
+
+    Returns
+    -------
+    writer : file-like
+        Unseekable file-like object to write the archive into, which raises
+        `tarfile.ReadError` if the archive is invalid.
+    tar_dir : str
+        Canonical path of the extracted directory.
+    """
+    tar_dir = _make_extract_dir(tar_file_path)
+    return _UntarStream(tar_dir), tar_dir
+
+
+def get_file_members(files):
+    r"""Walks files and directories along with their relative upload paths.
+
+    The relative paths lay the files out as they would be after zipping and
+    unzipping them, under the name of the would-be Zip Archive.
+
+    Parameters
+    ----------
+    files : list
+        List of paths of files and directories to upload.
+
+    Yields
+    ------
+    member : tuple
+        The `(file_path, relative_path)` of the next file, with '/' as the
+        separator of the relative path.
+    """
+    root = _get_zip_name(files)[:-4]
+    for file_path, arcname in _get_zip_members(files):
+        yield file_path, "/".join([root] + arcname.split(os.path.sep))
+
+
+# Sync
+
+
+_CHUNK_BITS = bytes(hashlib.blake2b(bytes([x])).digest()[0] & 1
+                    for x in range(256))
+_CHUNK_MARKER = b"\x01" * 16
+
+
+def _get_chunk_lengths(data, final, min_size, max_size):
+    r"""Splits bytes into content-defined chunks.
+
+    Every byte is mapped to a bit, and a chunk ends after a run of 16 bytes
+    mapped to 1, once it is at least `min_size` bytes long, so that chunk
+    boundaries move along with inserted or removed bytes. Chunks are cut at
+    `max_size` bytes without such a run. The bytes are mapped and searched
+    with `bytes.translate` and `bytes.find`, instead of a rolling hash.
+
+    Parameters
+    ----------
+    data : bytes
+        Bytes to split, starting at a chunk boundary.
+    final : boolean
+        Flag denoting that no bytes follow, so that the remaining bytes are
+        the last chunk instead of being left out.
+    min_size : int
+        Minimum size of a chunk in bytes.
+    max_size : int
+        Maximum size of a chunk in bytes.
+
+    Returns
+    -------
+    lengths : list
+        Lengths of the chunks.
+    """
+    bits = data.translate(_CHUNK_BITS)
+    lengths = []
+    start = 0
+    while start < len(data):
+        end = bits.find(_CHUNK_MARKER, start + min_size - len(_CHUNK_MARKER),
+                        start + max_size)
+        if end >= 0:
+            end += len(_CHUNK_MARKER)
+        elif len(data) - start >= max_size:
+            end = start + max_size
+        elif final:
+            end = len(data)
+        else:
+            break
+        lengths.append(end - start)
+        start = end
+    return lengths
+
+
+def get_file_chunks(file_path, min_size=8 * 1024, max_size=256 * 1024,
+                    block_size=8 * 1024 * 1024):
+    r"""Splits a file into content-defined chunks.
+
+    Parameters
+    ----------
+    file_path : str
+        Path of the file to split.
+    min_size : int, default=8192
+        Minimum size of a chunk in bytes.
+    max_size : int, default=262144
+        Maximum size of a chunk in bytes.
+    block_size : int, default=8388608
+        Size of the blocks in which the file is read.
+
+    Yields
+    ------
+    chunk : tuple
+        The `(offset, length, digest)` of the next chunk, where `digest` is
+        the hexadecimal BLAKE2b (128-bit) digest of its contents.
+    """
+    offset = 0
+    data = b""
+    with open(file_path, "rb") as f:
+        final = False
+        while not final:
+            block = f.read(block_size)
+            final = not block
+            data = data + block
+            start = 0
+            for length in _get_chunk_lengths(data, final, min_size,
+                                             max_size):
+                digest = hashlib.blake2b(data[start:start + length],
+                                         digest_size=16).hexdigest()
+                yield offset, length, digest
+                start += length
+                offset += length
+            data = data[start:]
+
+
+def get_chunk_index(directory):
+    r"""Indexes the content-defined chunks of the files in a directory.
+
+    Parameters
+    ----------
+    directory : str
+        Path of the directory.
+
+    Returns
+    -------
+    index : dict
+        Dictionary of the `(file_path, offset, length)` of the chunks, by
+        digest. Empty if the directory does not exist.
+    """
+    index = {}
+    if not os.path.isdir(directory):
+        return index
+    for root, _, file_list in os.walk(directory):
+        for file in file_list:
+            file_path = os.path.join(root, file)
+            if not os.path.isfile(file_path):
+                continue
+            for offset, length, digest in get_file_chunks(file_path):
+                index.setdefault(digest, (file_path, offset, length))
+    return index
+
+
+def get_sync_manifest(files, cache=None):
+    r"""Lists files and directories with their chunks, for a sync stream.
+
+    The digests of the chunks (the keys of `locations`) are those the
+    receiver is asked for, before the stream is created from the manifest
+    with `get_sync_stream`.
+
+    Parameters
+    ----------
+    files : list
+        List of paths of files and directories to sync.
+    cache : object or None
+        Manifest cache to reuse the chunk lists of unchanged files from, and
+        to keep the chunk lists in.
+
+    Returns
+    -------
+    entries : list
+        Manifest entries of the files and directories, with their `path`
+        (as it would be archived, with '/' separators), `mode`, `mtime_ns`
+        and, for files, their `chunks` as `[digest, length]` pairs.
+    locations : dict
+        Dictionary of the `(file_path, offset, length)` of the chunks, by
+        digest.
+    """
+    entries = []
+    locations = {}
+    key = [os.path.realpath(x) for x in files]
+    cached = {} if cache is None else cache.get_chunks(key)
+    chunk_lists = {}
+    for file_path, arcname in _get_zip_members(files, directories=True):
+        file_stat = os.stat(file_path)
+        entry = {"path": arcname.replace(os.path.sep, "/"),
+                 "mode": stat.S_IMODE(file_stat.st_mode),
+                 "mtime_ns": file_stat.st_mtime_ns}
+        if not stat.S_ISDIR(file_stat.st_mode):
+            signature = _get_file_signature(file_stat)
+            chunk_list = cached.get(file_path)
+            if chunk_list is None or chunk_list[0] != signature:
+                chunk_list = [signature, [
+                    [digest, length]
+                    for _, length, digest in get_file_chunks(file_path)]]
+            chunk_lists[file_path] = chunk_list
+            entry["chunks"] = chunk_list[1]
+            offset = 0
+            for digest, length in entry["chunks"]:
+                locations.setdefault(digest, (file_path, offset, length))
+                offset += length
+        entries.append(entry)
+    if cache is not None and chunk_lists != cached:
+        cache.put_chunks(key, chunk_lists)
+    return entries, locations
+
+
+def _sync_stream(files, chunks, chunk_size, cache, manifest):
+    r"""Generates a sync stream of files, leaving out the chunks given.
+
+    The stream holds the length of the manifest (8 bytes, big-endian), the
+    manifest as JSON, and the contents of the chunks listed in its `data`,
+    in that order: every chunk of the files that is not in `chunks`, once.
+
+    Parameters
+    ----------
+    files : list
+        List of paths of files and directories to sync.
+    chunks : iterable
+        Digests of the chunks held by the receiver.
+    chunk_size : int
+        Approximate size of the chunks of the stream to yield.
+    cache : object or None
+        Manifest cache of the chunk lists of the files.
+    manifest : tuple or None
+        Manifest of the files, see `get_sync_manifest`, or None to list
+        them.
+
+    Yields
+    ------
+    chunk : bytes
+        The next chunk of the sync stream.
+    """
+    if manifest is None:
+        manifest = get_sync_manifest(files, cache)
+    entries, locations = manifest
+    chunks = set(chunks)
+    data = []
+    for entry in entries:
+        for digest, _ in entry.get("chunks", ()):
+            if digest not in chunks:
+                chunks.add(digest)
+                data.append(digest)
+    manifest = json.dumps({"files": entries, "data": data}).encode()
+    buffer = _StreamBuffer()
+    buffer.write(struct.pack(">Q", len(manifest)))
+    buffer.write(manifest)
+    f = None
+    try:
+        for digest in data:
+            file_path, offset, length = locations[digest]
+            if f is None or f.name != file_path:
+                if f is not None:
+                    f.close()
+                f = open(file_path, "rb")
+            f.seek(offset)
+            chunk = f.read(length)
+            if len(chunk) != length:
+                raise OSError("File changed while syncing: " + file_path)
+            buffer.write(chunk)
+            if buffer.size >= chunk_size:
+                yield buffer.read()
+    finally:
+        if f is not None:
+            f.close()
+    yield buffer.read()
+
+
+def get_sync_stream(files, chunks=(), chunk_size=1024 * 1024, cache=None,
+                    manifest=None):
+    r"""Creates a sync stream of files and directories.
+
+    A sync stream carries a manifest of the files, with their
+    content-defined chunks, and only the contents of the chunks that the
+    receiver does not hold, from which the receiver rebuilds the files, like
+    rsync. The receiver applies it with `get_sync_writer`.
+
+    Parameters
+    ----------
+    files : list
+        List of paths of files and directories to sync.
+    chunks : iterable, default=()
+        Digests of the chunks held by the receiver, see `get_chunk_index`.
+    chunk_size : int, default=1048576
+        Approximate size of the chunks of the stream to yield.
+    cache : object or None
+        Manifest cache (see `get_manifest_cache`) to reuse the chunk lists
+        of unchanged files from, instead of chunking them again.
+    manifest : tuple or None
+        Manifest of the files from `get_sync_manifest`, to reuse the one
+        the receiver was asked about instead of chunking the files again.
+
+    Returns
+    -------
+    sync_stream : generator
+        Generator yielding the sync stream in chunks of bytes. Unless a
+        manifest is given, the files are chunked before the first one.
+    sync_file_name : str
+        File name to be assigned to the sync stream (during sending), the
+        name of the synced directory with a '.sync' extension.
+    """
+    sync_file_name = os.path.splitext(_get_zip_name(files))[0] + ".sync"
+    return _sync_stream(files, chunks, chunk_size, cache, manifest), \
+        sync_file_name
+
+
+class _ChunkCache:
+    """On-disk content-addressed store of chunks, evicted least recently used.
+
+    Chunks are stored as files named after their digest, and the
+    modification time of a chunk's file records its last use, so that the
+    order of eviction survives restarts. Chunks are verified when read, and
+    pinned chunks are not evicted.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._chunks = None
+        self._size = 0
+        self._pinned = {}
+
+    def _get_path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _load(self):
+        if self._chunks is not None:
+            return
+        chunks = []
+        os.makedirs(self.directory, exist_ok=True)
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            for chunk in os.scandir(entry.path):
+                if chunk.is_file() and not chunk.name.startswith("."):
+                    chunk_stat = chunk.stat()
+                    chunks.append((chunk_stat.st_mtime_ns, chunk.name,
+                                   chunk_stat.st_size))
+        chunks.sort()
+        self._chunks = OrderedDict((x[1], x[2]) for x in chunks)
+        self._size = sum(self._chunks.values())
+
+    def _evict(self):
+        excess = self._size - self.max_size
+        evicted = []
+        for digest, size in self._chunks.items():
+            if excess <= 0:
+                break
+            if digest not in self._pinned:
+                evicted.append(digest)
+                excess -= size
+        for digest in evicted:
+            self._size -= self._chunks.pop(digest)
+            try:
+                os.remove(self._get_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def pin(self, digests):
+        r"""Keeps chunks from being evicted until they are unpinned."""
+        with self._lock:
+            for digest in digests:
+                self._pinned[digest] = self._pinned.get(digest, 0) + 1
+
+    def unpin(self, digests):
+        r"""Releases pinned chunks, evicting chunks beyond the maximum size.
+        """
+        with self._lock:
+            for digest in digests:
+                count = self._pinned.pop(digest, 0) - 1
+                if count > 0:
+                    self._pinned[digest] = count
+            if self._chunks is not None:
+                self._evict()
+
+    def digests(self):
+        r"""Returns the digests of the cached chunks."""
+        with self._lock:
+            self._load()
+            return list(self._chunks)
+
+    def get(self, digest):
+        r"""Returns the contents of a chunk, or None if it is not cached."""
+        with self._lock:
+            self._load()
+            if digest not in self._chunks:
+                return None
+            self._chunks.move_to_end(digest)
+        path = self._get_path(digest)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            data = None
+        if data is None or hashlib.blake2b(
+                data, digest_size=16).hexdigest() != digest:
+            with self._lock:
+                self._size -= self._chunks.pop(digest, 0)
+            if data is not None:
+                os.remove(path)
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, digest, data):
+        r"""Stores a chunk received over the network."""
+        with self._lock:
+            self._load()
+            self.misses += 1
+            if digest in self._chunks or len(data) > self.max_size:
+                return
+        path = self._get_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=".", dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            if digest not in self._chunks:
+                self._chunks[digest] = len(data)
+                self._size += len(data)
+            self._evict()
+
+    def stats(self):
+        r"""Returns the statistics of the cache.
+
+        Returns
+        -------
+        stats : dict
+            Number of `hits` (chunks read from the cache) and `misses`
+            (chunks received over the network) so far, the `hit_ratio`, and
+            the number of cached `chunks` and their total `size` in bytes.
+        """
+        with self._lock:
+            self._load()
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_ratio": self.hits / total if total else 0.0,
+                    "chunks": len(self._chunks), "size": self._size}
+
+
+def _get_cache_directory(name):
+    r"""Returns the path of an Airshare cache in the user's cache directory.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") \
+        or os.path.join(os.path.expanduser("~"), ".cache")
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA", base)
+    return os.path.join(base, "airshare", name)
+
+
+def get_chunk_cache(directory=None, max_size=1024 * 1024 * 1024):
+    r"""Opens the on-disk chunk cache of received sync streams.
+
+    Chunks received in sync streams are kept in the cache, and receivers
+    advertise them along with the chunks of their files, so that files
+    repeated across senders and codes are rebuilt from the cache instead
+    of being sent again.
+
+    Parameters
+    ----------
+    directory : str or None
+        Directory of the cache. Defaults to 'airshare/chunks' in the user's
+        cache directory ('$XDG_CACHE_HOME' or '~/.cache', '%LOCALAPPDATA%'
+        on Windows).
+    max_size : int, default=1073741824
+        Maximum total size in bytes of the cached chunks, beyond which the
+        least recently used chunks are evicted.
+
+    Returns
+    -------
+    cache : object
+        Chunk cache with `digests()`, `get(digest)`, `put(digest, data)`,
+        `pin(digests)`, `unpin(digests)` and `stats()` methods, safe to
+        share between threads.
+    """
+    if directory is None:
+        directory = _get_cache_directory("chunks")
+    return _ChunkCache(directory, max_size)
+
+
+def _is_lock_held(lock_path, pid):
+    r"""Tells whether the process that created a lock file still runs."""
+    if os.name == "nt":
+        # Processes keep their lock files open, which keeps them from being
+        # removed.
+        try:
+            os.remove(lock_path)
+        except PermissionError:
+            return True
+        except FileNotFoundError:
+            pass
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Lock files of the cached archives in use by this process, by path, with
+# the count of their users.
+_archive_locks = {}
+_archive_locks_lock = threading.Lock()
+
+
+def _get_file_signature(file_stat):
+    r"""Returns the `[size, mtime_ns, inode]` a file is cached by."""
+    return [file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino]
+
+
+class _ManifestCache:
+    """On-disk cache of the archives and chunk lists of shared files.
+
+    Entries are keyed by the paths of the shared files and directories, and
+    are only used as long as the path, size, modification time and inode of
+    every file they cover are unchanged. Entries are evicted least recently
+    used, the modification time of their manifest recording their last use.
+    Each archive of an entry is stored as a new '<entry>-<version>.zip' file,
+    so that rebuilding it does not overwrite the one other shares serve.
+    Archives in use are locked with a '<entry>-<version>.<pid>.lock' file,
+    and are neither evicted nor removed for as long as the process that
+    locked them runs.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _get_path(self, kind, key):
+        key = json.dumps([kind, key]).encode("utf-8")
+        return os.path.join(self.directory,
+                            hashlib.blake2b(key, digest_size=16).hexdigest())
+
+    def _load(self, path):
+        try:
+            with open(path + ".json", "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, path, data):
+        fd, temp_path = tempfile.mkstemp(prefix=".", dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path + ".json")
+
+    def _get_entries(self):
+        entries = {}
+        for entry in os.scandir(self.directory):
+            name, extension = os.path.splitext(entry.name)
+            if entry.name.startswith(".") \
+                    or extension not in (".json", ".zip"):
+                continue
+            path = os.path.join(self.directory, name.partition("-")[0])
+            used, size, archives = entries.get(path, (0, 0, ()))
+            try:
+                entry_stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if extension == ".json":
+                used = entry_stat.st_mtime_ns
+            else:
+                archives += (entry.path,)
+            entries[path] = (used, size + entry_stat.st_size, archives)
+        return entries
+
+    def _get_locked(self):
+        locked = set()
+        for entry in os.scandir(self.directory):
+            name, extension = os.path.splitext(entry.name)
+            if entry.name.startswith(".") or extension != ".lock":
+                continue
+            name, _, pid = name.rpartition(".")
+            if not pid.isdigit():
+                continue
+            if _is_lock_held(entry.path, int(pid)):
+                locked.add(os.path.join(self.directory, name + ".zip"))
+            else:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+        return locked
+
+    def _lock_archive(self, archive_path):
+        lock_path = os.path.abspath(os.path.splitext(archive_path)[0] + "."
+                                    + str(os.getpid()) + ".lock")
+        with _archive_locks_lock:
+            lock = _archive_locks.get(lock_path)
+            if lock is None:
+                lock = _archive_locks[lock_path] = [open(lock_path, "w"), 0]
+            lock[1] += 1
+
+    def _remove(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self, keep):
+        entries = self._get_entries()
+        size = sum(x[1] for x in entries.values())
+        locked = None
+        for path, (_, entry_size, archives) in sorted(entries.items(),
+                                                      key=lambda x: x[1][0]):
+            if size <= self.max_size:
+                break
+            if locked is None:
+                locked = self._get_locked()
+            if path == keep or locked.intersection(archives):
+                continue
+            self._remove(archives + (path + ".json",))
+            size -= entry_size
+
+    def get_archive(self, key, members):
+        r"""Returns the path of a cached archive, locked until it is
+        released, or None if it is not cached or its `members` have
+        changed."""
+        path = self._get_path("archive", key)
+        manifest = self._load(path)
+        if manifest is None or "file" not in manifest:
+            with self._lock:
+                self.misses += 1
+            return None
+        archive_path = os.path.join(self.directory,
+                                    os.path.basename(manifest["file"]))
+        self._lock_archive(archive_path)
+        try:
+            signature = _get_file_signature(os.stat(archive_path))
+        except FileNotFoundError:
+            signature = None
+        with self._lock:
+            if manifest["members"] != members \
+                    or manifest["archive"] != signature:
+                self.misses += 1
+                self.release(archive_path)
+                return None
+            self.hits += 1
+        os.utime(path + ".json")
+        return archive_path
+
+    def put_archive(self, key, members, archive_path):
+        r"""Moves an archive of `members` into the cache, returning its new
+        path, locked until it is released."""
+        path = self._get_path("archive", key)
+        new_path = path + "-" + os.urandom(8).hex() + ".zip"
+        self._lock_archive(new_path)
+        with self._lock:
+            os.replace(archive_path, new_path)
+            signature = _get_file_signature(os.stat(new_path))
+            self._store(path, {"members": members, "archive": signature,
+                               "file": os.path.basename(new_path)})
+            # Earlier versions of the archive are left to the shares that
+            # still serve them.
+            locked = self._get_locked()
+            self._remove(x for x in self._get_entries()[path][2]
+                         if x != new_path and x not in locked)
+            self._evict(path)
+        return new_path
+
+    def release(self, archive_path):
+        r"""Releases a cached archive that is no longer in use, so that it
+        may be evicted."""
+        lock_path = os.path.abspath(os.path.splitext(archive_path)[0] + "."
+                                    + str(os.getpid()) + ".lock")
+        with _archive_locks_lock:
+            lock = _archive_locks.get(lock_path)
+            if lock is None:
+                return
+            lock[1] -= 1
+            if lock[1] > 0:
+                return
+            del _archive_locks[lock_path]
+            lock[0].close()
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+    def get_chunks(self, files):
+        r"""Returns the chunk lists cached for the files of a share, as a
+        dictionary of their `[signature, chunks]` by path."""
+        path = self._get_path("chunks", files)
+        chunks = self._load(path)
+        if not isinstance(chunks, dict):
+            return {}
+        try:
+            os.utime(path + ".json")
+        except FileNotFoundError:
+            pass
+        return chunks
+
+    def put_chunks(self, files, chunks):
+        r"""Stores the chunk lists of the files of a share."""
+        path = self._get_path("chunks", files)
+        with self._lock:
+            self._store(path, chunks)
+            self._evict(path)
+
+    def stats(self):
+        r"""Returns the statistics of the cache.
+
+        Returns
+        -------
+        stats : dict
+            Number of `hits` (archives reused) and `misses` (archives built)
+            so far, the number of cached `archives`, and the total `size` in
+            bytes of the cache.
+        """
+        with self._lock:
+            archives = [x for x in os.scandir(self.directory)
+                        if x.name.endswith(".zip")]
+            size = sum(x[1] for x in self._get_entries().values())
+            return {"hits": self.hits, "misses": self.misses,
+                    "archives": len(archives), "size": size}
+
+
+def get_manifest_cache(directory=None, max_size=8 * 1024 * 1024 * 1024):
+    r"""Opens the on-disk manifest cache of shared files.
+
+    Archives of shared files and directories, and the chunk lists of the
+    files synced from them, are kept in the cache, and reused by later
+    shares of the same paths for as long as the size, modification time and
+    inode of every file are unchanged. A reused archive also keeps its
+    validator (ETag), so that downloads of it can be resumed across
+    restarts of the sender.
+
+    Parameters
+    ----------
+    directory : str or None
+        Directory of the cache. Defaults to 'airshare/manifests' in the
+        user's cache directory ('$XDG_CACHE_HOME' or '~/.cache',
+        '%LOCALAPPDATA%' on Windows).
+    max_size : int, default=8589934592
+        Maximum total size in bytes of the cache, beyond which the least
+        recently used archives and chunk lists are evicted.
+
+    Returns
+    -------
+    cache : object
+        Manifest cache, safe to share between threads, to be passed to
+        `get_zip_file` and `get_sync_stream`, with a `release(zip_file_path)`
+        method to release the archives in use, and a `stats()` method.
+    """
+    if directory is None:
+        directory = _get_cache_directory("manifests")
+    return _ManifestCache(directory, max_size)
+
+
+# Maximum sizes in bytes of the manifest of a sync stream, and of its chunks
+# (the maximum size of the chunks of `get_file_chunks`).
+_MAX_SYNC_MANIFEST = 256 * 1024 * 1024
+_MAX_SYNC_CHUNK = 256 * 1024
+
+
+class _SyncStream:
+    """Unseekable file-like object applying the sync stream written to it.
+
+    The directory is rebuilt from the chunks in the stream and those of the
+    files of the source directory (or of the chunk cache). It is rebuilt in
+    a temporary directory next to the source directory, which it replaces
+    once the stream is closed, or else straight into a new directory.
+    """
+
+    def __init__(self, sync_dir, source_dir=None, cache=None):
+        self.sync_dir = sync_dir
+        self.source_dir = source_dir
+        self.cache = cache
+        self._temp_dir = sync_dir
+        if sync_dir == source_dir:
+            self._temp_dir = tempfile.mkdtemp(prefix=".airshare-",
+                                              dir=os.path.dirname(sync_dir))
+        self._buffer = bytearray()
+        self._position = 0
+        self._index = None
+        self._files = {}
+        self._directories = []
+        self._pinned = []
+        self._apply = self._apply_stream()
+        self._size = next(self._apply)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _read_chunk(self, file_path, offset, length):
+        if file_path not in self._files:
+            self._files[file_path] = open(file_path, "rb")
+        f = self._files[file_path]
+        f.seek(offset)
+        return f.read(length)
+
+    def _get_chunk(self, digest, length, written):
+        if digest in written:
+            return self._read_chunk(*written[digest])
+        if self._index is None:
+            self._index = {} if self.source_dir is None \
+                else get_chunk_index(self.source_dir)
+        if digest in self._index:
+            return self._read_chunk(*self._index[digest])
+        chunk = None
+        if self.cache is not None:
+            chunk = self.cache.get(digest)
+        if chunk is None:
+            raise ValueError("Missing chunk " + digest)
+        return chunk
+
+    def _apply_stream(self):
+        size, = struct.unpack(">Q", (yield 8))
+        if size > _MAX_SYNC_MANIFEST:
+            raise ValueError("Sync manifest too large: " + str(size)
+                             + " bytes")
+        manifest = json.loads((yield size).decode("utf-8"))
+        pending = set(manifest["data"])
+        if self.cache is not None:
+            # Chunks of the stream would otherwise evict the chunks left out
+            # of it before they are read.
+            self._pinned = list({
+                digest for entry in manifest["files"]
+                for digest, _ in entry.get("chunks", ())
+                if digest not in pending})
+            self.cache.pin(self._pinned)
+        written = {}
+        for entry in manifest["files"]:
+            path = _get_extract_path(self._temp_dir, entry["path"])
+            if "chunks" not in entry:
+                os.makedirs(path, exist_ok=True)
+                self._directories.append((path, entry))
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            offset = 0
+            with open(path, "wb") as f:
+                for digest, length in entry["chunks"]:
+                    if not isinstance(length, int) \
+                            or not 0 < length <= _MAX_SYNC_CHUNK:
+                        raise ValueError("Bad chunk length " + str(length)
+                                         + " for file "
+                                         + repr(entry["path"]))
+                    if digest in pending:
+                        chunk = yield length
+                        actual = hashlib.blake2b(chunk, digest_size=16)
+                        if actual.hexdigest() != digest:
+                            raise ValueError("Bad chunk " + digest + " for "
+                                             + "file " + repr(entry["path"]))
+                        pending.discard(digest)
+                        if self.cache is not None:
+                            self.cache.put(digest, chunk)
+                    else:
+                        f.flush()
+                        chunk = self._get_chunk(digest, length, written)
+                    f.write(chunk)
+                    written.setdefault(digest, (path, offset, length))
+                    offset += length
+            os.chmod(path, entry["mode"] & 0o777)
+            os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+
+    def write(self, data):
+        self._buffer += data
+        with memoryview(self._buffer) as view:
+            while self._size is not None \
+                    and len(view) - self._position >= self._size:
+                chunk = bytes(view[self._position:
+                                   self._position + self._size])
+                self._position += self._size
+                try:
+                    self._size = self._apply.send(chunk)
+                except StopIteration:
+                    self._size = None
+        # What is left is shorter than the awaited item.
+        del self._buffer[:self._position]
+        self._position = 0
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        if self._pinned:
+            self.cache.unpin(self._pinned)
+            self._pinned = []
+        if self._size is not None:
+            self._apply.close()
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            raise ValueError("Sync stream ended unexpectedly")
+        while self._directories:
+            path, entry = self._directories.pop()
+            os.chmod(path, entry["mode"] & 0o777)
+            os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+        if self._temp_dir == self.sync_dir:
+            return
+        old_dir = None
+        if os.path.isdir(self.sync_dir):
+            old_dir = self._temp_dir + "-old"
+            os.rename(self.sync_dir, old_dir)
+        os.rename(self._temp_dir, self.sync_dir)
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def get_sync_writer(sync_file_path, cache=None, replace=False):
+    r"""Creates a file-like object applying a sync stream as it is written.
+
+    The files of the directory named after the sync stream (without its
+    '.sync' extension) provide the chunks left out of the stream. The
+    synced directory is created as by `unzip_file`, next to it, unless it
+    is to replace it.
+
+    Parameters
+    ----------
+    sync_file_path : str
+        Path the sync stream would have been written to.
+    cache : object or None
+        Chunk cache (see `get_chunk_cache`) to read the chunks left out of
+        the stream from, when the directory does not hold them, and to keep
+        the chunks of the stream in.
+    replace : boolean, default=False
+        Flag to replace the directory with the synced directory, deleting
+        its files that are not in the stream, like `rsync --delete`.
+
+    Returns
+    -------
+    writer : file-like
+        Unseekable file-like object to write the sync stream into, which
+        raises `ValueError` if the stream is invalid or refers to chunks
+        that are neither in it nor in the directory.
+    sync_dir : str
+        Canonical path of the synced directory.
+    """
+    source_dir = os.path.realpath(os.path.splitext(sync_file_path)[0])
+    if not os.path.isdir(source_dir):
+        source_dir = None
+    if replace and source_dir is not None:
+        sync_dir = source_dir
+    else:
+        sync_dir = _make_extract_dir(sync_file_path)
+    return _SyncStream(sync_dir, source_dir, cache), sync_dir
+
+
+# Compression Codecs
+
+
+def get_codecs():
+    r"""Lists the compression codecs available for transfers.
+
+    Returns
+    -------
+    codecs : list
+        Names of the available codecs, fastest to decode first. 'store' and
+        'deflate' are always available, 'lz4' and 'zstd' need the optional
+        `lz4` and `zstandard` packages.
+    """
+    codecs = ["store"]
+    if lz4 is not None:
+        codecs.append("lz4")
+    if zstandard is not None:
+        codecs.append("zstd")
+    codecs.append("deflate")
+    return codecs
+
+
+def _split_codec(codec):
+    r"""Splits a codec specification like 'zstd:9' into name and level."""
+    name, _, level = codec.partition(":")
+    return name.strip().lower(), int(level) if level else None
+
+
+def get_encoder(codec):
+    r"""Creates a streaming encoder for a compression codec.
+
+    Parameters
+    ----------
+    codec : str
+        Name of the codec, optionally followed by a level ('zstd:9').
+
+    Returns
+    -------
+    encode : callable
+        Function taking a chunk of bytes and an optional `final` flag, which
+        returns the next chunk of the encoded stream. It must be called with
+        `final=True` (and possibly no data) to end the stream.
+    """
+    name, level = _split_codec(codec)
+    if name not in get_codecs():
+        raise ValueError("Unavailable codec: " + codec)
+    if name == "store":
+        return lambda data, final=False: bytes(data)
+    prefix = b""
+    if name == "deflate":
+        level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    elif name == "zstd":
+        compressor = zstandard.ZstdCompressor(level=level or 3).compressobj()
+    else:
+        compressor = lz4.frame.LZ4FrameCompressor(
+            compression_level=level or 0)
+        prefix = compressor.begin()
+
+    def encode(data, final=False):
+        nonlocal prefix
+        chunk, prefix = prefix, b""
+        if data:
+            chunk += compressor.compress(data)
+        if final:
+            chunk += compressor.flush()
+        return chunk
+
+    return encode
+
+
+# Errors of the decompressors: lz4 raises RuntimeError.
+_DECODE_ERRORS = (zlib.error, RuntimeError, EOFError) \
+    + ((zstandard.ZstdError,) if zstandard is not None else ())
+# Size in bytes of the slices of a zstd stream decompressed at a time: a
+# byte of zstd decodes to at most 32 KiB, so that a slice decodes to at most
+# 8 MiB (and a block).
+_ZSTD_SLICE_SIZE = 256
+
+
+def _decompress_deflate(decompressor, data, chunk_size):
+    while not decompressor.eof:
+        chunk = decompressor.decompress(data, chunk_size)
+        data = decompressor.unconsumed_tail
+        if chunk:
+            yield chunk
+        if not data and len(chunk) < chunk_size:
+            return
+
+
+def _decompress_lz4(decompressor, data, chunk_size):
+    while not decompressor.eof:
+        chunk = decompressor.decompress(data, chunk_size)
+        data = b""
+        if chunk:
+            yield chunk
+        if decompressor.needs_input:
+            return
+
+
+def _decompress_zstd(decompressor, data, chunk_size):
+    chunks = []
+    size = 0
+    for start in range(0, len(data), _ZSTD_SLICE_SIZE):
+        chunk = decompressor.decompress(data[start:start + _ZSTD_SLICE_SIZE])
+        if chunk:
+            chunks.append(chunk)
+            size += len(chunk)
+        if size >= chunk_size:
+            yield b"".join(chunks)
+            chunks, size = [], 0
+    if chunks:
+        yield b"".join(chunks)
+
+
+def get_decoder(codec, max_size=None, chunk_size=1024 * 1024):
+    r"""Creates a streaming decoder for a compression codec.
+
+    Parameters
+    ----------
+    codec : str
+        Name of the codec.
+    max_size : int or None
+        Maximum size in bytes of the decoded stream, if it is known, beyond
+        which decoding fails instead of filling up the disk.
+    chunk_size : int, default=1048576
+        Approximate maximum size in bytes of the decoded chunks, so that a
+        small encoded chunk does not decode into memory all at once.
+
+    Returns
+    -------
+    decode : callable
+        Function taking a chunk of the encoded stream and an optional `final`
+        flag (for the last chunk, possibly empty), which yields the decoded
+        bytes in chunks. It raises `ValueError` if the stream is corrupt or
+        decodes to more than `max_size` bytes, and
+        `exception.IntegrityError` if the stream is cut short.
+    """
+    name, _ = _split_codec(codec)
+    if name not in get_codecs():
+        raise ValueError("Unavailable codec: " + codec)
+    if name == "deflate":
+        decompressor = zlib.decompressobj(-15)
+        decompress = _decompress_deflate
+    elif name == "zstd":
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        decompress = _decompress_zstd
+    elif name == "lz4":
+        decompressor = lz4.frame.LZ4FrameDecompressor()
+        decompress = _decompress_lz4
+    size = 0
+
+    def check(chunk):
+        nonlocal size
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise ValueError("The " + name + " stream decodes to more than "
+                             + str(max_size) + " bytes")
+        return chunk
+
+    def decode(data, final=False):
+        if name == "store":
+            if data:
+                yield check(bytes(data))
+            return
+        try:
+            if decompressor.eof and data:
+                raise ValueError("Corrupt " + name + " stream: data after"
+                                 + " its end")
+            for chunk in decompress(decompressor, data, chunk_size):
+                yield check(chunk)
+            if decompressor.unused_data:
+                raise ValueError("Corrupt " + name + " stream: data after"
+                                 + " its end")
+            if not final:
+                return
+            if name == "deflate":
+                yield check(decompressor.flush())
+            if not decompressor.eof:
+                raise IntegrityError(name + " stream")
+        except _DECODE_ERRORS as e:
+            raise ValueError("Corrupt " + name + " stream: " + str(e)) from e
+
+    return decode
+
+
+def get_compress_header(archive, codec="store"):
+    r"""Builds the value of the 'airshare-compress' header.
+
+    Parameters
+    ----------
+    archive : boolean or str
+        Flag denoting that the content is a Zip Archive to be decompressed,
+        or the format of the archive, 'zip', 'tar' or 'sync' (a sync
+        stream).
+    codec : str, default="store"
+        Codec the content is encoded with during transfer.
+
+    Returns
+    -------
+    header : str
+        'true' or 'false', followed by '; format=<name>' for Tar Archives and
+        sync streams and '; codec=<name>' for encoded content.
+    """
+    header = "true" if archive else "false"
+    if archive in ("tar", "sync"):
+        header += "; format=" + archive
+    name, _ = _split_codec(codec)
+    if name != "store":
+        header += "; codec=" + name
+    return header
+
+
+def parse_compress_header(header):
+    r"""Parses the value of an 'airshare-compress' header.
+
+    Parameters
+    ----------
+    header : str or None
+        Value of the 'airshare-compress' header.
+
+    Returns
+    -------
+    archive : str or boolean
+        Format of the archive to be decompressed, 'zip', 'tar' or 'sync', or
+        False if the content is not an archive.
+    codec : str
+        Codec the content is encoded with during transfer.
+    """
+    archive, codec = False, "store"
+    for index, part in enumerate((header or "false").split(";")):
+        key, _, value = part.strip().partition("=")
+        if index == 0:
+            archive = "zip" if key.lower() == "true" else False
+        elif key.lower() == "format" and archive:
+            archive = value.strip().lower()
+        elif key.lower() == "codec":
+            codec = value.strip().lower()
+    return archive, codec
+
+
+def get_compression_sample(files, size=4 * 1024 * 1024):
+    r"""Reads a sample of the contents of files to judge compressibility.
+
+    Parameters
+    ----------
+    files : list
+        List of paths of files and directories to be sent.
+    size : int, default=4194304
+        Maximum size of the sample in bytes.
+
+    Returns
+    -------
+    sample : bytes
+        Slices from the start, middle and end of the first files walked.
+    """
+    sample = []
+    remaining = size
+    for file_path, _ in _get_zip_members(files):
+        file_size = os.path.getsize(file_path)
+        if file_size == 0:
+            continue
+        piece = max(remaining // 6, 4096)
+        with open(file_path, "rb") as f:
+            for offset in (0, file_size // 2, max(file_size - piece, 0)):
+                f.seek(offset)
+                data = f.read(min(piece, remaining))
+                sample.append(data)
+                remaining -= len(data)
+                if file_size <= piece or remaining <= 0:
+                    break
+        if remaining <= 0:
+            break
+    return b"".join(sample)
+
+
+def get_codec_profile(sample):
+    r"""Measures how fast and how well every candidate codec compresses a
+    sample of content.
+
+    Parameters
+    ----------
+    sample : bytes
+        Sample of the content to be transferred.
+
+    Returns
+    -------
+    profile : dict
+        The `(rate, ratio)` of every available candidate codec, by codec: the
+        rate in bytes of the sample compressed per second, and the size of
+        the compressed sample relative to the sample.
+    """
+    candidates = ["lz4", "zstd:1", "zstd:3", "zstd:9", "deflate:1",
+                  "deflate:6"]
+    profile = {}
+    if not sample:
+        return profile
+    for codec in candidates:
+        if _split_codec(codec)[0] not in get_codecs():
+            continue
+        encode = get_encoder(codec)
+        start = monotonic()
+        size = len(encode(sample, final=True))
+        rate = len(sample) / max(monotonic() - start, 1e-6)
+        profile[codec] = (rate, max(size, 1) / len(sample))
+    return profile
+
+
+def select_codec(sample, link_speed=None, codecs=None, profile=None):
+    r"""Selects the codec that transfers content the fastest.
+
+    Every candidate compresses the sample once, unless the sample has been
+    profiled already. The transfer rate it would reach is limited both by
+    how fast it compresses and by how fast its compressed output crosses the
+    link, and the fastest candidate wins.
+
+    Parameters
+    ----------
+    sample : bytes or None
+        Sample of the content to be transferred. Not needed with `profile`.
+    link_speed : float or None
+        Measured speed of the link in bytes per second, assumed to be 100
+        Mbit/s (12.5 MB/s) if not given.
+    codecs : list or None
+        Codecs supported by the other end, defaults to all available ones.
+    profile : dict or None
+        Profile of the sample, as returned by `get_codec_profile`, to select
+        a codec without compressing the sample again.
+
+    Returns
+    -------
+    codec : str
+        The selected codec, with a level for 'zstd' and 'deflate'.
+    """
+    if profile is None:
+        profile = get_codec_profile(sample)
+    codecs = [x for x in (codecs or get_codecs()) if x in get_codecs()]
+    link_speed = float(link_speed or 12.5 * 1000 * 1000)
+    best, best_rate = "store", link_speed
+    for codec, (rate, ratio) in profile.items():
+        if _split_codec(codec)[0] not in codecs:
+            continue
+        rate = min(rate, link_speed / ratio)
+        if rate > best_rate * 1.05:
+            best, best_rate = codec, rate
+    return best
+
+
+# Integrity Hashes
+
+
+@lru_cache(maxsize=None)
+def _get_hashlib_algorithms(size=1024 * 1024):
+    r"""Orders 'blake2b' and 'sha256' by their speed on this machine, which
+    depends on hardware support for SHA-256."""
+    data = bytes(size)
+    seconds = {}
+    for name in ("blake2b", "sha256"):
+        start = monotonic()
+        hashlib.new(name, data).hexdigest()
+        seconds[name] = monotonic() - start
+    return tuple(sorted(seconds, key=seconds.get))
+
+
+def get_hash_algorithms(fast=False):
+    r"""Lists the hash algorithms available to verify transfers with.
+
+    Parameters
+    ----------
+    fast : boolean, default=False
+        Flag to list only the algorithms that hash faster than transfers
+        run, 'xxh3_128' and 'blake3'.
+
+    Returns
+    -------
+    algorithms : list
+        Names of the available algorithms, fastest first. 'blake2b' and
+        'sha256' are always available (ordered by their speed, measured
+        once), 'xxh3_128' and 'blake3' need the optional `xxhash` and
+        `blake3` packages.
+    """
+    algorithms = []
+    if xxhash is not None:
+        algorithms.append("xxh3_128")
+    if blake3 is not None:
+        algorithms.append("blake3")
+    if not fast:
+        algorithms.extend(_get_hashlib_algorithms())
+    return algorithms
+
+
+def get_hasher(algorithm):
+    r"""Creates a streaming hasher for a hash algorithm.
+
+    Parameters
+    ----------
+    algorithm : str
+        Name of the algorithm.
+
+    Returns
+    -------
+    hasher : object
+        Hash object with the `update(data)` and `hexdigest()` methods of
+        `hashlib` hashes.
+    """
+    name = algorithm.strip().lower()
+    if name not in get_hash_algorithms():
+        raise ValueError("Unavailable hash algorithm: " + algorithm)
+    if name == "blake3":
+        return blake3.blake3()
+    if name == "xxh3_128":
+        return xxhash.xxh3_128()
+    return hashlib.new(name)
+
+
+def select_hash_algorithm(accepted, algorithm=None, fast=False):
+    r"""Selects the algorithm to hash a transfer with.
+
+    Parameters
+    ----------
+    accepted : list
+        Names of the algorithms accepted by the peer.
+    algorithm : str or None
+        Preferred algorithm, used if the peer accepts it.
+    fast : boolean, default=False
+        Flag to select only the fast algorithms, see `get_hash_algorithms`.
+
+    Returns
+    -------
+    algorithm : str or None
+        The preferred algorithm, or else the fastest available algorithm that
+        the peer accepts. None if the peer accepts none of them.
+    """
+    accepted = [x.strip().lower() for x in accepted]
+    available = [x for x in get_hash_algorithms(fast) if x in accepted]
+    if algorithm is not None and algorithm.strip().lower() in available:
+        return algorithm.strip().lower()
+    return available[0] if available else None
+
+
 # Clipboard Utilities
 
 
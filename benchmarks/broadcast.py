@@ -0,0 +1,144 @@
+"""Benchmark of the broadcast mode of `sender.send_server`.
+
+A file is served with and without `broadcast`, and downloaded over loopback
+by a growing number of concurrent receivers. The wall time of the
+downloads, the bytes the server read, and the CPU time it used, are
+reported for each run. The bytes read and CPU time are taken from '/proc',
+so they are only reported on Linux.
+
+Usage:
+    python benchmarks/broadcast.py [--size MIB] [--hash ALGORITHM]
+        [--receivers N [N ...]] [--drop-caches]
+"""
+
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from time import monotonic, sleep
+
+import aiohttp
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from airshare.sender import send_server_proc  # noqa: E402
+
+
+def _get_process_stats(pid):
+    r"""Returns the bytes read by a process and its CPU time, or None."""
+    try:
+        with open("/proc/" + str(pid) + "/io", "r") as f:
+            io = dict(x.split(": ") for x in f.read().splitlines())
+        with open("/proc/" + str(pid) + "/stat", "r") as f:
+            fields = f.read().rpartition(")")[2].split()
+    except OSError:
+        return None
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return int(io["rchar"]), cpu
+
+
+def _wait_for_server(url, timeout=60):
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        try:
+            if requests.get(url + "/airshare").status_code == 200:
+                return
+        except requests.exceptions.ConnectionError:
+            pass
+        sleep(0.1)
+    raise TimeoutError("The server did not start at " + url)
+
+
+async def _download(session, url, headers):
+    size = 0
+    async with session.get(url + "/download", headers=headers) as r:
+        r.raise_for_status()
+        async for chunk in r.content.iter_chunked(1024 * 1024):
+            size += len(chunk)
+    return size
+
+
+async def _download_all(url, receivers, headers):
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(connector=connector,
+                                     timeout=timeout) as session:
+        return await asyncio.gather(*[_download(session, url, headers)
+                                      for _ in range(receivers)])
+
+
+def run(file_path, port, receivers, broadcast, headers, drop_caches=False):
+    r"""Serves a file and downloads it with concurrent receivers.
+
+    Returns
+    -------
+    wall : float
+        Time in seconds until all of the receivers had the file.
+    read : int or None
+        Bytes read by the server during the downloads.
+    cpu : float or None
+        CPU time in seconds of the server during the downloads.
+    """
+    process = send_server_proc(code="airshare-bench-" + str(port),
+                               file=file_path, port=port,
+                               broadcast=broadcast)
+    process.start()
+    try:
+        url = "http://127.0.0.1:" + str(port)
+        _wait_for_server(url)
+        if drop_caches:
+            os.sync()
+            with open("/proc/sys/vm/drop_caches", "w") as f:
+                f.write("3")
+        before = _get_process_stats(process.pid)
+        start = monotonic()
+        sizes = asyncio.run(_download_all(url, receivers, headers))
+        wall = monotonic() - start
+        after = _get_process_stats(process.pid)
+    finally:
+        process.terminate()
+        process.join()
+    if set(sizes) != {os.path.getsize(file_path)}:
+        raise ValueError("Incomplete downloads: " + str(set(sizes)))
+    if before is None or after is None:
+        return wall, None, None
+    return wall, after[0] - before[0], after[1] - before[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size", type=int, default=128,
+                        help="size in MiB of the shared file")
+    parser.add_argument("--hash", default=None,
+                        help="hash algorithm the receivers verify with")
+    parser.add_argument("--receivers", type=int, nargs="+",
+                        default=[1, 4, 16, 64])
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--drop-caches", action="store_true",
+                        help="drop the page cache before every run (root)")
+    args = parser.parse_args()
+    headers = {}
+    if args.hash is not None:
+        headers["airshare-hash"] = args.hash
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "broadcast.bin")
+        with open(file_path, "wb") as f:
+            for _ in range(args.size):
+                f.write(os.urandom(1024 * 1024))
+        print("receivers  mode        wall       read   server CPU")
+        for receivers in args.receivers:
+            for broadcast in (False, True):
+                wall, read, cpu = run(file_path, args.port, receivers,
+                                      broadcast, headers, args.drop_caches)
+                read = "-" if read is None else "%d MB" % (read / 1e6)
+                cpu = "-" if cpu is None else "%.2f s" % cpu
+                print("%9d  %-9s %7.2f s %10s %12s" % (
+                    receivers, "broadcast" if broadcast else "default",
+                    wall, read, cpu))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Benchmark of concurrent uploads to `receiver.receive_server`.
+
+A receiving server is started in a temporary directory, and a growing
+number of uploaders send it generated files at the same time over loopback.
+The aggregate throughput of the uploads is reported for each run. Meanwhile
+'/airshare' is requested every 50 ms, and its latency is reported, which
+shows whether disk writes hold up the event loop.
+
+Usage:
+    python benchmarks/concurrent_uploads.py [--size MIB]
+        [--uploaders N [N ...]]
+"""
+
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from time import monotonic, sleep
+
+import aiohttp
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from airshare.receiver import receive_server_proc  # noqa: E402
+
+
+def _wait_for_server(url, timeout=60):
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        try:
+            if requests.get(url + "/airshare").status_code == 200:
+                return
+        except requests.exceptions.ConnectionError:
+            pass
+        sleep(0.1)
+    raise TimeoutError("The server did not start at " + url)
+
+
+async def _upload(session, url, index, size, block):
+    async def read():
+        for _ in range(size // len(block)):
+            yield block
+
+    writer = aiohttp.MultipartWriter("form-data")
+    writer.append(read(), {"content-disposition": "form-data; name=\"f\"; "
+                           + "filename=\"upload-{}.bin\"".format(index)})
+    async with session.post(url + "/upload", data=writer) as r:
+        await r.read()
+        return r.status
+
+
+async def _probe(session, url, stop, latencies):
+    while not stop.is_set():
+        start = monotonic()
+        async with session.get(url + "/airshare") as r:
+            await r.read()
+        latencies.append(monotonic() - start)
+        await asyncio.sleep(0.05)
+
+
+async def _upload_all(url, uploaders, size):
+    block = os.urandom(1024 * 1024)
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        stop, latencies = asyncio.Event(), []
+        probe = asyncio.ensure_future(_probe(session, url, stop, latencies))
+        start = monotonic()
+        statuses = await asyncio.gather(*[
+            _upload(session, url, i, size, block) for i in range(uploaders)])
+        wall = monotonic() - start
+        stop.set()
+        await probe
+    return wall, statuses, sorted(latencies)
+
+
+def run(port, uploaders, size):
+    r"""Uploads `uploaders` files of `size` bytes at the same time.
+
+    Returns
+    -------
+    throughput : float
+        Aggregate throughput of the uploads in bytes per second.
+    latencies : list
+        Sorted latencies in seconds of the requests to '/airshare'.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        process = receive_server_proc(code="airshare-bench-" + str(port),
+                                      port=port, max_uploads=None,
+                                      max_client_uploads=None,
+                                      directory=directory)
+        process.start()
+        try:
+            url = "http://127.0.0.1:" + str(port)
+            _wait_for_server(url)
+            wall, statuses, latencies = asyncio.run(
+                _upload_all(url, uploaders, size))
+        finally:
+            process.terminate()
+            process.join()
+    if set(statuses) != {200}:
+        raise ValueError("Failed uploads: " + str(set(statuses)))
+    return uploaders * size / wall, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size", type=int, default=64,
+                        help="size in MiB of every upload")
+    parser.add_argument("--uploaders", type=int, nargs="+",
+                        default=[1, 8, 16])
+    parser.add_argument("--port", type=int, default=8091)
+    args = parser.parse_args()
+    # The progress bars of the server are left to finish before the table.
+    results = [(x,) + run(args.port, x, args.size * 1024 * 1024)
+               for x in args.uploaders]
+    print("uploaders   aggregate   probe p50   probe max")
+    for uploaders, throughput, latencies in results:
+        p50 = latencies[len(latencies) // 2] if latencies else 0
+        p100 = latencies[-1] if latencies else 0
+        print("%9d %8.0f MB/s %8.0f ms %8.0f ms" % (
+            uploaders, throughput / 1e6, p50 * 1e3, p100 * 1e3))
+
+
+if __name__ == "__main__":
+    main()
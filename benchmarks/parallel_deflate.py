@@ -0,0 +1,90 @@
+"""Benchmark of the parallel deflate of `utils.get_zip_file`.
+
+A directory is zipped with deflate by `ZipFile.write`, one file after
+another, and by `get_zip_file(compress=True)`, which deflates files in a
+pool of worker processes and stores already-compressed formats as they
+are. The time, files/s and MB/s of both, and the size of their archives,
+are reported. Without a directory, a tree of text files and of random
+'.jpg' files is generated.
+
+Usage:
+    python benchmarks/parallel_deflate.py [DIRECTORY] [--files N]
+"""
+
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+from time import monotonic
+from zipfile import ZIP_DEFLATED, ZipFile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from airshare.utils import get_file_members, get_zip_file  # noqa: E402
+
+
+def _make_tree(directory, files):
+    r"""Generates a tree of text files, one in 250 of them a random '.jpg'
+    file, from the sources of this package."""
+    package = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), "airshare")
+    sources = []
+    for name in sorted(os.listdir(package)):
+        if name.endswith(".py"):
+            with open(os.path.join(package, name), "rb") as f:
+                sources.append(f.read())
+    rng = random.Random(0)
+    for i in range(files):
+        sub_dir = os.path.join(directory, "dir-" + str(i // 100))
+        os.makedirs(sub_dir, exist_ok=True)
+        if i % 250 == 0:
+            with open(os.path.join(sub_dir, str(i) + ".jpg"), "wb") as f:
+                f.write(os.urandom(1024 * 1024))
+            continue
+        with open(os.path.join(sub_dir, str(i) + ".txt"), "wb") as f:
+            f.write(rng.choice(sources) * rng.randint(1, 4))
+
+
+def _zip_sequentially(files, zip_file_path):
+    with ZipFile(zip_file_path, "w", ZIP_DEFLATED) as zip_file:
+        for file_path, arcname in get_file_members(files):
+            zip_file.write(file_path, arcname)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("directory", nargs="?", default=None,
+                        help="directory to zip")
+    parser.add_argument("--files", type=int, default=2000,
+                        help="number of files of the generated tree")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        directory = args.directory
+        if directory is None:
+            directory = os.path.join(temp_dir, "tree")
+            _make_tree(directory, args.files)
+        members = [x for x, _ in get_file_members([directory])]
+        size = sum(os.path.getsize(x) for x in members)
+        print("{} files, {:.0f} MB, {} CPU(s)".format(
+            len(members), size / 1e6, os.cpu_count()))
+        start = monotonic()
+        zip_file_path = os.path.join(temp_dir, "sequential.zip")
+        _zip_sequentially([directory], zip_file_path)
+        results = [("ZipFile.write(ZIP_DEFLATED)", monotonic() - start,
+                    os.path.getsize(zip_file_path))]
+        os.remove(zip_file_path)
+        start = monotonic()
+        zip_file_path, _ = get_zip_file([directory], compress=True)
+        results.append(("get_zip_file(compress=True)", monotonic() - start,
+                        os.path.getsize(zip_file_path)))
+        os.remove(zip_file_path)
+    for name, wall, zip_size in results:
+        print("{:<28} {:6.2f} s {:6.0f} files/s {:6.1f} MB/s {:6.0f} MB"
+              .format(name, wall, len(members) / wall, size / wall / 1e6,
+                      zip_size / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Benchmark of the worker processes of `sender.send_server`.
+
+A generated file is served by 1, 2 and 4 worker processes in turn, and
+loaded over loopback for a few seconds at a time by client processes:
+- '/airshare' requests over keep-alive connections, in requests/s;
+- '/airshare' requests on a new connection each, in requests/s;
+- downloads of the file hashed with sha256, in MB/s.
+Load generators on the same machine take CPU time away from the workers,
+so scaling only shows with more cores than workers and clients.
+
+Usage:
+    python benchmarks/workers.py [--workers N [N ...]] [--clients N]
+        [--duration SECONDS] [--size MIB]
+"""
+
+
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import os
+import signal
+import sys
+import tempfile
+from time import monotonic, sleep
+
+import aiohttp
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from airshare.sender import send_server_proc  # noqa: E402
+
+
+# Loads: name, path, concurrency, new connection per request, headers.
+_LOADS = [
+    ("/airshare keep-alive", "/airshare", 64, False, {}),
+    ("/airshare new conns", "/airshare", 64, True, {}),
+    ("hashed downloads", "/download", 16, False, {"airshare-hash": "sha256"}),
+]
+
+
+def _wait_for_server(url, timeout=60):
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        try:
+            if requests.get(url + "/airshare").status_code == 200:
+                return
+        except requests.exceptions.ConnectionError:
+            pass
+        sleep(0.1)
+    raise TimeoutError("The server did not start at " + url)
+
+
+async def _load(url, concurrency, force_close, headers, duration):
+    counts = [0, 0]
+    stop = monotonic() + duration
+
+    async def request(session):
+        while monotonic() < stop:
+            async with session.get(url, headers=headers) as r:
+                async for chunk in r.content.iter_chunked(1024 * 1024):
+                    counts[1] += len(chunk)
+            counts[0] += 1
+
+    connector = aiohttp.TCPConnector(limit=0, force_close=force_close)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*[request(session) for _ in range(concurrency)])
+    return counts
+
+
+def _run_client(args):
+    return asyncio.run(_load(*args))
+
+
+def run(file_path, port, workers, clients, duration):
+    r"""Serves a file with `workers` processes and loads it.
+
+    Returns
+    -------
+    results : list
+        Requests and bytes per second of every load of `_LOADS`.
+    """
+    process = send_server_proc(code="airshare-bench-" + str(port),
+                               file=file_path, port=port, workers=workers)
+    process.start()
+    results = []
+    try:
+        url = "http://127.0.0.1:" + str(port)
+        _wait_for_server(url)
+        with ProcessPoolExecutor(clients) as executor:
+            for _, path, concurrency, force_close, headers in _LOADS:
+                args = (url + path, max(1, concurrency // clients),
+                        force_close, headers, duration)
+                start = monotonic()
+                counts = list(executor.map(_run_client, [args] * clients))
+                wall = monotonic() - start
+                results.append((sum(x[0] for x in counts) / wall,
+                                sum(x[1] for x in counts) / wall))
+    finally:
+        # An interrupted server stops its workers before it exits.
+        os.kill(process.pid, signal.SIGINT)
+        process.join(10)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=1,
+                        help="number of load generating processes")
+    parser.add_argument("--duration", type=float, default=5,
+                        help="duration in seconds of every load")
+    parser.add_argument("--size", type=int, default=16,
+                        help="size in MiB of the downloaded file")
+    parser.add_argument("--port", type=int, default=8092)
+    args = parser.parse_args()
+    print("{} CPU(s), {} client process(es)".format(
+        os.cpu_count(), args.clients))
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "workers.bin")
+        with open(file_path, "wb") as f:
+            for _ in range(args.size):
+                f.write(os.urandom(1024 * 1024))
+        results = [(x, run(file_path, args.port, x, args.clients,
+                           args.duration)) for x in args.workers]
+    print("workers  " + "  ".join("{:>20}".format(x[0]) for x in _LOADS))
+    for workers, loads in results:
+        cells = ["{:>14.0f} req/s".format(x[0]) for x in loads[:2]]
+        cells.append("{:>15.0f} MB/s".format(loads[2][1] / 1e6))
+        print("{:>7}  ".format(workers) + "  ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
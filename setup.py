@@ -35,12 +35,18 @@ setuptools.setup(
         "click >= 7.0",
         "colorama >= 0.4.3",
         "humanize >= 0.5.1",
+        "ifaddr >= 0.1.6",
         "pyperclip >= 1.8.0",
         "requests >= 2.20.0",
-        "requests-toolbelt >= 0.9.1",
         "termcolor >= 1.1.0",
         "tqdm >= 4.36.1",
-        "zeroconf >= 0.25.0",
+        "zeroconf >= 0.28.0",
     ],
+    extras_require={
+        "lz4": ["lz4 >= 3.0.0"],
+        "zstd": ["zstandard >= 0.13.0"],
+        "blake3": ["blake3 >= 0.1.0"],
+        "xxhash": ["xxhash >= 2.0.0"],
+    },
     python_requires=">=3.6",
 )